@@ -0,0 +1,121 @@
+"""Per-command latency of spawning the driver CLI versus its `serve` mode.
+
+Run from the repository root against the installed driver:
+
+    python3 benchmarks/driver_latency.py --iterations 30
+
+The command defaults to a read-only query so the keyboard state is not
+changed. Pass `--tool` to benchmark another driver executable.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shlex
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "source"))
+
+from xmg_backlight import driver  # noqa: E402
+
+
+def summarize(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def time_spawned(tool: str, args: list[str], iterations: int) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        rc, _, err = driver._run_unlocked(tool, args, timeout=driver.COMMAND_TIMEOUT_SECONDS)
+        samples.append(time.perf_counter() - started)
+        if rc != 0:
+            raise SystemExit(f"spawned command failed ({rc}): {err}")
+    return samples
+
+
+def wait_for_socket(path: str, server: subprocess.Popen, timeout: float = 10.0) -> None:
+    # the path exists as soon as the server binds; wait until it accepts
+    deadline = time.monotonic() + timeout
+    while True:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+                return
+            except OSError:
+                pass
+        if server.poll() is not None:
+            raise SystemExit(f"server exited early: {server.stdout.read()}")
+        if time.monotonic() >= deadline:
+            raise SystemExit("server did not start listening in time")
+        time.sleep(0.02)
+
+
+def time_served(tool: str, args: list[str], iterations: int) -> list[float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "driver.sock")
+        server = subprocess.Popen(
+            [tool, "serve", "--socket", path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        try:
+            wait_for_socket(path, server)
+            samples = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                rc, _, err = driver._request_server(
+                    args, timeout=driver.COMMAND_TIMEOUT_SECONDS, path=path
+                )
+                samples.append(time.perf_counter() - started)
+                if rc != 0:
+                    raise SystemExit(f"served command failed ({rc}): {err}")
+            return samples
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tool", default=driver.resolve_tool(), help="driver executable")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--command", default="query --brightness --state")
+    options = parser.parse_args(argv)
+    if not options.tool:
+        parser.error(f"driver executable not found at {driver.tool_hint()}; pass --tool")
+    args = shlex.split(options.command)
+    rows = (
+        ("spawn per command", summarize(time_spawned(options.tool, args, options.iterations))),
+        ("serve", summarize(time_served(options.tool, args, options.iterations))),
+    )
+    print(f"{options.command!r} x {options.iterations}")
+    print(f"{'transport':<18} {'mean':>9} {'p50':>9} {'p95':>9} {'max':>9}")
+    for name, stats in rows:
+        print(
+            f"{name:<18} "
+            + " ".join(f"{stats[key]:>7.2f}ms" for key in ("mean_ms", "p50_ms", "p95_ms", "max_ms"))
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
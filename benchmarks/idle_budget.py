@@ -0,0 +1,312 @@
+"""Idle cost of the resident processes against fixed budgets.
+
+Starts the GUI (offscreen Qt platform, `start_in_tray`) and the automation
+daemon with a scratch home directory and a private `dbus-daemon` standing in
+for both the session and the system bus, lets them settle, and samples
+`/proc/<pid>/stat` and `/proc/<pid>/task/*/schedstat` over a fixed window.
+Both run against the driver emulator from `driver/src`, so the GUI starts its
+warm `serve --stdio` worker; a process is charged for its child processes.
+Run from the repository root:
+
+    python3 benchmarks/idle_budget.py --window 30
+    python3 benchmarks/idle_budget.py --only automation_daemon --output idle.json
+
+Exits with status 1 when a process exceeds a budget or dies, and with status
+2 when PySide6 or dbus-daemon is not available.
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SOURCE = ROOT / "source"
+DRIVER_SOURCE = ROOT / "driver" / "src"
+PYUSB_WHEEL = next((ROOT / "vendor").glob("pyusb-*.whl"))
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+# Per second of the window, except rss_mb. A wakeup is one time a thread of
+# the process was scheduled onto a CPU.
+BUDGETS = {
+    "app": {"wakeups_per_s": 2.0, "cpu_ms_per_s": 5.0, "rss_mb": 300.0},
+    "automation_daemon": {"wakeups_per_s": 1.0, "cpu_ms_per_s": 2.0, "rss_mb": 150.0},
+}
+MODULES = {
+    "app": "xmg_backlight.app",
+    "automation_daemon": "xmg_backlight.automation_daemon",
+}
+# Runs a module with the emulated driver in place of the installed one.
+LAUNCHER = (
+    "import runpy, sys\n"
+    "from xmg_backlight import driver\n"
+    "driver.resolve_tool = lambda: sys.argv[1]\n"
+    "runpy.run_module(sys.argv[2], run_name='__main__', alter_sys=True)\n"
+)
+DRIVER_TOOL = """#!{python}
+import sys
+sys.path[:0] = {paths!r}
+from ite8291r3_ctl.__main__ import main
+sys.exit(main())
+"""
+IDLE_SETTINGS = {
+    "start_in_tray": True,
+    "resume_enabled": True,
+    "power_monitor_enabled": True,
+}
+
+
+@dataclass(frozen=True)
+class ProcessSample:
+    taken: float
+    cpu_seconds: float
+    wakeups: int
+    rss_bytes: int
+    processes: int = 1
+    # wakeups per (pid, tid); threads that exit take their count with them
+    task_wakeups: dict = field(default_factory=dict)
+
+
+def _stat_fields(pid: int) -> list[str]:
+    with open(f"/proc/{pid}/stat", encoding="ascii") as handle:
+        # the command name may contain spaces; fields resume after its ")"
+        return handle.read().rsplit(")", 1)[1].split()
+
+
+def descendants(pid: int) -> list[int]:
+    """Child processes of `pid` and theirs, such as the GUI's driver worker."""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                parents[int(entry)] = int(_stat_fields(int(entry))[1])
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+    found = []
+    pending = [pid]
+    while pending:
+        parent = pending.pop()
+        children = [child for child, ppid in parents.items() if ppid == parent]
+        found.extend(children)
+        pending.extend(children)
+    return found
+
+
+def sample(pid: int) -> ProcessSample:
+    """CPU time, wakeups and RSS of `pid` together with its descendants."""
+    cpu_ticks = rss_pages = processes = 0
+    task_wakeups = {}
+    for member in (pid, *descendants(pid)):
+        try:
+            fields = _stat_fields(member)
+            tasks = os.listdir(f"/proc/{member}/task")
+        except (FileNotFoundError, ProcessLookupError):
+            if member == pid:
+                raise
+            continue  # the child exited meanwhile
+        processes += 1
+        cpu_ticks += int(fields[11]) + int(fields[12])
+        rss_pages += int(fields[21])
+        for task in tasks:
+            try:
+                with open(f"/proc/{member}/task/{task}/schedstat", encoding="ascii") as handle:
+                    task_wakeups[member, int(task)] = int(handle.read().split()[2])
+            except (FileNotFoundError, ProcessLookupError):
+                continue  # the thread exited meanwhile
+    return ProcessSample(
+        taken=time.monotonic(),
+        cpu_seconds=cpu_ticks / CLOCK_TICKS,
+        wakeups=sum(task_wakeups.values()),
+        rss_bytes=rss_pages * PAGE_SIZE,
+        processes=processes,
+        task_wakeups=task_wakeups,
+    )
+
+
+def idle_cost(before: ProcessSample, after: ProcessSample) -> dict:
+    elapsed = after.taken - before.taken
+    wakeups = after.wakeups - before.wakeups
+    if after.task_wakeups:
+        # per thread, so a pool thread that retires does not subtract its past
+        wakeups = sum(
+            count - before.task_wakeups.get(task, 0)
+            for task, count in after.task_wakeups.items()
+        )
+    return {
+        "window_s": elapsed,
+        "wakeups_per_s": wakeups / elapsed,
+        "cpu_ms_per_s": (after.cpu_seconds - before.cpu_seconds) * 1000 / elapsed,
+        "rss_mb": after.rss_bytes / (1 << 20),
+        "processes": after.processes,
+    }
+
+
+def over_budget(name: str, cost: dict, budget: dict) -> list[str]:
+    return [
+        f"{name}: {metric} {cost[metric]:.2f} > {limit:.2f}"
+        for metric, limit in budget.items()
+        if cost[metric] > limit
+    ]
+
+
+@contextmanager
+def bus_stand_in():
+    """A private message bus, used as both the session and the system bus."""
+    bus = subprocess.Popen(
+        ["dbus-daemon", "--session", "--nofork", "--print-address"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        address = bus.stdout.readline().strip()
+        if not address:
+            raise RuntimeError("dbus-daemon did not print its address")
+        yield address
+    finally:
+        bus.terminate()
+        bus.wait(timeout=5)
+
+
+def child_environment(home: str, bus_address: str) -> dict:
+    return {
+        **os.environ,
+        "HOME": home,
+        "PYTHONPATH": str(SOURCE),
+        "QT_QPA_PLATFORM": "offscreen",
+        "DBUS_SESSION_BUS_ADDRESS": bus_address,
+        "DBUS_SYSTEM_BUS_ADDRESS": bus_address,
+        # keeps `systemctl --user` away from the real user manager
+        "XDG_RUNTIME_DIR": home,
+        "ITE8291R3_EMULATOR": "1",
+        "ITE8291R3_EMULATOR_STATE": str(Path(home) / "controller.json"),
+    }
+
+
+def write_driver_tool(home: str) -> str:
+    tool = Path(home) / "ite8291r3-ctl"
+    tool.write_text(
+        DRIVER_TOOL.format(
+            python=sys.executable,
+            paths=[str(DRIVER_SOURCE), str(PYUSB_WHEEL)],
+        ),
+        encoding="utf-8",
+    )
+    tool.chmod(0o700)
+    return str(tool)
+
+
+def write_idle_settings(env: dict) -> None:
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, json\n"
+            "from xmg_backlight.storage import write_settings_file\n"
+            "write_settings_file(json.loads(sys.argv[1]))",
+            json.dumps(IDLE_SETTINGS),
+        ],
+        env=env,
+        check=True,
+    )
+
+
+def measure_idle(names, *, settle: float, window: float) -> tuple[dict, list[str]]:
+    results = {}
+    failures = []
+    with tempfile.TemporaryDirectory() as home, ExitStack() as stack:
+        env = child_environment(home, stack.enter_context(bus_stand_in()))
+        write_idle_settings(env)
+        tool = write_driver_tool(home)
+        processes = {}
+        for name in names:
+            log = stack.enter_context(open(Path(home) / f"{name}.log", "w+"))
+            processes[name] = subprocess.Popen(
+                [sys.executable, "-c", LAUNCHER, tool, MODULES[name]],
+                env=env,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+            stack.callback(stop, processes[name])
+        time.sleep(settle)
+        before = {}
+        for name, process in processes.items():
+            if process.poll() is None:
+                before[name] = sample(process.pid)
+        time.sleep(window)
+        for name, process in processes.items():
+            if name not in before or process.poll() is not None:
+                log = Path(home) / f"{name}.log"
+                output = log.read_text(encoding="utf-8", errors="replace").strip()
+                failures.append(f"{name}: exited with status {process.poll()}: {output}")
+                continue
+            results[name] = idle_cost(before[name], sample(process.pid))
+            failures.extend(over_budget(name, results[name], BUDGETS[name]))
+    return results, failures
+
+
+def stop(process: subprocess.Popen) -> None:
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--window", type=float, default=30.0, metavar="SECONDS")
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=5.0,
+        metavar="SECONDS",
+        help="time to let start-up work finish before sampling",
+    )
+    parser.add_argument("--only", choices=sorted(MODULES), help="measure one process")
+    parser.add_argument("--output", help="write results to this JSON file")
+    options = parser.parse_args(argv)
+
+    missing = [
+        name
+        for name, present in (
+            ("PySide6", importlib.util.find_spec("PySide6") is not None),
+            ("dbus-daemon", shutil.which("dbus-daemon") is not None),
+        )
+        if not present
+    ]
+    if missing:
+        print(f"Cannot measure idle cost without {', '.join(missing)}", file=sys.stderr)
+        return 2
+
+    names = [options.only] if options.only else list(MODULES)
+    results, failures = measure_idle(names, settle=options.settle, window=options.window)
+    print(f"{'process':<20} {'procs':>6} {'wakeups/s':>10} {'cpu ms/s':>10} {'rss':>10}")
+    for name, cost in results.items():
+        print(
+            f"{name:<20} {cost['processes']:>6} {cost['wakeups_per_s']:>10.2f} "
+            f"{cost['cpu_ms_per_s']:>10.2f} {cost['rss_mb']:>8.1f}MB"
+        )
+    if options.output:
+        document = {"budgets": BUDGETS, "window": options.window, "results": results}
+        Path(options.output).write_text(json.dumps(document, indent=2) + "\n", encoding="utf-8")
+    for line in failures:
+        print(f"OVER BUDGET {line}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
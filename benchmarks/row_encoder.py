@@ -0,0 +1,70 @@
+"""Host-side cost of encoding and issuing the six row writes of a frame.
+
+The controller is replaced by a device that discards every transfer, so only
+the driver's own encoding work is measured:
+
+    python3 benchmarks/row_encoder.py --iterations 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "driver" / "src"))
+# pyusb is pure Python, so the vendored wheel imports without libusb installed.
+sys.path.extend(str(path) for path in (ROOT / "vendor").glob("pyusb-*.whl"))
+
+from ite8291r3_ctl import ite8291r3  # noqa: E402
+
+
+class NullDevice:
+    def write(self, endpoint, data):
+        return len(data)
+
+    def ctrl_transfer(self, request_type, request, value, index, data_or_length):
+        if request_type & 0x80:
+            return [ite8291r3.commands.GET_EFFECT, 0x02, ite8291r3.USER_MODE, 0, 30, 0, 0, 0]
+        return len(data_or_length)
+
+
+def cases(handle: ite8291r3.ite8291r3) -> dict:
+    color_map = {
+        (row, col): (row * 40, col * 12, 255 - col)
+        for row in range(ite8291r3.NUM_ROWS)
+        for col in range(ite8291r3.NUM_COLS)
+    }
+    frame = bytes(
+        channel
+        for row in range(ite8291r3.NUM_ROWS)
+        for col in range(ite8291r3.NUM_COLS)
+        for channel in color_map[(row, col)]
+    )
+    return {
+        "set_color": lambda: handle.set_color((255, 255, 255), brightness=30),
+        "test_pattern": lambda: handle.test_pattern(brightness=30),
+        "set_key_colors": lambda: handle.set_key_colors(
+            color_map, enable_user_mode=False, force=True
+        ),
+        "set_frame": lambda: handle.set_frame(frame, enable_user_mode=False, force=True),
+        "set_frame unchanged": lambda: handle.set_frame(frame, enable_user_mode=False),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=10000)
+    options = parser.parse_args(argv)
+    handle = ite8291r3.ite8291r3(NullDevice(), object())
+    print(f"{'operation':<20} {'per call':>11}")
+    for name, call in cases(handle).items():
+        seconds = min(timeit.repeat(call, number=options.iterations, repeat=3))
+        print(f"{name:<20} {seconds / options.iterations * 1e6:>9.2f}us")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,129 @@
+"""Settings reads from concurrent GUI and daemon processes.
+
+Forks reader processes that call `storage.load_settings()` in a tight loop
+against one scratch state document, while a writer process saves settings
+at a fixed interval so that readers keep seeing a changed file. Run from the
+repository root:
+
+    python3 benchmarks/storage_concurrency.py --readers 4 --reads 2000
+    python3 benchmarks/storage_concurrency.py --uncached --output storage.json
+
+`--uncached` disables the per-process snapshot, so every call measures the
+full read path.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT / "source") not in sys.path:
+    sys.path.append(str(ROOT / "source"))
+
+from driver_latency import summarize  # noqa: E402
+from xmg_backlight import storage  # noqa: E402
+
+ROLES = ("gui", "daemon")
+
+
+def read_settings(role: str, reads: int, start, results) -> None:
+    start.wait()
+    samples = []
+    for _ in range(reads):
+        started = time.perf_counter()
+        storage.load_settings()
+        samples.append(time.perf_counter() - started)
+    results.put((role, samples))
+
+
+def write_settings(interval: float, start, stop) -> None:
+    start.wait()
+    flag = False
+    while not stop.wait(interval):
+        flag = not flag
+        storage.write_settings_file({"show_notifications": flag})
+
+
+def run_benchmark(
+    readers: int, reads: int, write_interval: float, uncached: bool = False
+) -> dict:
+    context = multiprocessing.get_context("fork")
+    with tempfile.TemporaryDirectory() as tmp, ExitStack() as stack:
+        config = Path(tmp)
+        stack.enter_context(
+            mock.patch.multiple(
+                storage,
+                CONFIG_DIR=str(config),
+                STATE_PATH=str(config / "state.json"),
+                PROFILE_PATH=str(config / "profile.json"),
+                SETTINGS_PATH=str(config / "settings.json"),
+                LOCK_FILE_PATH=str(config / "app.lock"),
+            )
+        )
+        if uncached:
+            stack.enter_context(mock.patch.object(storage, "_cached_state", return_value=None))
+        storage.ensure_app_state()
+        start = context.Barrier(readers + 1)
+        stop = context.Event()
+        results = context.Queue()
+        workers = [
+            context.Process(
+                target=read_settings, args=(ROLES[index % len(ROLES)], reads, start, results)
+            )
+            for index in range(readers)
+        ]
+        writer = context.Process(target=write_settings, args=(write_interval, start, stop))
+        for process in (*workers, writer):
+            process.start()
+        started = time.perf_counter()
+        samples = {role: [] for role in ROLES}
+        for _ in workers:
+            role, role_samples = results.get(timeout=300)
+            samples[role].extend(role_samples)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for process in (*workers, writer):
+            process.join(timeout=30)
+    report = {role: summarize(values) for role, values in samples.items() if values}
+    report["total"] = {"reads_per_s": readers * reads / elapsed}
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--reads", type=int, default=2000, help="reads per reader")
+    parser.add_argument(
+        "--write-interval", type=float, default=0.01, metavar="SECONDS"
+    )
+    parser.add_argument("--uncached", action="store_true")
+    parser.add_argument("--output", help="write results to this JSON file")
+    options = parser.parse_args(argv)
+
+    report = run_benchmark(
+        options.readers, options.reads, options.write_interval, options.uncached
+    )
+    print(f"{'readers':<10} {'mean':>10} {'p95':>10} {'max':>10}")
+    for role in ROLES:
+        if role in report:
+            stats = report[role]
+            print(
+                f"{role:<10} {stats['mean_ms']:>8.3f}ms {stats['p95_ms']:>8.3f}ms "
+                f"{stats['max_ms']:>8.3f}ms"
+            )
+    print(f"total      {report['total']['reads_per_s']:>10.0f} reads/s")
+    if options.output:
+        Path(options.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,105 @@
+"""fsync calls per scripted GUI session under each durability policy.
+
+Replays the saves of a typical session against a scratch state document:
+bursts of profile saves and settings changes, with the group-commit window
+ending between bursts. Counts the `storage.fsync` metrics phase. Run from
+the repository root:
+
+    python3 benchmarks/storage_fsyncs.py
+    python3 benchmarks/storage_fsyncs.py --output fsyncs.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT / "source") not in sys.path:
+    sys.path.append(str(ROOT / "source"))
+
+from xmg_backlight import metrics, storage  # noqa: E402
+
+# Each inner tuple is one burst: saves issued within a second of each other.
+SESSION = (
+    (("settings", {"language": "de"}),),
+    (("save", "Default", 30), ("save", "Default", 35), ("save", "Default", 40)),
+    (("create", "Evening"), ("settings", {"battery_profile": "Evening"})),
+    (("settings", {"start_in_tray": True}), ("settings", {"resume_enabled": True})),
+    (("settings", {"power_monitor_enabled": True}),),
+    (("activate", "Evening"), ("save", "Evening", 10)),
+    (("activate", "Default"),),
+)
+
+
+def apply(step) -> None:
+    kind, *arguments = step
+    if kind == "settings":
+        storage.update_settings(arguments[0])
+    elif kind == "save":
+        name, brightness = arguments
+        storage.upsert_profile(
+            name, {**storage.DEFAULT_PROFILE_STATE, "brightness": brightness}, activate=True
+        )
+    elif kind == "create":
+        storage.upsert_profile(
+            arguments[0], storage.DEFAULT_PROFILE_STATE, expected_revision=0, activate=True
+        )
+    elif kind == "activate":
+        storage.set_active(arguments[0])
+
+
+def fsyncs() -> int:
+    return metrics.snapshot().get("storage.fsync", {}).get("count", 0)
+
+
+def run_session(policy: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        config = Path(tmp)
+        with mock.patch.multiple(
+            storage,
+            CONFIG_DIR=str(config),
+            STATE_PATH=str(config / "state.json"),
+            PROFILE_PATH=str(config / "profile.json"),
+            SETTINGS_PATH=str(config / "settings.json"),
+            LOCK_FILE_PATH=str(config / "app.lock"),
+            GROUP_COMMIT_SECONDS=3600,
+        ):
+            storage.ensure_app_state()
+            storage.set_durability(policy)
+            try:
+                before = fsyncs()
+                for burst in SESSION:
+                    for step in burst:
+                        apply(step)
+                    storage.flush_pending_writes()  # the window ends
+                session = fsyncs() - before
+            finally:
+                storage.set_durability("strict")
+    saves = sum(len(burst) for burst in SESSION)
+    return {"saves": saves, "fsyncs": session, "fsyncs_per_save": session / saves}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write results to this JSON file")
+    options = parser.parse_args(argv)
+
+    report = {policy: run_session(policy) for policy in storage.DURABILITY_POLICIES}
+    print(f"{'policy':<10} {'saves':>6} {'fsyncs':>7} {'per save':>9}")
+    for policy, result in report.items():
+        print(
+            f"{policy:<10} {result['saves']:>6} {result['fsyncs']:>7} "
+            f"{result['fsyncs_per_save']:>9.2f}"
+        )
+    if options.output:
+        Path(options.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
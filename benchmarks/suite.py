@@ -0,0 +1,311 @@
+"""Driver and host throughput benchmarks against the emulated controller.
+
+Nothing here needs hardware: the driver runs on the in-memory emulator from
+`ite8291r3_ctl.emulator`, and profile applies spawn the driver from `driver/src`
+through a stub CLI with the emulator enabled. Run from the repository root:
+
+    python3 benchmarks/suite.py --output bench.json
+    python3 benchmarks/suite.py --compare bench.json --threshold 0.2
+
+`--compare` exits with status 1 when a case's mean is slower than the
+baseline by more than the threshold. `--latency` adds a per-transfer delay
+to the emulator to approximate a real controller.
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parents[1]
+DRIVER_SOURCE = ROOT / "driver" / "src"
+# pyusb is pure Python, so the vendored wheel imports without libusb installed.
+PYUSB_WHEEL = next((ROOT / "vendor").glob("pyusb-*.whl"))
+for path in (ROOT / "source", DRIVER_SOURCE, PYUSB_WHEEL):
+    if str(path) not in sys.path:
+        sys.path.append(str(path))
+
+from driver_latency import summarize  # noqa: E402
+from ite8291r3_ctl import __main__ as cli  # noqa: E402
+from ite8291r3_ctl import emulator, ite8291r3  # noqa: E402
+from xmg_backlight import driver, restore_profile, storage  # noqa: E402
+from xmg_backlight.commands import build_profile_commands  # noqa: E402
+
+PROFILES = (
+    {"brightness": 40, "mode": "static", "static_color": "white"},
+    {"brightness": 25, "mode": "wave", "speed": 7, "direction": "left"},
+    {"brightness": 30, "mode": "ripple", "color": "teal", "reactive": True},
+)
+
+CALIBRATED_KINDS = ("off", "brightness", "effect", "monocolor")
+
+STUB_CLI = """#!{python}
+import sys
+sys.path[:0] = {paths!r}
+from ite8291r3_ctl.__main__ import main
+sys.exit(main())
+"""
+
+
+def measure(call, iterations: int) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def frames(count: int) -> list[dict]:
+    return [
+        {
+            (row, col): ((row * 40 + i) % 256, (col * 12) % 256, (i * 7) % 256)
+            for row in range(ite8291r3.NUM_ROWS)
+            for col in range(ite8291r3.NUM_COLS)
+            if (row + col + i) % 3
+        }
+        for i in range(count)
+    ]
+
+
+def anim_script(count: int) -> str:
+    lines = []
+    for i in range(count):
+        lines.append("clear")
+        lines.extend(
+            f"pos {row} {(col + i) % 16} {row * 40},{col * 12},{255 - col * 12}"
+            for row in range(6)
+            for col in range(0, 16, 2)
+        )
+        lines.append("apply")
+    return "\n".join(lines) + "\n"
+
+
+def driver_cases(latency: float) -> tuple:
+    device = emulator.EmulatedDevice(latency=latency)
+    handle = ite8291r3.get(emulated_device=device)
+    key_frames = frames(8)
+    counter = iter(range(1 << 62))
+    script = anim_script(30)
+    anim = SimpleNamespace(loop=1, file=None)
+
+    def set_key_colors():
+        handle.set_key_colors(key_frames[next(counter) % len(key_frames)])
+
+    def play_anim():
+        anim.file = io.StringIO(script)
+        cli.handle_anim_args(handle, anim)
+
+    return device, {
+        "driver.set_color": lambda: handle.set_color((255, 255, 255), brightness=30),
+        "driver.set_key_colors": set_key_colors,
+        "driver.test_pattern": lambda: handle.test_pattern(next(counter) % 3, brightness=30),
+        "driver.anim_30_frames": play_anim,
+    }
+
+
+@contextmanager
+def host_environment(latency: float):
+    """Point the GUI core at a stub CLI, the emulator, and a scratch config."""
+    with tempfile.TemporaryDirectory() as tmp, ExitStack() as stack:
+        tool = Path(tmp) / "ite8291r3-ctl"
+        tool.write_text(
+            STUB_CLI.format(python=sys.executable, paths=[str(DRIVER_SOURCE), str(PYUSB_WHEEL)]),
+            encoding="utf-8",
+        )
+        tool.chmod(0o700)
+        config = Path(tmp) / "config"
+        stack.enter_context(
+            mock.patch.dict(
+                os.environ,
+                {
+                    emulator.ENV_ENABLE: "1",
+                    emulator.ENV_LATENCY: str(latency),
+                    emulator.ENV_STATE: str(Path(tmp) / "controller.json"),
+                },
+            )
+        )
+        stack.enter_context(mock.patch.object(driver, "resolve_tool", return_value=str(tool)))
+        stack.enter_context(
+            mock.patch.object(driver, "HARDWARE_LOCK_PATH", str(config / "hardware.lock"))
+        )
+        stack.enter_context(
+            mock.patch.object(driver, "DRIVER_SOCKET_PATH", str(config / "driver.sock"))
+        )
+        stack.enter_context(
+            mock.patch.multiple(
+                storage,
+                CONFIG_DIR=str(config),
+                STATE_PATH=str(config / "state.json"),
+                PROFILE_PATH=str(config / "profile.json"),
+                SETTINGS_PATH=str(config / "settings.json"),
+                LOCK_FILE_PATH=str(config / "app.lock"),
+                PACING_PATH=str(config / "pacing.json"),
+            )
+        )
+        yield SimpleNamespace(tool=str(tool), socket=str(config / "driver.sock"))
+
+
+@contextmanager
+def serving(tool: str, path: str):
+    server = subprocess.Popen(
+        [tool, "serve", "--socket", path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    try:
+        deadline = time.monotonic() + 10
+        while not os.path.exists(path):
+            if server.poll() is not None or time.monotonic() >= deadline:
+                raise RuntimeError(f"driver server did not start: {server.stdout.read()}")
+            time.sleep(0.02)
+        yield
+    finally:
+        server.terminate()
+        server.wait(timeout=5)
+
+
+def apply_profiles() -> None:
+    for profile in PROFILES:
+        success, message = restore_profile.apply_profile(profile)
+        if not success:
+            raise RuntimeError(message)
+
+
+def storage_round_trip() -> None:
+    store = storage.load_profile_store()
+    store["profiles"]["Benchmark"] = dict(PROFILES[1])
+    storage.write_profile_store(store, expected_revision=store["revision"])
+    storage.load_profile_store()
+
+
+def run_suite(iterations: int, latency: float = 0.0, only: str = "") -> dict:
+    results = {}
+
+    def wanted(name):
+        return not only or only in name
+
+    def record(name, call, count=iterations, transfers=None):
+        if not wanted(name):
+            return
+        before = transfers() if transfers else 0
+        stats = summarize(measure(call, count))
+        stats["ops_per_s"] = 1000 / stats["mean_ms"] if stats["mean_ms"] else 0.0
+        if transfers:
+            stats["transfers_per_op"] = (transfers() - before) / count
+        results[name] = stats
+
+    device, cases = driver_cases(latency)
+    for name, call in cases.items():
+        record(name, call, transfers=lambda: device.transfers)
+
+    record(
+        "host.build_profile_commands",
+        lambda: [build_profile_commands(profile) for profile in PROFILES],
+    )
+
+    # every profile apply spawns at least one interpreter
+    host_iterations = max(1, iterations // 50)
+    with host_environment(latency) as env:
+        record("host.storage_round_trip", storage_round_trip)
+        record("host.load_settings", storage.load_settings)
+        record("host.apply_profile_x3.batch", apply_profiles, host_iterations)
+        with mock.patch.object(driver, "_run_batch_unlocked", return_value=None):
+            record("host.apply_profile_x3.spawn_each", apply_profiles, host_iterations)
+        if wanted("host.apply_profile_x3.calibrated"):
+            # what `python3 -m xmg_backlight.pacing` stores for an instant controller
+            key = "048d:600b:0003"
+            storage.write_pacing_calibration(key, dict.fromkeys(CALIBRATED_KINDS, 0.0))
+            with mock.patch.object(driver, "connected_controller_keys", return_value=[key]):
+                record("host.apply_profile_x3.calibrated", apply_profiles, host_iterations)
+        record(
+            "host.brightness.spawn",
+            lambda: driver._run_unlocked(env.tool, ["brightness", "30"], timeout=10),
+            host_iterations,
+        )
+        if wanted("host.brightness.worker"):
+            worker = driver.WorkerTransport()
+            worker.start(env.tool)
+            try:
+                # the first request also waits for the worker's imports
+                worker.execute(env.tool, ["brightness", "30"], timeout=10)
+                record(
+                    "host.brightness.worker",
+                    lambda: worker.execute(env.tool, ["brightness", "30"], timeout=10),
+                )
+            finally:
+                worker.stop()
+        if wanted("host.apply_profile_x3.serve"):
+            with serving(env.tool, env.socket):
+                record("host.apply_profile_x3.serve", apply_profiles, host_iterations)
+    return results
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, stats in sorted(current.items()):
+        reference = baseline.get(name)
+        if not reference or not reference.get("mean_ms"):
+            continue
+        ratio = stats["mean_ms"] / reference["mean_ms"]
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{name}: {reference['mean_ms']:.3f}ms -> {stats['mean_ms']:.3f}ms "
+                f"(+{(ratio - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0, metavar="SECONDS")
+    parser.add_argument("--only", default="", help="run only cases whose name contains this")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON file from an earlier --output")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    options = parser.parse_args(argv)
+
+    results = run_suite(options.iterations, options.latency, options.only)
+    print(f"{'case':<34} {'mean':>10} {'p95':>10} {'ops/s':>10} {'xfers/op':>9}")
+    for name, stats in results.items():
+        transfers = stats.get("transfers_per_op")
+        print(
+            f"{name:<34} {stats['mean_ms']:>8.3f}ms {stats['p95_ms']:>8.3f}ms "
+            f"{stats['ops_per_s']:>10.1f} "
+            + (f"{transfers:>9.1f}" if transfers is not None else f"{'-':>9}")
+        )
+
+    if options.output:
+        document = {
+            "python": platform.python_version(),
+            "iterations": options.iterations,
+            "latency": options.latency,
+            "results": results,
+        }
+        Path(options.output).write_text(json.dumps(document, indent=2) + "\n", encoding="utf-8")
+
+    if options.compare:
+        baseline = json.loads(Path(options.compare).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline.get("results", {}), options.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1 +1 @@
-__version__ = "0.4.post1"
+__version__ = "0.4.post2"
@@ -1,10 +1,22 @@
 # SPDX-License-Identifier: GPL-2.0-only
 
 import argparse
+import io
+import json
+import os
+import shlex
+import signal
 import sys
 import math
+import time
+from contextlib import redirect_stderr, redirect_stdout
 
-from ite8291r3_ctl import ite8291r3
+from ite8291r3_ctl import timings
+
+# pyusb dominates start-up; callers that asked for timings see this separately
+with timings.timed("import"):
+	from ite8291r3_ctl import ite8291r3
+	from ite8291r3_ctl import server
 from ite8291r3_ctl import __version__
 
 color_name_to_rgb = {
@@ -56,13 +68,11 @@ def screen_mode(handle, offset_x=None, offset_y=None, width=None, height=None):
 
 		im = im.resize((16, 6), resample=Image.BOX)
 
-		color_map = {}
-
-		for row in range(6):
-			for col in range(16):
-				color_map[(row, col)] = im.getpixel((col, 5-row))
+		# keyboard row 0 is the bottom row of the screen
+		frame = Image.new("RGB", (ite8291r3.NUM_COLS, ite8291r3.NUM_ROWS))
+		frame.paste(im.transpose(Image.FLIP_TOP_BOTTOM), (0, 0))
 
-		handle.set_key_colors(color_map, enable_user_mode=False)
+		handle.set_frame(frame.tobytes(), enable_user_mode=False)
 
 		now = time.monotonic()
 
@@ -72,232 +82,328 @@ def screen_mode(handle, offset_x=None, offset_y=None, width=None, height=None):
 
 		last_draw = time.monotonic()
 
-def main():
-	handle = None
+# subcommands that may be sent to `serve`; the rest block or read stdin
+SERVE_COMMANDS = frozenset({
+	"off",
+	"brightness",
+	"freeze",
+	"effect",
+	"monocolor",
+	"key-colors",
+	"palette",
+	"query",
+	"calibrate",
+})
+
+def valid_rgb(x):
+	try:
+		value = tuple(map(int, x.strip().split(',')))
+	except Exception as e:
+		raise argparse.ArgumentTypeError("must have exactly three integers separated by comma (',')")
+
+	if len(value) != 3:
+		raise argparse.ArgumentTypeError("must have exactly three integers")
+	if any(component < 0 or component > 255 for component in value):
+		raise argparse.ArgumentTypeError(
+			"each RGB component must be between 0 and 255"
+		)
 
-	def valid_rgb(x):
+	return value
+
+def valid_intrange(lo, hi=math.inf):
+
+	def f(x):
 		try:
-			value = tuple(map(int, x.strip().split(',')))
-		except Exception as e:
-			raise argparse.ArgumentTypeError("must have exactly three integers separated by comma (',')")
+			value = int(x)
+		except ValueError as e:
+			raise argparse.ArgumentTypeError("must be an integer")
 
-		if len(value) != 3:
-			raise argparse.ArgumentTypeError("must have exactly three integers")
-		if any(component < 0 or component > 255 for component in value):
-			raise argparse.ArgumentTypeError(
-				"each RGB component must be between 0 and 255"
-			)
+		if not (lo <= value <= hi):
+			raise argparse.ArgumentTypeError(f"must be between {lo} and {hi} (inclusive)")
 
 		return value
 
-	def valid_intrange(lo, hi=math.inf):
+	return f
 
-		def f(x):
-			try:
-				value = int(x)
-			except ValueError as e:
-				raise argparse.ArgumentTypeError("must be an integer")
+def valid_devid(devid):
+	try:
+		(bus, addr) = (int(x) for x in devid.split('/'))
 
-			if not (lo <= value <= hi):
-				raise argparse.ArgumentTypeError(f"must be between {lo} and {hi} (inclusive)")
+		if bus < 0 or addr < 0:
+			raise argparse.ArgumentTypeError("bus and address id must be non-negative")
 
-			return value
+		return (bus, addr)
+	except ValueError:
+		raise argparse.ArgumentTypeError("two integers expected in device id")
 
-		return f
+def valid_key_color(x):
+	try:
+		key, rgb = x.split('=')
+		(row, col) = (int(v) for v in key.split(','))
+	except ValueError:
+		raise argparse.ArgumentTypeError("must have the form row,col=red,green,blue")
 
-	def valid_devid(devid):
-		try:
-			(bus, addr) = (int(x) for x in devid.split('/'))
+	if not (0 <= row < ite8291r3.NUM_ROWS and 0 <= col < ite8291r3.NUM_COLS):
+		raise argparse.ArgumentTypeError(
+			f"row must be below {ite8291r3.NUM_ROWS} and column below {ite8291r3.NUM_COLS}"
+		)
 
-			if bus < 0 or addr < 0:
-				raise argparse.ArgumentTypeError("bus and address id must be non-negative")
+	return ((row, col), valid_rgb(rgb))
 
-			return (bus, addr)
-		except ValueError:
-			raise argparse.ArgumentTypeError("two integers expected in device id")
+def handle_off_args(handle, args):
+	handle.turn_off()
 
-	def handle_off_args(args):
-		handle.turn_off()
+def handle_brightness_args(handle, args):
+	handle.set_brightness(args.brightness)
 
-	def handle_brightness_args(args):
-		handle.set_brightness(args.brightness)
+def handle_test_pattern_args(handle, args):
+	import time
 
-	def handle_test_pattern_args(args):
-		import time
+	b = handle.get_brightness()
 
-		b = handle.get_brightness()
+	for i in range(6):
+		handle.test_pattern(i, 50 - i * 10)
 
-		for i in range(6):
-			handle.test_pattern(i, 50 - i * 10)
+		if i != 5:
+			time.sleep(2)
 
-			if i != 5:
-				time.sleep(2)
+	handle.set_key_colors({}, b)
 
-		handle.set_key_colors({}, b)
+def handle_freeze_args(handle, args):
+	handle.freeze()
 
-	def handle_freeze_args(args):
-		handle.freeze()
+def handle_effect_args(handle, args):
+	effect = ite8291r3.effects.get(args.effect_name)
 
-	def handle_effect_args(args):
-		effect = ite8291r3.effects.get(args.effect_name)
+	assert effect is not None
 
-		assert effect is not None
+	data = {}
 
-		data = {}
+	if args.speed is not None:
+		data["speed"] = args.speed
 
-		if args.speed is not None:
-			data["speed"] = args.speed
+	if args.brightness is not None:
+		data["brightness"] = args.brightness
 
-		if args.brightness is not None:
-			data["brightness"] = args.brightness
+	if args.color  is not None:
+		data["color"] = ite8291r3.colors[ args.color ]
 
-		if args.color  is not None:
-			data["color"] = ite8291r3.colors[ args.color ]
+	if args.direction  is not None:
+		data["direction"] = ite8291r3.directions[ args.direction ]
 
-		if args.direction  is not None:
-			data["direction"] = ite8291r3.directions[ args.direction ]
+	if args.reactive:
+		data["reactive"] = 1
 
-		if args.reactive:
-			data["reactive"] = 1
+	if args.save:
+		data["save"] = 1
 
-		if args.save:
-			data["save"] = 1
+	handle.set_effect(effect(**data))
 
-		handle.set_effect(effect(**data))
+def handle_monocolor_args(handle, args):
+	if args.name:
+		handle.set_color(color_name_to_rgb[args.name], args.brightness)
+	elif args.rgb:
+		handle.set_color(args.rgb, args.brightness)
 
-	def handle_monocolor_args(args):
-		if args.name:
-			handle.set_color(color_name_to_rgb[args.name], args.brightness)
-		elif args.rgb:
-			handle.set_color(args.rgb, args.brightness)
+def handle_key_colors_args(handle, args):
+	handle.set_key_colors(dict(args.keys), args.brightness)
 
-	def handle_palette_args(args):
-		if args.set_color:
-			color_idx = int(args.set_color[0])
-			color = valid_rgb(args.set_color[1])
+def handle_palette_args(handle, args):
+	if args.set_color:
+		color_idx = int(args.set_color[0])
+		color = valid_rgb(args.set_color[1])
 
-			handle.set_palette_color(color_idx, color)
+		handle.set_palette_color(color_idx, color)
 
-		if args.restore:
-			handle.restore_default_palette()
+	if args.restore:
+		handle.restore_default_palette()
 
-		if args.random:
-			from random import randint
+	if args.random:
+		from random import randint
 
-			for i in range(7):
-				handle.set_palette_color(i+1, [randint(0, 255) for _ in range(3)])
+		for i in range(7):
+			handle.set_palette_color(i+1, [randint(0, 255) for _ in range(3)])
 
-	def handle_mode_args(args):
-		if args.screen is not None:
-			try:
-				if args.screen == "fullscreen":
-					data = (None, ) * 4
-				else:
-					data = map(int, args.screen.strip().split(','))
+def handle_mode_args(handle, args):
+	if args.screen is not None:
+		try:
+			if args.screen == "fullscreen":
+				data = (None, ) * 4
+			else:
+				data = map(int, args.screen.strip().split(','))
 
-				screen_mode(handle, *data)
-			except KeyboardInterrupt:
-				pass
+			screen_mode(handle, *data)
+		except KeyboardInterrupt:
+			pass
 
-	def handle_anim_args(args):
-		import time
+def handle_anim_args(handle, args):
+	import time
 
-		def do_shift(color_map, rowdiff=0, coldiff=0):
-			new_map = {}
+	def do_shift(color_map, rowdiff=0, coldiff=0):
+		new_map = {}
 
-			for ((row, col), color) in color_map.items():
-				if (0 <= row+rowdiff <= 5) and (0 <= col+coldiff <= 15):
-					new_map[ (row+rowdiff, col+coldiff) ] = color
+		for ((row, col), color) in color_map.items():
+			if (0 <= row+rowdiff <= 5) and (0 <= col+coldiff <= 15):
+				new_map[ (row+rowdiff, col+coldiff) ] = color
 
-			return new_map
+		return new_map
 
-		def do_animation():
-			i = 0
+	def do_animation():
+		i = 0
 
-			# do not store lines if no looping is needed
-			if args.loop == 1:
-				line_source = filter(lambda x: x != "", map(lambda x: x.strip(), args.file))
-			else:
-				line_source = list(filter(lambda x: x != "", [x.strip() for x in args.file]))
+		# do not store lines if no looping is needed
+		if args.loop == 1:
+			line_source = filter(lambda x: x != "", map(lambda x: x.strip(), args.file))
+		else:
+			line_source = list(filter(lambda x: x != "", [x.strip() for x in args.file]))
 
-			while args.loop is True or i < args.loop:
+		while args.loop is True or i < args.loop:
 
-				color_map = {}
+			color_map = {}
 
-				comment = 0
+			comment = 0
 
-				for line in line_source:
+			for line in line_source:
 
-					if line.startswith('#'):
-						continue
+				if line.startswith('#'):
+					continue
 
-					if line.startswith('/*'):
-						comment += 1
-						continue
+				if line.startswith('/*'):
+					comment += 1
+					continue
 
-					if line.startswith('*/'):
-						comment -= 1
-						continue
+				if line.startswith('*/'):
+					comment -= 1
+					continue
 
-					if comment != 0:
-						continue
+				if comment != 0:
+					continue
 
-					if line.startswith('pos'):
-						_, row, col, rgb = line.split()
-						color_map[(int(row), int(col))] = valid_rgb(rgb)
+				if line.startswith('pos'):
+					_, row, col, rgb = line.split()
+					color_map[(int(row), int(col))] = valid_rgb(rgb)
 
-					elif line.startswith('apply'):
-						handle.set_key_colors(color_map)
+				elif line.startswith('apply'):
+					handle.set_key_colors(color_map)
 
-					elif line.startswith('wait'):
-						_, t = line.split()
-						time.sleep(float(t))
+				elif line.startswith('wait'):
+					_, t = line.split()
+					time.sleep(float(t))
 
-					elif line.startswith('clear'):
-						color_map.clear()
+				elif line.startswith('clear'):
+					color_map.clear()
 
-					elif line.startswith('brightness'):
-						_, b = line.split()
-						handle.set_brightness(int(b))
+				elif line.startswith('brightness'):
+					_, b = line.split()
+					handle.set_brightness(int(b))
 
-					elif line.startswith('shift'):
-						_, rowdiff, coldiff = line.split()
+				elif line.startswith('shift'):
+					_, rowdiff, coldiff = line.split()
 
-						color_map = do_shift(color_map, int(rowdiff), int(coldiff))
+					color_map = do_shift(color_map, int(rowdiff), int(coldiff))
 
-				i += 1
+			i += 1
 
-		try:
-			do_animation()
-		except KeyboardInterrupt:
-			pass
+	try:
+		do_animation()
+	except KeyboardInterrupt:
+		pass
 
-	def handle_query_args(args):
-		if args.fw_version:
-			print("{}.{}.{}.{}".format(*handle.get_fw_version()))
+def handle_query_args(handle, args):
+	if args.brightness or args.state or args.json:
+		# report what the controller shows, not what this handle last wrote
+		handle.refresh()
 
-		if args.brightness:
-			print(handle.get_brightness())
+	if args.json:
+		state = handle.get_state()
 
-		if args.state:
-			print("off" if handle.is_off() else "on")
+		if args.fw_version:
+			state["fw_version"] = "{}.{}.{}.{}".format(*handle.get_fw_version())
 
 		if args.devices:
-			for dev in ite8291r3.get_all():
-				print(f"{dev.idVendor:04x}:{dev.idProduct:04x} "
-				      f"bus {dev.bus} "
-				      f"addr {dev.address} "
-				      f"rev {dev.bcdDevice >> 8:x}.{dev.bcdDevice & 0xFF:02x} "
-				      f"product '{dev.product}' "
-				      f"manufacturer '{dev.manufacturer}'")
+			state["devices"] = [f"{dev.idVendor:04x}:{dev.idProduct:04x} bus {dev.bus} addr {dev.address}"
+			                    for dev in ite8291r3.get_all()]
+
+		print(json.dumps(state, sort_keys=True))
+		return
+
+	if args.fw_version:
+		print("{}.{}.{}.{}".format(*handle.get_fw_version()))
+
+	if args.brightness:
+		print(handle.get_brightness())
+
+	if args.state:
+		print("off" if handle.is_off() else "on")
+
+	if args.devices:
+		for dev in ite8291r3.get_all():
+			print(f"{dev.idVendor:04x}:{dev.idProduct:04x} "
+			      f"bus {dev.bus} "
+			      f"addr {dev.address} "
+			      f"rev {dev.bcdDevice >> 8:x}.{dev.bcdDevice & 0xFF:02x} "
+			      f"product '{dev.product}' "
+			      f"manufacturer '{dev.manufacturer}'")
+
+# longest the controller may take to show a change while calibrating
+CALIBRATION_TIMEOUT = 2.0
 
+# time from the end of a write to the start of the first read that shows it;
+# this is the pause a following command needs, not the cost of the write
+def settle_time(handle, write, applied):
+	write()
+	written = time.monotonic()
+
+	while True:
+		polled = time.monotonic()
+		# read the controller, not the shadow of what was just written
+		handle.refresh()
+		if applied(handle.get_state()):
+			return polled - written
+
+		if polled - written > CALIBRATION_TIMEOUT:
+			raise TimeoutError("controller did not show the change in time")
+
+def handle_calibrate_args(handle, args):
+	settle = {}
+
+	for i in range(args.rounds):
+		# alternate the values so that every write changes the controller
+		brightness = 20 + 10 * (i % 2)
+		color = (255, 255, 255) if i % 2 else (255, 0, 0)
+		wave = ite8291r3.effects["wave"](brightness=brightness)
+
+		steps = (
+			("monocolor",  lambda: handle.set_color(color, brightness=brightness),
+			               lambda s: s["power"] == "on" and s["effect"] == ite8291r3.USER_MODE),
+			("brightness", lambda: handle.set_brightness(brightness + 5),
+			               lambda s: s["brightness"] == brightness + 5),
+			("effect",     lambda: handle.set_effect(wave),
+			               lambda s: s["power"] == "on" and s["effect"] == wave[ite8291r3.effect_attrs.EFFECT]),
+			("off",        handle.turn_off,
+			               lambda s: s["power"] == "off"),
+		)
+
+		for (kind, write, applied) in steps:
+			elapsed = settle_time(handle, write, applied)
+			settle[kind] = max(settle.get(kind, 0), elapsed)
+
+	dev = handle.usb_dev
+	print(json.dumps({
+		"device":   f"{dev.idVendor:04x}:{dev.idProduct:04x}",
+		"revision": f"{dev.bcdDevice:04x}",
+		"rounds":   args.rounds,
+		"settle":   {kind: round(elapsed, 4) for (kind, elapsed) in settle.items()},
+	}, sort_keys=True))
+
+def build_parser():
 	parser = argparse.ArgumentParser(description='ITE8291 (rev 0.03) RGB keyboard backlight controller driver.')
 	parser.add_argument('--version', action='version', version=f'%(prog)s {__version__}')
 
 	parser.add_argument('--debug', action='store_true', help='print traffic between the device and this program to stderr')
 	parser.add_argument('--device', type=valid_devid, help='bus/addr of the device to control.')
 
-	subparsers = parser.add_subparsers(help='Subcommands.', required=True)
+	subparsers = parser.add_subparsers(dest='command', help='Subcommands.', required=True)
 
 	parser_off = subparsers.add_parser('off', help='Turn keyboard backlight off.')
 	parser_off.set_defaults(func=handle_off_args)
@@ -331,6 +437,11 @@ def main():
 	group.add_argument('--rgb', type=valid_rgb, metavar='red,green,blue', help='Specify color by RGB code.')
 	parser_monocolor.set_defaults(func=handle_monocolor_args)
 
+	parser_key_colors = subparsers.add_parser('key-colors', help='Set per-key colors; unlisted keys are turned off.')
+	parser_key_colors.add_argument('-b', '--brightness', type=valid_intrange(0, 50), help='Brightness of the keys.')
+	parser_key_colors.add_argument('keys', nargs='+', type=valid_key_color, metavar='row,col=red,green,blue', help='Color of a single key.')
+	parser_key_colors.set_defaults(func=handle_key_colors_args)
+
 	parser_palette = subparsers.add_parser('palette', help='Change keyboard color palette.')
 	group = parser_palette.add_mutually_exclusive_group()
 	group.add_argument('--set-color', nargs=2, help='Change the given color of the palette to an arbitrary color.')
@@ -353,21 +464,230 @@ def main():
 	parser_query.add_argument('--brightness', action='store_true', help='Get the current brightness.')
 	parser_query.add_argument('--state', action='store_true', help='Get the current state of the keyboard backlight.')
 	parser_query.add_argument('--devices', action='store_true', help='List available devices that may be controlled.')
+	parser_query.add_argument('--json', action='store_true', help='Print power, effect, speed, brightness, color, and direction/reactive as one JSON object, read with a single request.')
 	parser_query.set_defaults(func=handle_query_args)
 
-	args = parser.parse_args()
+	parser_calibrate = subparsers.add_parser('calibrate', help='Measure how long the controller takes to show each kind of change and print the settle times as JSON. Leaves the backlight off.')
+	parser_calibrate.add_argument('--rounds', type=valid_intrange(1, 20), default=3, help='Repeat the measurement this number of times and report the slowest.')
+	parser_calibrate.set_defaults(func=handle_calibrate_args)
 
-	traffic_callback = None
-	if args.debug:
-		traffic_callback = lambda *parts: print("debug:", *parts, file=sys.stderr)
+	parser_batch = subparsers.add_parser('batch', help='Execute a list of commands against one device handle.')
+	parser_batch.add_argument('--file', type=argparse.FileType('r'), default=sys.stdin, help='Read commands from file, one per line or as a JSON list of argument lists. If not specified, stdin is used.')
+	parser_batch.add_argument('--delay', type=float, default=0.0, metavar='SECONDS', help='Pause between consecutive commands.')
 
+	parser_serve = subparsers.add_parser('serve', help='Keep the device open and execute requests received on a Unix socket or stdin.')
+	group = parser_serve.add_mutually_exclusive_group(required=True)
+	group.add_argument('--socket', metavar='PATH', help='Path of the Unix socket to listen on.')
+	group.add_argument('--stdio', action='store_true', help='Read requests from stdin and answer on stdout until stdin is closed.')
+	parser_serve.add_argument('--idle-timeout', type=float, metavar='SECONDS', help='Exit after this many seconds without a connection.')
+
+	return parser
+
+def needs_handle(args):
 	query_devices_only = (
 		getattr(args, "devices", False)
 		and not getattr(args, "fw_version", False)
 		and not getattr(args, "brightness", False)
 		and not getattr(args, "state", False)
+		and not getattr(args, "json", False)
 	)
-	if not query_devices_only:
+	return not query_devices_only
+
+class RequestExecutor:
+	"""Executes CLI requests against one handle that outlives them."""
+
+	def __init__(self, parser, device=None, traffic_callback=None):
+		self.parser = parser
+		self.device = device
+		self.traffic_callback = traffic_callback
+		self.handle = None
+
+	def acquire(self):
+		if self.handle is None:
+			self.handle = ite8291r3.get(self.device, self.traffic_callback)
+
+		return self.handle
+
+	def __call__(self, argv):
+		try:
+			return self.execute(argv)
+		finally:
+			self.release()
+
+	def batch(self, commands, delay=0, hung_up=None):
+		# the interface stays claimed until the whole list has been executed;
+		# `hung_up(delay)` sleeps the pause and tells whether the client left
+		try:
+			for (i, argv) in enumerate(commands):
+				if i and hung_up is not None:
+					if hung_up(delay):
+						break
+				elif i and delay:
+					time.sleep(delay)
+
+				result = self.execute(argv)
+				yield result
+
+				if result[0] != 0:
+					break
+		finally:
+			self.release()
+
+	def execute(self, argv):
+		stdout = io.StringIO()
+		stderr = io.StringIO()
+
+		with redirect_stdout(stdout), redirect_stderr(stderr):
+			rc = self.run(argv)
+
+		return rc, stdout.getvalue(), stderr.getvalue()
+
+	def run(self, argv):
+		try:
+			args = self.parser.parse_args(argv)
+		except SystemExit as e:
+			return e.code if isinstance(e.code, int) else 2
+
+		if args.command not in SERVE_COMMANDS:
+			print(f"'{args.command}' cannot be requested from a server or batch", file=sys.stderr)
+			return 2
+
+		handle = None
+		if needs_handle(args):
+			try:
+				handle = self.acquire()
+			except (FileNotFoundError, ValueError) as e:
+				print(f"device handle could not be acquired: {e}")
+				return 1
+
+		try:
+			args.func(handle, args)
+		except Exception as e:
+			if isinstance(e, OSError):
+				# USB errors (unplug, suspend) invalidate the handle; reopen next time
+				self.handle = None
+			print(f"failed to carry out operation: {e}", file=sys.stderr)
+			return 1
+
+		return 0
+
+	def release(self):
+		if self.handle is None:
+			return
+
+		try:
+			self.handle.release()
+		except OSError:
+			self.handle = None
+
+def read_batch(stream):
+	text = stream.read()
+
+	if text.lstrip().startswith('['):
+		try:
+			commands = json.loads(text)
+		except json.JSONDecodeError as e:
+			raise ValueError(f"malformed JSON command list: {e}")
+	else:
+		commands = [
+			shlex.split(line)
+			for line in text.splitlines()
+			if line.strip() and not line.lstrip().startswith('#')
+		]
+
+	if not isinstance(commands, list) or not all(map(server.is_argv, commands)):
+		raise ValueError("each command must be a non-empty list of strings")
+
+	return commands
+
+def handle_batch_args(args, traffic_callback):
+	try:
+		commands = read_batch(args.file)
+	except ValueError as e:
+		print(f"invalid batch: {e}", file=sys.stderr)
+		return 2
+
+	if not (0 <= args.delay <= server.MAX_BATCH_DELAY):
+		print(f"invalid batch: delay must be between 0 and {server.MAX_BATCH_DELAY} seconds", file=sys.stderr)
+		return 2
+
+	executor = RequestExecutor(build_parser(), args.device, traffic_callback)
+
+	# one JSON object per executed command, written as soon as it completes
+	rc = 0
+	for result in executor.batch(commands, args.delay):
+		print(json.dumps(server.result_object(result)), flush=True)
+		rc = result[0]
+
+	return rc
+
+def serve_stdio(executor):
+	# keep the frames on a private copy of stdout; anything else that writes to
+	# file descriptor 1 ends up on stderr instead of corrupting the stream
+	wfile = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+	sys.stdout.flush()
+	os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+	try:
+		server.serve_stream(executor, sys.stdin.buffer, wfile)
+	except (BrokenPipeError, KeyboardInterrupt):
+		pass
+
+	return 0
+
+def handle_serve_args(args, traffic_callback):
+	executor = RequestExecutor(build_parser(), args.device, traffic_callback)
+
+	if args.stdio:
+		# a worker is started before it is needed; a missing device is
+		# reported to each request, like the CLI would
+		return serve_stdio(executor)
+
+	try:
+		executor.acquire()
+		executor.release()
+	except (FileNotFoundError, ValueError) as e:
+		print(f"device handle could not be acquired: {e}")
+		return 1
+
+	# turn SIGTERM into a normal exit so that the socket is removed; not
+	# through SystemExit, which a request in progress would swallow
+	signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+	try:
+		server.serve_socket(executor, args.socket, args.idle_timeout)
+	except FileExistsError as e:
+		print(f"cannot listen: {e}", file=sys.stderr)
+		return 1
+	except KeyboardInterrupt:
+		pass
+
+	return 0
+
+def main():
+	try:
+		with timings.timed("main"):
+			return run_command_line()
+	finally:
+		timings.write_report()
+
+def run_command_line():
+	handle = None
+
+	parser = build_parser()
+	args = parser.parse_args()
+
+	traffic_callback = None
+	if args.debug:
+		traffic_callback = lambda *parts: print("debug:", *parts, file=sys.stderr)
+
+	if args.command == "serve":
+		return handle_serve_args(args, traffic_callback)
+
+	if args.command == "batch":
+		return handle_batch_args(args, traffic_callback)
+
+	if needs_handle(args):
 		try:
 			handle = ite8291r3.get(args.device, traffic_callback)
 		except (FileNotFoundError, ValueError) as e:
@@ -378,7 +698,7 @@ def main():
 
 	try:
 		if "func" in args:
-			args.func(args)
+			args.func(handle, args)
 
 	except Exception as e:
 		print(f"failed to carry out operation: {e}", file=sys.stderr)
@@ -0,0 +1,182 @@
+# SPDX-License-Identifier: GPL-2.0-only
+
+# In-memory stand-in for the controller. It implements the part of the pyusb
+# device API that ite8291r3 uses and decodes the protocol into a simulated
+# controller state and a per-key framebuffer, so that the driver, the CLI, and
+# anything spawning it can be exercised and benchmarked without hardware.
+#
+# ITE8291R3_EMULATOR=1 makes get() and get_all() use it instead of the USB bus.
+# ITE8291R3_EMULATOR_LATENCY adds that many seconds to every transfer,
+# ITE8291R3_EMULATOR_SETTLE makes effect and brightness changes show up in
+# GET_EFFECT only after that many seconds, and ITE8291R3_EMULATOR_STATE names a
+# JSON file that carries the state from one process to the next (loaded on
+# start, written at exit).
+
+import array
+import atexit
+import json
+import math
+import os
+import time
+
+import usb.core
+import usb.util
+
+from ite8291r3_ctl import ite8291r3
+
+ENV_ENABLE  = "ITE8291R3_EMULATOR"
+ENV_LATENCY = "ITE8291R3_EMULATOR_LATENCY"
+ENV_SETTLE  = "ITE8291R3_EMULATOR_SETTLE"
+ENV_STATE   = "ITE8291R3_EMULATOR_STATE"
+
+OUT_ENDPOINT = 0x02
+
+FW_VERSION = (0, 3, 0, 0)
+
+DEFAULT_PALETTE = {
+	1: (255,   0,   0),
+	2: (255,  28,   0),
+	3: (255, 119,   0),
+	4: (  0, 255,   0),
+	5: (  0,   0, 255),
+	6: (  0, 255, 255),
+	7: (255,   0, 255),
+}
+
+def is_enabled(environ=os.environ):
+	return environ.get(ENV_ENABLE, "") not in ("", "0")
+
+def from_environment(environ=os.environ):
+	latency = float(environ.get(ENV_LATENCY) or 0)
+	settle = float(environ.get(ENV_SETTLE) or 0)
+	return EmulatedDevice(latency=latency, settle=settle, state_path=environ.get(ENV_STATE) or None)
+
+class EmulatedDevice:
+	OUT_ENDPOINT = OUT_ENDPOINT
+
+	idVendor     = ite8291r3.VENDOR_ID
+	idProduct    = 0x600B
+	bcdDevice    = 0x0003
+	bus          = 0
+	address      = 0
+	product      = "ITE Device(8291) (emulated)"
+	manufacturer = "ITE Tech. Inc."
+
+	def __init__(self, latency=0.0, settle=0.0, state_path=None):
+		self.latency = latency
+		self.settle = settle
+		self.state_path = state_path
+
+		self.control = 0x02
+		self.effect = [ite8291r3.USER_MODE, 0, 25, 0, 0, 0]
+		self.palette = dict(DEFAULT_PALETTE)
+		# row-major (red, green, blue) per key, the layout set_frame() accepts
+		self.framebuffer = bytearray(ite8291r3.FRAME_LEN)
+
+		self.row_index = None
+		self.response = None
+		self.transfers = 0
+		# (due, payload) of changes that have not settled yet
+		self.pending = []
+
+		if state_path:
+			self.load()
+			atexit.register(self.save)
+
+	def key_color(self, row, col):
+		idx = row * ite8291r3.FRAME_ROW_LEN + col * 3
+		return tuple(self.framebuffer[idx:idx + 3])
+
+	def __transfer(self):
+		self.transfers += 1
+		if self.latency:
+			time.sleep(self.latency)
+
+	def write(self, endpoint, data, timeout=None):
+		self.__transfer()
+
+		data = bytes(data)
+		if endpoint != OUT_ENDPOINT or self.row_index is None or len(data) != ite8291r3.ROW_BUFFER_LEN:
+			raise usb.core.USBError("Pipe error")
+
+		start = self.row_index * ite8291r3.FRAME_ROW_LEN
+		end = start + ite8291r3.FRAME_ROW_LEN
+		self.framebuffer[start:end:3] = data[ite8291r3.ROW_RED_OFFSET:ite8291r3.ROW_RED_OFFSET + ite8291r3.NUM_COLS]
+		self.framebuffer[start + 1:end:3] = data[ite8291r3.ROW_GREEN_OFFSET:ite8291r3.ROW_GREEN_OFFSET + ite8291r3.NUM_COLS]
+		self.framebuffer[start + 2:end:3] = data[ite8291r3.ROW_BLUE_OFFSET:ite8291r3.ROW_BLUE_OFFSET + ite8291r3.NUM_COLS]
+		self.row_index = None
+
+		return len(data)
+
+	def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0, data_or_wLength=None, timeout=None):
+		self.__transfer()
+
+		if bmRequestType & usb.util.CTRL_IN:
+			if self.response is None:
+				raise usb.core.USBError("Pipe error")
+
+			(response, self.response) = (self.response, None)
+			return array.array('B', response[:data_or_wLength])
+
+		payload = list(data_or_wLength)
+		cmd = payload[0]
+
+		if cmd in (ite8291r3.commands.SET_EFFECT, ite8291r3.commands.SET_BRIGHTNESS):
+			if self.settle:
+				self.pending.append((time.monotonic() + self.settle, payload))
+			else:
+				self.__apply(payload)
+		elif cmd == ite8291r3.commands.SET_PALETTE_COLOR:
+			self.palette[payload[2]] = tuple(payload[3:6])
+		elif cmd == ite8291r3.commands.SET_ROW_INDEX:
+			if not (0 <= payload[2] < ite8291r3.NUM_ROWS):
+				raise usb.core.USBError("Pipe error")
+			self.row_index = payload[2]
+		elif cmd == ite8291r3.commands.GET_EFFECT:
+			self.settle_pending()
+			self.response = [cmd, self.control, *self.effect]
+		elif cmd == ite8291r3.commands.GET_FW_VERSION:
+			self.response = [cmd, *FW_VERSION, 0, 0, 0]
+		else:
+			raise usb.core.USBError("Pipe error")
+
+		return len(payload)
+
+	def __apply(self, payload):
+		if payload[0] == ite8291r3.commands.SET_EFFECT:
+			self.control = payload[1]
+			if self.control == 0x02:
+				self.effect = payload[2:8]
+		else:
+			self.effect[ite8291r3.effect_attrs.BRIGHTNESS] = payload[2]
+
+	def settle_pending(self, now=None):
+		now = time.monotonic() if now is None else now
+		while self.pending and self.pending[0][0] <= now:
+			self.__apply(self.pending.pop(0)[1])
+
+	def load(self):
+		try:
+			with open(self.state_path) as f:
+				state = json.load(f)
+		except FileNotFoundError:
+			return
+
+		self.control = state["control"]
+		self.effect = state["effect"]
+		self.palette = {int(idx): tuple(color) for (idx, color) in state["palette"].items()}
+		self.framebuffer = bytearray.fromhex(state["framebuffer"])
+
+	def save(self):
+		self.settle_pending(math.inf)
+		state = {
+			"control":     self.control,
+			"effect":      self.effect,
+			"palette":     self.palette,
+			"framebuffer": self.framebuffer.hex(),
+		}
+
+		tmp = f"{self.state_path}.tmp"
+		with open(tmp, "w") as f:
+			json.dump(state, f)
+		os.replace(tmp, self.state_path)
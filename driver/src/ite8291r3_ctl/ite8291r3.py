@@ -1,8 +1,13 @@
 # SPDX-License-Identifier: GPL-2.0-only
 
+import functools
+import time
+
 import usb.core
 import usb.util
 
+from ite8291r3_ctl import timings
+
 
 VENDOR_ID   = 0x048D
 SUPPORTED_DEVICES = {
@@ -22,6 +27,18 @@ ROW_RED_OFFSET   = 1 + 2 * NUM_COLS
 ROW_GREEN_OFFSET = 1 + 1 * NUM_COLS
 ROW_BLUE_OFFSET  = 1 + 0 * NUM_COLS
 
+# host-side frame layout accepted by set_frame(): rows of (red, green, blue) per key
+FRAME_ROW_LEN = 3 * NUM_COLS
+FRAME_LEN     = NUM_ROWS * FRAME_ROW_LEN
+BLANK_FRAME   = bytes(FRAME_LEN)
+
+# effect id of the per-key ("user") mode, where the rows written by the host are shown
+USER_MODE = 51
+
+# seconds for which the effect and power state last written or read is trusted;
+# the firmware changes the brightness on its own when the Fn hotkeys are used
+SHADOW_TTL = 1.0
+
 class commands:
 	SET_EFFECT        =   8
 	SET_BRIGHTNESS    =   9
@@ -148,19 +165,86 @@ effects = {
 	}),
 }
 
+# row payloads that do not depend on per-key input are encoded once and reused
+
+@functools.lru_cache(maxsize=32)
+def solid_row(color):
+	(red, green, blue) = color
+	row = bytearray(ROW_BUFFER_LEN)
+	row[ROW_RED_OFFSET:ROW_RED_OFFSET + NUM_COLS] = bytes((red, )) * NUM_COLS
+	row[ROW_GREEN_OFFSET:ROW_GREEN_OFFSET + NUM_COLS] = bytes((green, )) * NUM_COLS
+	row[ROW_BLUE_OFFSET:ROW_BLUE_OFFSET + NUM_COLS] = bytes((blue, )) * NUM_COLS
+	return bytes(row)
+
+def _test_pattern_row(phase):
+	c = [
+		(255, 0, 0),
+		(0, 255, 0),
+		(0, 0, 255),
+	]
+
+	row = bytearray(ROW_BUFFER_LEN)
+	for i in range(NUM_COLS):
+		row[ROW_RED_OFFSET + i], row[ROW_GREEN_OFFSET + i], row[ROW_BLUE_OFFSET + i] = c[(i + phase) % 3]
+
+	return bytes(row)
+
+TEST_PATTERN_ROWS = tuple(_test_pattern_row(phase) for phase in range(3))
+
 class ite8291r3:
 	def __init__(self, usb_dev, usb_out_descriptor, traffic_callback=None):
 		self.usb_dev = usb_dev
 		self.usb_out_descriptor = usb_out_descriptor
 		self.traffic_callback = traffic_callback
+		# last payload written to each row and whether it is still what the row shows
+		self.__sent_rows = [bytearray(ROW_BUFFER_LEN) for _ in range(NUM_ROWS)]
+		self.__known_rows = [False] * NUM_ROWS
+		self.skipped_transfers = 0
+		# scratch buffers reused by every frame, so encoding does not allocate
+		self.__row_buffer = bytearray(ROW_BUFFER_LEN)
+		self.__key_frame = bytearray(FRAME_LEN)
+		self.__frame_buffer = bytearray(FRAME_LEN)
+		# views made once: the red, green and blue planes of the row payload,
+		# and per row the strided channels of the frame buffer that fill them
+		row_view = memoryview(self.__row_buffer)
+		frame_view = memoryview(self.__frame_buffer)
+		self.__row_planes = tuple(
+			row_view[offset:offset + NUM_COLS]
+			for offset in (ROW_RED_OFFSET, ROW_GREEN_OFFSET, ROW_BLUE_OFFSET)
+		)
+		self.__frame_channels = tuple(
+			tuple(
+				frame_view[row * FRAME_ROW_LEN + channel:(row + 1) * FRAME_ROW_LEN:3]
+				for channel in range(3)
+			)
+			for row in range(NUM_ROWS)
+		)
+		# shadow of the controller: control code (0x01 off, 0x02 on), effect
+		# tuple, and palette colors by index; None when unknown
+		self.__control = None
+		self.__effect = None
+		self.__shadow_time = None
+		self.__palette = {}
 
 	def __report_traffic(self, kind, direction, data):
 		if self.traffic_callback:
 			self.traffic_callback(kind, direction, data)
 
+	def __transfer(self, phase, transfer, *args):
+		started = time.monotonic()
+		try:
+			return transfer(*args)
+		except OSError:
+			# nothing is known about the controller after a failed transfer
+			self.forget_frame()
+			self.forget_shadow()
+			raise
+		finally:
+			timings.record(phase, time.monotonic() - started)
+
 	def __send_data(self, payload):
 		self.__report_traffic("data", "out", payload)
-		return self.usb_dev.write(self.usb_out_descriptor, payload)
+		return self.__transfer("usb.write", self.usb_dev.write, self.usb_out_descriptor, payload)
 
 	def __send_ctrl(self, *payload):
 		if len(payload) < 8:
@@ -169,7 +253,7 @@ class ite8291r3:
 		self.__report_traffic("ctrl", "out", payload)
 
 		# https://github.com/libusb/hidapi/blob/533dd9229a846d6ab00c4dced1cbddf66b576258/libusb/hid.c#L1180
-		self.usb_dev.ctrl_transfer(
+		self.__transfer("usb.ctrl_out", self.usb_dev.ctrl_transfer,
 			usb.util.build_request_type(usb.util.CTRL_OUT,
 						    usb.util.CTRL_TYPE_CLASS,
 						    usb.util.CTRL_RECIPIENT_INTERFACE), # bmRequestType
@@ -181,7 +265,7 @@ class ite8291r3:
 	def __get_ctrl(self, length):
 
 		# https://github.com/libusb/hidapi/blob/533dd9229a846d6ab00c4dced1cbddf66b576258/libusb/hid.c#L1210
-		data = self.usb_dev.ctrl_transfer(
+		data = self.__transfer("usb.ctrl_in", self.usb_dev.ctrl_transfer,
 			usb.util.build_request_type(usb.util.CTRL_IN,
 						    usb.util.CTRL_TYPE_CLASS,
 						    usb.util.CTRL_RECIPIENT_INTERFACE), # bmRequestType
@@ -200,36 +284,109 @@ class ite8291r3:
 
 		return (buf[1], buf[2], buf[3], buf[4]) # high.low.test.customer
 
-	def get_effect(self):
+	def refresh(self):
+		# read the effect and power state from the controller; the palette
+		# cannot be read back, so its shadow is dropped
 		self.__send_ctrl(commands.GET_EFFECT)
-		return list(self.__get_ctrl(8)[2:]) # skip command id and control code
+		buf = self.__get_ctrl(8)
+
+		self.__control = buf[1]
+		self.__effect = list(buf[2:]) # skip command id and control code
+		self.__shadow_time = time.monotonic()
+		self.__palette.clear()
+
+	def forget_shadow(self):
+		self.__control = None
+		self.__effect = None
+		self.__shadow_time = None
+		self.__palette.clear()
+
+	def __shadow_is_fresh(self):
+		return self.__shadow_time is not None and time.monotonic() - self.__shadow_time < SHADOW_TTL
+
+	def __current_state(self):
+		if not self.__shadow_is_fresh():
+			self.refresh()
+
+		return (self.__control, self.__effect)
+
+	def get_effect(self):
+		return list(self.__current_state()[1])
+
+	def get_state(self):
+		(control, effect) = self.__current_state()
+
+		return {
+			"power":                 "off" if control == 0x01 else "on",
+			"effect":                effect[effect_attrs.EFFECT],
+			"speed":                 effect[effect_attrs.SPEED],
+			"brightness":            effect[effect_attrs.BRIGHTNESS],
+			"color":                 effect[effect_attrs.COLOR],
+			"direction_or_reactive": effect[effect_attrs.DIRECTION],
+		}
 
 	def __set_row_index(self, row_idx):
 		self.__send_ctrl(commands.SET_ROW_INDEX, 0x00, row_idx)
 
+	def __send_row(self, row_idx, payload):
+		self.__known_rows[row_idx] = False
+		self.__set_row_index(row_idx)
+		self.__send_data(payload)
+		self.__sent_rows[row_idx][:] = payload
+		self.__known_rows[row_idx] = True
+
+	def forget_frame(self):
+		for row in range(NUM_ROWS):
+			self.__known_rows[row] = False
+
 	def __set_effect_impl(self, control, effect=0x00, speed=0x00, brightness=0x00, color=0x00, direction_or_reactive=0x00, save=0x00):
 		self.__send_ctrl(commands.SET_EFFECT, control, effect, speed, brightness, color, direction_or_reactive, save)
 
 	def set_effect(self, effect_data):
+		effect = list(effect_data) + [0] * (6 - len(effect_data))
+
+		if (self.__shadow_is_fresh() and self.__control == 0x02 and not effect[effect_attrs.SAVE]
+		    and self.__effect[:effect_attrs.SAVE] == effect[:effect_attrs.SAVE]):
+			self.skipped_transfers += 1
+			return
+
+		if effect[effect_attrs.EFFECT] != USER_MODE:
+			# firmware effects draw over the rows, so their content is unknown afterwards
+			self.forget_frame()
+
 		self.__set_effect_impl(0x02, *effect_data)
 
+		self.__control = 0x02
+		self.__effect = effect
+		self.__shadow_time = time.monotonic()
+
 	def set_brightness(self, brightness):
 		if not (0 <= brightness <= 50):
 			raise ValueError("brightness must be between 0 and 50 inclusive")
 
+		if self.__shadow_is_fresh() and self.__control == 0x02 and self.__effect[effect_attrs.BRIGHTNESS] == brightness:
+			self.skipped_transfers += 1
+			return
+
 		self.__send_ctrl(commands.SET_BRIGHTNESS, 0x02, brightness)
 
+		if self.__effect is not None:
+			self.__effect[effect_attrs.BRIGHTNESS] = brightness
+
 	def freeze(self):
 		effect = self.get_effect()
 		effect[effect_attrs.SPEED] = 11 # change speed to 11 (that stops the "animation" - empirical evidence)
 		self.set_effect(effect)
 
 	def turn_off(self):
+		self.forget_frame()
 		self.__set_effect_impl(control=0x01)
 
+		if self.__effect is not None:
+			self.__control = 0x01
+
 	def is_off(self):
-		self.__send_ctrl(commands.GET_EFFECT)
-		return self.__get_ctrl(8)[1] == 0x01
+		return self.__current_state()[0] == 0x01
 
 	def get_brightness(self):
 		return self.get_effect()[effect_attrs.BRIGHTNESS]
@@ -238,26 +395,27 @@ class ite8291r3:
 		if brightness is None:
 			brightness = self.get_brightness()
 
-		self.set_effect((51, 0, brightness, 0, 0, 1 if save else 0))
+		self.set_effect((USER_MODE, 0, brightness, 0, 0, 1 if save else 0))
 
 	def set_color(self, color, brightness=None, save=False):
+		payload = solid_row(tuple(color))
+
 		self.enable_user_mode(brightness, save)
 
 		for row in range(NUM_ROWS):
-
-			arr = [0] * ROW_BUFFER_LEN
-
-			for i in range(NUM_COLS):
-				arr[ROW_RED_OFFSET + i], arr[ROW_GREEN_OFFSET + i], arr[ROW_BLUE_OFFSET + i] = color
-
-			self.__set_row_index(row)
-			self.__send_data(bytearray(arr))
+			self.__send_row(row, payload)
 
 	def set_palette_color(self, idx, color):
 		if not (1 <= idx <= 7):
 			raise ValueError("palette color index must be between 1 and 7 (inclusive)")
 
+		color = tuple(color)
+		if self.__palette.get(idx) == color:
+			self.skipped_transfers += 1
+			return
+
 		self.__send_ctrl(commands.SET_PALETTE_COLOR, 0, idx, *color)
+		self.__palette[idx] = color
 
 	def restore_default_palette(self):
 		self.set_palette_color(1, (255,   0,   0) ) # red
@@ -271,36 +429,65 @@ class ite8291r3:
 	def test_pattern(self, shift=0, brightness=None, save=False):
 		self.enable_user_mode(brightness, save)
 
-		c = [
-			(255, 0, 0),
-			(0, 255, 0),
-			(0, 0, 255),
-		]
-
 		for row in range(NUM_ROWS):
+			self.__send_row(row, TEST_PATTERN_ROWS[(row + shift) % 3])
 
-			arr = [0] * ROW_BUFFER_LEN
-
-			for i in range(0, NUM_COLS, 3):
-				for j in range(3):
-					arr[ROW_RED_OFFSET + i + j], arr[ROW_GREEN_OFFSET + i + j], arr[ROW_BLUE_OFFSET + i + j] = c[(j + row + shift) % 3]
-
-			self.__set_row_index(row)
-			self.__send_data(bytearray(arr))
+	def set_frame(self, frame, brightness=None, save=False, enable_user_mode=True, force=False):
+		# `frame` is any buffer of NUM_ROWS x NUM_COLS x (red, green, blue) bytes in
+		# row-major order, e.g. a (6, 21, 3) uint8 numpy array, a Pillow RGB image's
+		# tobytes(), or a bytearray; rows identical to the last frame are not sent
+		# again unless `force` is set; returns the number of skipped transfers
+		view = memoryview(frame)
+		if view.itemsize != 1 or view.nbytes != FRAME_LEN:
+			raise ValueError(f"frame must consist of {NUM_ROWS}x{NUM_COLS}x3 bytes")
 
-	def set_key_colors(self, color_map=None, brightness=None, save=False, enable_user_mode=True):
-		color_map = color_map or {}
-		arr = [ [0] * ROW_BUFFER_LEN for _ in range(NUM_ROWS) ]
+		if not view.c_contiguous:
+			view = memoryview(view.tobytes())
 
-		for ((row, col), color) in color_map.items():
-			arr[row][ROW_RED_OFFSET + col], arr[row][ROW_GREEN_OFFSET + col], arr[row][ROW_BLUE_OFFSET + col] = color
+		# one copy into the reused frame buffer; the rows are then filled
+		# through the views made in __init__, without intermediate bytes
+		self.__frame_buffer[:] = view
 
 		if enable_user_mode or save:
 			self.enable_user_mode(brightness, save)
 
+		buf = self.__row_buffer
+		(red, green, blue) = self.__row_planes
+		skipped = 0
+
 		for row in range(NUM_ROWS):
-			self.__set_row_index(row)
-			self.__send_data(bytearray(arr[row]))
+			(frame_red, frame_green, frame_blue) = self.__frame_channels[row]
+			red[:] = frame_red
+			green[:] = frame_green
+			blue[:] = frame_blue
+
+			if not force and self.__known_rows[row] and self.__sent_rows[row] == buf:
+				skipped += 2
+				continue
+
+			self.__send_row(row, buf)
+
+		self.skipped_transfers += skipped
+		return skipped
+
+	def set_key_colors(self, color_map=None, brightness=None, save=False, enable_user_mode=True, force=False):
+		frame = self.__key_frame
+		frame[:] = BLANK_FRAME
+
+		for ((row, col), color) in (color_map or {}).items():
+			idx = row * FRAME_ROW_LEN + col * 3
+			frame[idx], frame[idx + 1], frame[idx + 2] = color
+
+		return self.set_frame(frame, brightness, save, enable_user_mode, force)
+
+	def release(self):
+		# give up the interface claim so that other processes may use the
+		# device; pyusb claims it again on the next transfer
+		self.forget_frame()
+		self.forget_shadow()
+
+		if isinstance(self.usb_dev, usb.core.Device):
+			usb.util.release_interface(self.usb_dev, 1)
 
 def is_supported_revision(vendor_id, product_id, revision):
 	revisions = SUPPORTED_DEVICES.get((vendor_id, product_id))
@@ -311,12 +498,23 @@ def is_supported_device(dev):
 	return is_supported_revision(dev.idVendor, dev.idProduct, dev.bcdDevice)
 
 
-def get(loc=None, traffic_callback=None):
-	if loc:
-		(bus, addr) = loc
-		dev = usb.core.find(bus=bus, address=addr)
-	else:
-		dev = usb.core.find(idVendor=VENDOR_ID, custom_match=is_supported_device)
+def get(loc=None, traffic_callback=None, emulated_device=None):
+	# `emulated_device` (or ITE8291R3_EMULATOR=1) replaces the USB device, see emulator.py
+	if emulated_device is None:
+		from ite8291r3_ctl import emulator
+
+		if emulator.is_enabled():
+			emulated_device = emulator.from_environment()
+
+	if emulated_device is not None:
+		return ite8291r3(emulated_device, emulated_device.OUT_ENDPOINT, traffic_callback)
+
+	with timings.timed("usb.find"):
+		if loc:
+			(bus, addr) = loc
+			dev = usb.core.find(bus=bus, address=addr)
+		else:
+			dev = usb.core.find(idVendor=VENDOR_ID, custom_match=is_supported_device)
 
 	if not dev:
 		raise FileNotFoundError("no suitable device found")
@@ -341,6 +539,11 @@ def get(loc=None, traffic_callback=None):
 	return ite8291r3(dev, out_descriptor, traffic_callback)
 
 def get_all():
+	from ite8291r3_ctl import emulator
+
+	if emulator.is_enabled():
+		return [emulator.from_environment()]
+
 	return usb.core.find(find_all=True,
 			     idVendor=VENDOR_ID,
 				     custom_match=is_supported_device)
@@ -0,0 +1,182 @@
+# SPDX-License-Identifier: GPL-2.0-only
+
+# Long-lived request server: one process keeps the controller handle open and
+# executes CLI requests sent over a Unix socket.
+#
+# Every frame is a 4-byte big-endian payload length followed by a UTF-8 JSON
+# object. Requests are {"argv": ["brightness", "30"]}, responses are
+# {"rc": 0, "stdout": "", "stderr": ""}, mirroring a CLI invocation.
+# {"batch": [[...], ...], "delay": 0.06} runs a command list like the `batch`
+# subcommand and is answered with {"results": [{"rc": ...}, ...]}. A client
+# that hangs up during a batch stops it before its next command.
+
+import json
+import os
+import select
+import socket
+import stat
+import struct
+import time
+
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_LEN = 1 << 20
+MAX_BATCH_DELAY = 5.0
+
+class ProtocolError(ValueError):
+	pass
+
+def _read_exact(stream, length):
+	data = b""
+	while len(data) < length:
+		chunk = stream.read(length - len(data))
+		if not chunk:
+			break
+		data += chunk
+	return data
+
+def read_frame(stream):
+	header = _read_exact(stream, FRAME_HEADER.size)
+	if not header:
+		return None
+	if len(header) != FRAME_HEADER.size:
+		raise ProtocolError("truncated frame header")
+
+	(length, ) = FRAME_HEADER.unpack(header)
+	if length > MAX_FRAME_LEN:
+		raise ProtocolError(f"frame of {length} bytes exceeds the {MAX_FRAME_LEN} byte limit")
+
+	payload = _read_exact(stream, length)
+	if len(payload) != length:
+		raise ProtocolError("truncated frame payload")
+
+	try:
+		message = json.loads(payload.decode("utf-8"))
+	except (UnicodeDecodeError, json.JSONDecodeError) as e:
+		raise ProtocolError(f"malformed frame: {e}")
+
+	if not isinstance(message, dict):
+		raise ProtocolError("frame must contain a JSON object")
+
+	return message
+
+def write_frame(stream, message):
+	payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+	stream.write(FRAME_HEADER.pack(len(payload)) + payload)
+	stream.flush()
+
+def is_argv(argv):
+	return isinstance(argv, list) and len(argv) > 0 and all(isinstance(x, str) for x in argv)
+
+def request_argv(message):
+	argv = message.get("argv")
+	if not is_argv(argv):
+		raise ProtocolError("'argv' must be a non-empty list of strings")
+	return argv
+
+def request_batch(message):
+	commands = message.get("batch")
+	if not isinstance(commands, list) or not commands or not all(map(is_argv, commands)):
+		raise ProtocolError("'batch' must be a non-empty list of argument lists")
+
+	delay = message.get("delay", 0)
+	if isinstance(delay, bool) or not isinstance(delay, (int, float)) or not (0 <= delay <= MAX_BATCH_DELAY):
+		raise ProtocolError(f"'delay' must be between 0 and {MAX_BATCH_DELAY} seconds")
+
+	return commands, delay
+
+def result_object(result):
+	(rc, stdout, stderr) = result
+	return {"rc": rc, "stdout": stdout, "stderr": stderr}
+
+def peer_closed(conn, timeout):
+	"""Wait up to `timeout` seconds; True as soon as the client hangs up."""
+	deadline = time.monotonic() + timeout
+	if select.select([conn], [], [], timeout)[0]:
+		try:
+			if conn.recv(1, socket.MSG_PEEK) == b"":
+				return True
+		except OSError:
+			return True
+		# a pipelined request, not a hang-up; finish the pause
+		time.sleep(max(0, deadline - time.monotonic()))
+	return False
+
+def serve_stream(executor, rfile, wfile, hung_up=None):
+	while True:
+		try:
+			message = read_frame(rfile)
+			if message is None:
+				return
+			if "batch" in message:
+				(commands, delay) = request_batch(message)
+				argv = None
+			else:
+				argv = request_argv(message)
+		except ProtocolError as e:
+			write_frame(wfile, {"rc": 2, "stdout": "", "stderr": f"invalid request: {e}"})
+			return
+
+		if argv is None:
+			results = [result_object(r) for r in executor.batch(commands, delay, hung_up)]
+			write_frame(wfile, {"results": results})
+		else:
+			write_frame(wfile, result_object(executor(argv)))
+
+def _claim_socket_path(path):
+	try:
+		info = os.lstat(path)
+	except FileNotFoundError:
+		return
+
+	if not stat.S_ISSOCK(info.st_mode):
+		raise FileExistsError(f"{path} exists and is not a socket")
+
+	probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		probe.connect(path)
+	except (ConnectionRefusedError, FileNotFoundError):
+		# left behind by a server that did not shut down cleanly
+		os.unlink(path)
+	else:
+		raise FileExistsError(f"another server is already listening on {path}")
+	finally:
+		probe.close()
+
+def serve_socket(executor, path, idle_timeout=None):
+	_claim_socket_path(path)
+
+	listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	old_umask = os.umask(0o177)
+	try:
+		listener.bind(path)
+	finally:
+		os.umask(old_umask)
+
+	bound = os.stat(path)
+
+	try:
+		listener.listen(8)
+		listener.settimeout(idle_timeout)
+
+		while True:
+			try:
+				conn, _ = listener.accept()
+			except socket.timeout:
+				return
+
+			with conn:
+				conn.settimeout(None)
+				try:
+					with conn.makefile("rb") as rfile, conn.makefile("wb") as wfile:
+						serve_stream(executor, rfile, wfile, lambda timeout: peer_closed(conn, timeout))
+				except OSError:
+					# the client went away; the next one may still be served
+					pass
+	finally:
+		listener.close()
+		try:
+			current = os.stat(path)
+			if (current.st_dev, current.st_ino) == (bound.st_dev, bound.st_ino):
+				os.unlink(path)
+		except FileNotFoundError:
+			pass
@@ -0,0 +1,56 @@
+# SPDX-License-Identifier: GPL-2.0-only
+
+# Time spent per phase of a CLI run: module imports, device lookup, and each
+# kind of USB transfer. ITE8291R3_TIMINGS_FD=N makes the CLI write the totals
+# as one JSON object to that inherited file descriptor when it exits, so a
+# caller can tell where the time of a request went. The phase names are fixed,
+# so the table stays small however many transfers a run makes.
+
+import json
+import os
+import time
+
+ENV_FD = "ITE8291R3_TIMINGS_FD"
+
+# phase -> [count, total seconds, slowest seconds]
+phases = {}
+
+def record(phase, seconds):
+	entry = phases.get(phase)
+	if entry is None:
+		phases[phase] = [1, seconds, seconds]
+	else:
+		entry[0] += 1
+		entry[1] += seconds
+		if seconds > entry[2]:
+			entry[2] = seconds
+
+class timed:
+	__slots__ = ("phase", "started")
+
+	def __init__(self, phase):
+		self.phase = phase
+
+	def __enter__(self):
+		self.started = time.monotonic()
+
+	def __exit__(self, *exc):
+		record(self.phase, time.monotonic() - self.started)
+
+def report():
+	return {
+		phase: {"count": count, "total": round(total, 6), "max": round(slowest, 6)}
+		for (phase, (count, total, slowest)) in phases.items()
+	}
+
+def write_report(environ=os.environ):
+	fd = environ.get(ENV_FD)
+	if not fd:
+		return
+
+	try:
+		fd = int(fd)
+		os.write(fd, json.dumps(report(), sort_keys=True).encode())
+		os.close(fd)
+	except (ValueError, OSError):
+		pass
@@ -53,6 +53,8 @@ WRAPPER_PATH = Path("/usr/local/bin/xmg-backlight")
 DRIVER_WRAPPER_PATH = Path("/usr/local/bin/ite8291r3-ctl")
 DESKTOP_PATH = Path("/usr/share/applications/XMG-Backlight-Management.desktop")
 UDEV_RULE_PATH = Path("/etc/udev/rules.d/70-xmg-backlight.rules")
+DRIVER_SERVICE_NAME = "xmg-backlight-driver.service"
+DRIVER_SERVICE_PATH = Path("/usr/local/lib/systemd/user") / DRIVER_SERVICE_NAME
 LEGACY_UDEV_RULE_PATH = Path("/etc/udev/rules.d/99-ite8291.rules")
 LEGACY_SYSTEM_AUTOSTART = Path(
     "/etc/xdg/autostart/xmg-backlight-restore.desktop"
@@ -512,6 +514,26 @@ def _gui_wrapper_contents() -> str:
     )
 
 
+def _driver_service_contents() -> str:
+    # No [Install] section: the GUI and the automation service start it on
+    # demand, and the clients fall back to spawning the driver without it.
+    return (
+        "# Managed by XMG Backlight\n"
+        "[Unit]\n"
+        "Description=XMG keyboard backlight driver server\n"
+        "StartLimitIntervalSec=60\n"
+        "StartLimitBurst=3\n\n"
+        "[Service]\n"
+        "Type=simple\n"
+        "ExecStartPre=/usr/bin/mkdir -p -m 0700 %h/.config/backlight-linux\n"
+        f"ExecStart={DRIVER_WRAPPER_PATH} serve --socket "
+        "%h/.config/backlight-linux/driver.sock\n"
+        "Restart=on-failure\n"
+        "RestartSec=5\n"
+        "NoNewPrivileges=yes\n"
+    )
+
+
 def _desktop_contents() -> str:
     return (
         "[Desktop Entry]\n"
@@ -646,6 +668,7 @@ def install(*, skip_update_check: bool) -> None:
             legacy_validator=validator if adopting_legacy else None,
         )
     assert_replaceable_file(UDEV_RULE_PATH, previous_manifest)
+    assert_replaceable_file(DRIVER_SERVICE_PATH, previous_manifest)
     if LEGACY_SYSTEM_AUTOSTART.exists() or LEGACY_SYSTEM_AUTOSTART.is_symlink():
         assert_replaceable_file(
             LEGACY_SYSTEM_AUTOSTART,
@@ -699,6 +722,12 @@ def install(*, skip_update_check: bool) -> None:
                 _stage_text(file_stage, "udev", _udev_contents()),
                 0o644,
             ),
+            DRIVER_SERVICE_PATH: (
+                _stage_text(
+                    file_stage, DRIVER_SERVICE_NAME, _driver_service_contents()
+                ),
+                0o644,
+            ),
         }
         file_hashes = {
             str(target): sha256_file(staged)
@@ -881,6 +910,7 @@ def _preflight_uninstall(
         DRIVER_WRAPPER_PATH,
         DESKTOP_PATH,
         UDEV_RULE_PATH,
+        DRIVER_SERVICE_PATH,
     }
     allowed_directories = {VENV_DIR, SHARE_DIR}
     manifest_files = {Path(raw_path) for raw_path in manifest.get("files", {})}
@@ -4,6 +4,7 @@ import time
 
 from PySide6 import QtCore, QtGui, QtWidgets
 
+from . import metrics
 from .driver import format_log
 
 class ActivityLogMixin:
@@ -28,6 +29,10 @@ class ActivityLogMixin:
         if hasattr(self, "log_window") and self.log_window.isVisible():
             self._fit_log_window()
 
+    def log_latency(self, phases):
+        if phases:
+            self.log("Timing: " + metrics.format_phases(phases), level="info")
+
     def on_log_toggle_toggled(self, checked):
         if not hasattr(self, "log_window"):
             return
@@ -26,11 +26,15 @@ from .services import (
     is_autostart_enabled,
     reconcile_automation_service,
 )
+from .signal_notifier import SignalNotifier
+from .state_cache import ControllerStateCache
 from .storage import (
     StorageFormatError,
     acquire_single_instance_lock,
     ensure_profile_store,
+    flush_pending_writes,
     load_settings,
+    set_durability,
 )
 from .theme_mixin import ThemeMixin
 from .translations import detect_system_language, load_translations
@@ -88,6 +92,8 @@ class Main(
         self.is_off = False
         self.last_brightness = 40
         self.last_static_color = "white"
+        # Last controller state seen or written, shared with the tray.
+        self.state_cache = ControllerStateCache()
         self._suppress = False
         self._ignore_profile_events = False
         self._updating_profile_combo = False
@@ -97,6 +103,7 @@ class Main(
         self.hardware_pool.setMaxThreadCount(1)
         self._hardware_tasks = set()
         self._hardware_generations = {}
+        self._hardware_mailbox = {}
         self._hardware_shutdown = False
         self.profile_store = ensure_profile_store()
         self.active_profile_name = self.profile_store["active"]
@@ -576,9 +583,10 @@ class Main(
 
         self.brightness_timer = QtCore.QTimer(self)
         self.brightness_timer.setSingleShot(True)
-        self.brightness_timer.setInterval(240)
+        self.brightness_timer.setInterval(16)
         self.brightness_timer.timeout.connect(self.apply_brightness_only)
 
+        self.start_driver_worker()
         self.detect_device()
         self.apply_styles()
         if self.profile_data:
@@ -637,6 +645,18 @@ class Main(
         self._last_sync_ts = 0.0
         self.setup_tray_icon(enable_tray=enable_tray)
 
+
+def install_signal_handlers(app, on_terminate):
+    """Call `on_terminate` on the GUI thread when SIGTERM arrives.
+
+    Returns the notifier, which the caller closes once the loop has ended.
+    No timer is involved, so the idle loop does not wake up for it.
+    """
+    termination = SignalNotifier((signal.SIGTERM,), app)
+    termination.received.connect(lambda _signum: on_terminate())
+    return termination
+
+
 def main():
     app = QtWidgets.QApplication([])
     language = detect_system_language()
@@ -669,6 +689,10 @@ def main():
         )
         return 0
 
+    # Interactive saves come in bursts; fsync them as a group. The daemon
+    # keeps the strict default.
+    set_durability("grouped")
+    app.aboutToQuit.connect(flush_pending_writes)
     try:
         w = Main()
     except (OSError, StorageFormatError) as exc:
@@ -679,24 +703,13 @@ def main():
         )
         return 1
     app.aboutToQuit.connect(w.shutdown_hardware_tasks)
-    previous_sigterm_handler = signal.getsignal(signal.SIGTERM)
-
-    def request_shutdown(_signum, _frame):
-        QtCore.QTimer.singleShot(0, w.on_tray_quit)
-
-    signal.signal(signal.SIGTERM, request_shutdown)
-    # Periodically return control to Python so SIGTERM is dispatched while Qt
-    # owns the main event loop.
-    signal_timer = QtCore.QTimer(app)
-    signal_timer.setInterval(100)
-    signal_timer.timeout.connect(lambda: None)
-    signal_timer.start()
+    termination = install_signal_handlers(app, w.on_tray_quit)
     if not (w.settings.get("start_in_tray", False) and w.tray_supported and w.tray_icon):
         w.show()
     try:
         return app.exec()
     finally:
-        signal.signal(signal.SIGTERM, previous_sigterm_handler)
+        termination.close()
 
 
 if __name__ == "__main__":
@@ -6,6 +6,8 @@ import threading
 
 from PySide6 import QtCore
 
+from .cancellation import CancelToken, activate
+
 
 class TaskSignals(QtCore.QObject):
     completed = QtCore.Signal(object)
@@ -21,6 +23,7 @@ class FunctionTask(QtCore.QRunnable):
         self.signals = TaskSignals()
         self._cancelled = threading.Event()
         self._started = threading.Event()
+        self.cancel_token = CancelToken()
 
     def cancel_if_pending(self):
         if self._started.is_set():
@@ -28,6 +31,11 @@ class FunctionTask(QtCore.QRunnable):
         self._cancelled.set()
         return True
 
+    def cancel(self):
+        """Cancel a pending task, or ask a running one to stop early."""
+        self._cancelled.set()
+        self.cancel_token.cancel()
+
     @QtCore.Slot()
     def run(self):
         self._started.set()
@@ -35,7 +43,8 @@ class FunctionTask(QtCore.QRunnable):
             self.signals.finished.emit()
             return
         try:
-            result = self.function()
+            with activate(self.cancel_token):
+                result = self.function()
         except Exception as exc:
             self.signals.failed.emit(str(exc))
         else:
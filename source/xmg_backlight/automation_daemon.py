@@ -8,11 +8,14 @@ import time
 from PySide6 import QtCore, QtDBus
 
 from .automation_core import AutomationController, required_bus_signals
+from .driver import PRIORITY_AUTOMATION, set_lock_priority
 from .restore_profile import apply_profile
+from .services import start_driver_service
 from .storage import (
     active_profile_from_raw_store,
     load_settings,
     read_profile_file,
+    settings_snapshot,
     switch_active_profile,
 )
 
@@ -93,11 +96,16 @@ class SystemBusAdapter(QtCore.QObject):
 
 
 def main() -> int:
+    set_lock_priority(PRIORITY_AUTOMATION)
+    started, message = start_driver_service()
+    if not started:
+        log(f"Driver server not started: {message}")
     app = QtCore.QCoreApplication([])
     settings = load_settings()
     resume_enabled, power_enabled = required_bus_signals(settings)
     controller = AutomationController(
-        settings_loader=load_settings,
+        # read on every bus event; an unchanged state costs one lstat()
+        settings_loader=settings_snapshot,
         profile_switcher=switch_active_profile,
         active_profile_loader=load_active_profile,
         profile_applier=apply_profile,
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from PySide6 import QtCore, QtWidgets
 
+from . import metrics
+from .commands import expected_keyboard_state
 from .constants import AUTOSTART_ENTRY
 from .restore_profile import apply_profile
 from .services import (
@@ -170,8 +172,9 @@ class AutomationMixin:
         )
         profile = dict(self.profile_data)
 
-        def completed(result):
-            success, message = result
+        def completed(outcome):
+            (success, message), phases = outcome
+            self.log_latency(phases)
             if success:
                 self.is_off = int(profile.get("brightness", 40)) <= 0
                 self.update_power_button()
@@ -179,8 +182,17 @@ class AutomationMixin:
             if completion:
                 completion(success)
 
+        def apply():
+            with metrics.collect() as phases:
+                result = apply_profile(profile)
+            # apply_profile verifies the result, so a success is a known state
+            self.known_state = (
+                expected_keyboard_state(profile) if result[0] else None
+            )
+            return result, phases
+
         self.run_hardware_task(
-            lambda: apply_profile(profile),
+            apply,
             completed,
             task_key="write",
             supersede=True,
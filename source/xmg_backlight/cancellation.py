@@ -0,0 +1,108 @@
+"""Cooperative cancellation for hardware tasks.
+
+A background task runs with a token activated on its thread. Driver calls
+check it between commands, give up waiting for the hardware lock, and
+terminate a driver process they started once the token is cancelled.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+
+CANCELLED_MESSAGE = "Superseded by a newer request."
+
+
+class TaskCancelled(Exception):
+    def __init__(self, message: str = CANCELLED_MESSAGE, *, output=None):
+        super().__init__(message)
+        # what a terminated driver process printed before it stopped
+        self.output = output
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = tuple(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to `timeout` seconds; True when cancelled meanwhile."""
+        return self._event.wait(timeout)
+
+    @contextmanager
+    def on_cancel(self, callback):
+        """Call `callback` (from the cancelling thread) if cancelled in the block."""
+        with self._lock:
+            already = self._event.is_set()
+            if not already:
+                self._callbacks.append(callback)
+        if already:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+
+_active = threading.local()
+
+
+def current() -> CancelToken | None:
+    return getattr(_active, "token", None)
+
+
+@contextmanager
+def activate(token: CancelToken):
+    """Make `token` the one driver calls on this thread observe."""
+    outer = current()
+    _active.token = token
+    try:
+        yield token
+    finally:
+        _active.token = outer
+
+
+def cancelled() -> bool:
+    token = current()
+    return token is not None and token.cancelled
+
+
+def raise_if_cancelled() -> None:
+    if cancelled():
+        raise TaskCancelled()
+
+
+def sleep(seconds: float) -> bool:
+    """time.sleep() that ends early on cancellation; True when cancelled."""
+    token = current()
+    if token is None:
+        time.sleep(seconds)
+        return False
+    return token.wait(seconds)
+
+
+@contextmanager
+def on_cancel(callback):
+    token = current()
+    if token is None:
+        yield
+        return
+    with token.on_cancel(callback):
+        yield
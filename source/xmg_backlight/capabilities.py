@@ -52,6 +52,39 @@ EFFECT_CAPABILITIES = {
 
 EFFECTS = ("static", *EFFECT_CAPABILITIES.keys())
 
+# Controller ids as reported by `query --json`; they mirror the driver's tables.
+EFFECT_IDS = {
+    "static": 51,
+    "breathing": 0x02,
+    "wave": 0x03,
+    "random": 0x04,
+    "rainbow": 0x05,
+    "ripple": 0x06,
+    "marquee": 0x09,
+    "raindrop": 0x0A,
+    "aurora": 0x0E,
+    "fireworks": 0x11,
+}
+
+COLOR_IDS = {
+    "none": 0,
+    "red": 1,
+    "orange": 2,
+    "yellow": 3,
+    "green": 4,
+    "blue": 5,
+    "teal": 6,
+    "purple": 7,
+    "random": 8,
+}
+
+DIRECTION_IDS = {"none": 0, "right": 1, "left": 2, "up": 3, "down": 4}
+
+# Values the driver uses for options a command leaves out.
+DEFAULT_SPEED = 5
+DEFAULT_COLOR = "random"
+DEFAULT_DIRECTION = "right"
+
 
 def capability_for(mode: str) -> EffectCapability:
     return EFFECT_CAPABILITIES.get(mode, EffectCapability())
@@ -2,11 +2,18 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+import json
+from dataclasses import dataclass, fields
 
 from .capabilities import (
+    COLOR_IDS,
+    DEFAULT_COLOR,
+    DEFAULT_DIRECTION,
+    DEFAULT_SPEED,
+    DIRECTION_IDS,
     DIRECTIONS,
     DYNAMIC_COLORS,
+    EFFECT_IDS,
     EFFECTS,
     STATIC_COLORS,
     capability_for,
@@ -18,9 +25,51 @@ from .validation import clamp_int, sanitize_choice
 class KeyboardState:
     brightness: int | None
     power: str | None
+    # Only reported by `query --json`; None when unknown or not relevant.
+    effect: int | None = None
+    speed: int | None = None
+    color: int | None = None
+    direction_or_reactive: int | None = None
+
+
+EFFECT_FIELDS = ("effect", "speed", "color", "direction_or_reactive")
+
+STATE_QUERY = ["query", "--json"]
+# Drivers older than `query --json` only report brightness and power.
+LEGACY_STATE_QUERY = ["query", "--brightness", "--state"]
+
+
+def json_query_unsupported(rc: int, err: str) -> bool:
+    return rc == 2 and "--json" in (err or "")
+
+
+def _optional_int(value) -> int | None:
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    return value
+
+
+def _parse_json_state(output: str) -> KeyboardState | None:
+    try:
+        data = json.loads(output)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    power = data.get("power")
+    return KeyboardState(
+        brightness=_optional_int(data.get("brightness")),
+        power=power if power in {"on", "off"} else None,
+        **{name: _optional_int(data.get(name)) for name in EFFECT_FIELDS},
+    )
 
 
 def parse_keyboard_state(output: str) -> KeyboardState:
+    text = (output or "").strip()
+    if text.startswith("{"):
+        state = _parse_json_state(text)
+        if state is not None:
+            return state
     brightness = None
     power = None
     for raw_line in (output or "").splitlines():
@@ -38,11 +87,91 @@ def parse_keyboard_state(output: str) -> KeyboardState:
     return KeyboardState(brightness=brightness, power=power)
 
 
-def state_matches_desired(state: KeyboardState, desired_brightness: int) -> bool:
+def state_matches_desired(
+    state: KeyboardState,
+    desired_brightness: int,
+    expected: KeyboardState | None = None,
+) -> bool:
     desired = clamp_int(desired_brightness, 0, 50, 40)
     if desired == 0:
         return state.power == "off"
-    return state.power == "on" and state.brightness == desired
+    if state.power != "on" or state.brightness != desired:
+        return False
+    if expected is None:
+        return True
+    # Fields the driver did not report (text output) or the effect does not
+    # use are not compared.
+    for name in EFFECT_FIELDS:
+        wanted = getattr(expected, name)
+        actual = getattr(state, name)
+        if wanted is not None and actual is not None and wanted != actual:
+            return False
+    return True
+
+
+def describe_state(state: KeyboardState) -> str:
+    parts = [
+        f"{field.name}={getattr(state, field.name)}"
+        for field in fields(state)
+        if getattr(state, field.name) is not None
+    ]
+    return ", ".join(parts) or "nothing"
+
+
+def _effect_options(profile: dict, mode: str) -> dict:
+    """Options passed to `effect`; None or "none" leaves the driver default."""
+    capability = capability_for(mode)
+    options = {"speed": None, "color": "none", "direction": "none", "reactive": False}
+    if capability.speed:
+        options["speed"] = clamp_int(profile.get("speed"), 0, 10, DEFAULT_SPEED)
+    if capability.color:
+        color = profile.get("color") or "none"
+        if color != "none":
+            color = sanitize_choice(color, DYNAMIC_COLORS, "none")
+        options["color"] = color
+    if capability.reactive and bool(profile.get("reactive")):
+        options["reactive"] = True
+    elif capability.direction:
+        options["direction"] = sanitize_choice(
+            profile.get("direction"), DIRECTIONS, "none"
+        )
+    return options
+
+
+def expected_keyboard_state(profile: dict) -> KeyboardState:
+    brightness = clamp_int(profile.get("brightness"), 0, 50, 40)
+    if brightness == 0:
+        return KeyboardState(brightness=None, power="off")
+
+    mode = sanitize_choice(profile.get("mode"), EFFECTS, "static")
+    if mode == "static":
+        return KeyboardState(brightness, "on", effect=EFFECT_IDS["static"])
+
+    capability = capability_for(mode)
+    options = _effect_options(profile, mode)
+    color = None
+    if capability.color:
+        color = COLOR_IDS[
+            options["color"] if options["color"] != "none" else DEFAULT_COLOR
+        ]
+    direction_or_reactive = None
+    if options["reactive"]:
+        direction_or_reactive = 1
+    elif capability.direction:
+        direction = options["direction"]
+        direction_or_reactive = DIRECTION_IDS[
+            direction if direction != "none" else DEFAULT_DIRECTION
+        ]
+    elif capability.reactive:
+        direction_or_reactive = 0
+    return KeyboardState(
+        brightness,
+        "on",
+        effect=EFFECT_IDS[mode],
+        speed=options["speed"],
+        color=color,
+        direction_or_reactive=direction_or_reactive,
+    )
 
 
 def build_profile_commands(profile: dict) -> list[list[str]]:
@@ -58,25 +187,50 @@ def build_profile_commands(profile: dict) -> list[list[str]]:
         commands.append(["brightness", str(brightness)])
         return commands
 
-    capability = capability_for(mode)
+    options = _effect_options(profile, mode)
     args = ["effect", "-b", str(brightness)]
-    if capability.speed:
-        speed = clamp_int(profile.get("speed"), 0, 10, 5)
-        if speed != 5:
-            args.extend(["-s", str(speed)])
-    if capability.color:
-        color = profile.get("color") or "none"
-        if color != "none":
-            color = sanitize_choice(color, DYNAMIC_COLORS, "none")
-        if color != "none":
-            args.extend(["-c", color])
-    if capability.reactive and bool(profile.get("reactive")):
+    if options["speed"] is not None and options["speed"] != DEFAULT_SPEED:
+        args.extend(["-s", str(options["speed"])])
+    if options["color"] != "none":
+        args.extend(["-c", options["color"]])
+    if options["reactive"]:
         args.append("-r")
-    elif capability.direction:
-        direction = sanitize_choice(profile.get("direction"), DIRECTIONS, "none")
-        if direction != "none":
-            args.extend(["-d", direction])
+    elif options["direction"] != "none":
+        args.extend(["-d", options["direction"]])
     args.append(mode)
     commands.append(args)
     commands.append(["brightness", str(brightness)])
     return commands
+
+
+def plan_profile_commands(
+    profile: dict, current: KeyboardState | None
+) -> list[list[str]]:
+    """Commands that take the controller from `current` to `profile`.
+
+    Without a known current effect this is the full `off`-first sequence of
+    build_profile_commands. Otherwise the reset is only kept when the effect
+    changes, a changed effect setting rewrites the effect in place, and a
+    changed brightness alone becomes a single `brightness` command.
+    """
+    commands = build_profile_commands(profile)
+    target = expected_keyboard_state(profile)
+    if current is None or current.power not in {"on", "off"}:
+        return commands
+    if target.power == "off":
+        return [] if current.power == "off" else commands
+    if current.power == "off":
+        # Setting an effect switches the backlight back on; no reset needed.
+        return commands[1:]
+    if current.effect is None or current.effect != target.effect:
+        return commands
+    if target.effect == EFFECT_IDS["static"]:
+        # The row colours cannot be read back, so the colour is always rewritten.
+        return commands[1:]
+    for name in EFFECT_FIELDS[1:]:
+        wanted = getattr(target, name)
+        if wanted is not None and getattr(current, name) != wanted:
+            return commands[1:]
+    if current.brightness != target.brightness:
+        return [["brightness", str(target.brightness)]]
+    return []
@@ -22,6 +22,10 @@ STATE_PATH = os.path.join(CONFIG_DIR, "state.json")
 PROFILE_PATH = os.path.join(CONFIG_DIR, "profile.json")
 SETTINGS_PATH = os.path.join(CONFIG_DIR, "settings.json")
 LOCK_FILE_PATH = os.path.join(CONFIG_DIR, "app.lock")
+DRIVER_SOCKET_PATH = os.path.join(CONFIG_DIR, "driver.sock")
+# Installed by install.py; serves DRIVER_SOCKET_PATH.
+DRIVER_SERVICE_NAME = "xmg-backlight-driver.service"
+PACING_PATH = os.path.join(CONFIG_DIR, "pacing.json")
 TRANSLATIONS_DIR = os.path.join(BASE_DIR, "translations")
 INSTALLER_LOG_PATH = "/var/log/xmg-backlight/installer.log"
 AUTOSTART_DIR = os.path.join(os.path.expanduser("~"), ".config", "autostart")
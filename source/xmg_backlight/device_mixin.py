@@ -5,8 +5,25 @@ import time
 from PySide6 import QtCore
 
 from .async_tasks import submit_task
-from .commands import parse_keyboard_state
-from .driver import format_cli_error, run_cmd
+from .commands import (
+    LEGACY_STATE_QUERY,
+    STATE_QUERY,
+    json_query_unsupported,
+    parse_keyboard_state,
+)
+from .driver import (
+    FEATURE_JSON_QUERY,
+    PRIORITY_DIAGNOSTICS,
+    ServerTransport,
+    SubprocessTransport,
+    WorkerTransport,
+    driver_supports,
+    format_cli_error,
+    mark_unsupported,
+    run_cmd,
+    set_driver_transports,
+)
+from .services import start_driver_service
 
 class DeviceMixin:
     def showEvent(self, event):
@@ -18,21 +35,44 @@ class DeviceMixin:
         if event.type() == QtCore.QEvent.WindowActivate:
             self.request_state_sync()
 
+    @property
+    def known_state(self):
+        # The automation daemon, restore_profile and the Fn keys change the
+        # controller from other processes; only a recent state is trusted.
+        return self.state_cache.fresh()
+
+    @known_state.setter
+    def known_state(self, state):
+        self.state_cache.update(state)
+
     def request_state_sync(self, min_interval=0.5):
+        # A recent query or write answers without touching the hardware.
+        cached = self.state_cache.fresh()
+        if cached is not None:
+            self.show_keyboard_state(cached)
+            return
         now = time.monotonic()
         if (now - self._last_sync_ts) < min_interval:
             return
         self._last_sync_ts = now
         self.sync_state_from_device()
 
+    def query_device_state(self):
+        quiet = {"log_cmd": False, "log_stdout": False, "log_stderr": False}
+        if not driver_supports(FEATURE_JSON_QUERY):
+            result = run_cmd(LEGACY_STATE_QUERY, **quiet)
+        else:
+            result = run_cmd(STATE_QUERY, **quiet)
+            if json_query_unsupported(result[0], result[2]):
+                mark_unsupported(FEATURE_JSON_QUERY)
+                result = run_cmd(LEGACY_STATE_QUERY, **quiet)
+        # Runs on the hardware thread; the planner starts from this state.
+        self.known_state = parse_keyboard_state(result[1]) if result[0] == 0 else None
+        return result
+
     def sync_state_from_device(self):
         self.run_hardware_task(
-            lambda: run_cmd(
-                ["query", "--brightness", "--state"],
-                log_cmd=False,
-                log_stdout=False,
-                log_stderr=False,
-            ),
+            self.query_device_state,
             self._on_state_sync_completed,
             task_key="sync",
             supersede=True,
@@ -46,6 +86,16 @@ class DeviceMixin:
             return
 
         parsed = parse_keyboard_state(out)
+        self.show_keyboard_state(parsed)
+        parts = []
+        if parsed.power:
+            parts.append(f"state={parsed.power}")
+        if parsed.brightness is not None:
+            parts.append(f"brightness={parsed.brightness}")
+        suffix = ", ".join(parts) if parts else self.tr("log.unknown_state")
+        self.log(self.tr("log.synced_device_state", details=suffix))
+
+    def show_keyboard_state(self, parsed):
         brightness = parsed.brightness
         state = parsed.power
 
@@ -63,13 +113,6 @@ class DeviceMixin:
         elif state == "on":
             self.is_off = False
         self.update_power_button()
-        parts = []
-        if state:
-            parts.append(f"state={state}")
-        if brightness is not None:
-            parts.append(f"brightness={brightness}")
-        suffix = ", ".join(parts) if parts else self.tr("log.unknown_state")
-        self.log(self.tr("log.synced_device_state", details=suffix))
 
     def run_cli(self, args, **kwargs):
         return run_cmd(args, log_cb=self.log, **kwargs)
@@ -81,16 +124,30 @@ class DeviceMixin:
         *,
         task_key=None,
         supersede=False,
+        mailbox=False,
     ):
+        # supersede cancels earlier tasks of task_key, a running one included.
+        # mailbox lets a running one finish instead: at most one runs and one
+        # is parked, and a newer submission replaces the parked one.
         if self._hardware_shutdown:
             return None
         generation = self._hardware_generations.get(task_key, 0)
-        if task_key is not None and supersede:
+        if task_key is not None and (supersede or mailbox):
             generation += 1
             self._hardware_generations[task_key] = generation
+            self._hardware_mailbox.pop(task_key, None)
+            running = False
             for pending in tuple(self._hardware_tasks):
-                if pending.task_key == task_key:
-                    pending.cancel_if_pending()
+                if pending.task_key != task_key:
+                    continue
+                if not mailbox:
+                    # a running one stops at its next command boundary
+                    pending.cancel()
+                elif not pending.cancel_if_pending():
+                    running = True
+            if mailbox and running:
+                self._hardware_mailbox[task_key] = (function, completed)
+                return None
 
         def is_current():
             return (
@@ -119,24 +176,52 @@ class DeviceMixin:
         )
         self._hardware_tasks.add(task)
         task.signals.finished.connect(
-            lambda current=task: self._hardware_tasks.discard(current)
+            lambda current=task: self._on_hardware_task_finished(current)
         )
         self.hardware_pool.start(task)
         return task
 
+    def _on_hardware_task_finished(self, task):
+        self._hardware_tasks.discard(task)
+        parked = self._hardware_mailbox.pop(task.task_key, None)
+        if parked is not None:
+            function, completed = parked
+            self.run_hardware_task(
+                function,
+                completed,
+                task_key=task.task_key,
+                mailbox=True,
+            )
+
+    def start_driver_worker(self):
+        # A warm driver process, so interactive changes skip interpreter start-up.
+        self.driver_worker = WorkerTransport()
+        set_driver_transports(
+            [ServerTransport(), self.driver_worker, SubprocessTransport()]
+        )
+        self.driver_worker.start()
+        # The shared server also serves restore_profile and the automation
+        # daemon; until it listens, requests go to the worker.
+        started, message = start_driver_service()
+        if not started:
+            self.log(f"Driver server not started: {message}", level="info")
+
     def shutdown_hardware_tasks(self):
         if self._hardware_shutdown:
             return
         self._hardware_shutdown = True
+        self._hardware_mailbox.clear()
         for task in tuple(self._hardware_tasks):
-            task.cancel_if_pending()
+            task.cancel()
         self.hardware_pool.waitForDone(15000)
         self._hardware_tasks.clear()
+        if hasattr(self, "driver_worker"):
+            self.driver_worker.stop()
 
     def detect_device(self):
         self.log("$ query --devices", level="cmd")
         self.run_hardware_task(
-            lambda: run_cmd(["query", "--devices"]),
+            lambda: run_cmd(["query", "--devices"], priority=PRIORITY_DIAGNOSTICS),
             self._on_device_detection_completed,
             task_key="detect",
             supersede=True,
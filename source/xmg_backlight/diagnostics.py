@@ -10,6 +10,7 @@ import tempfile
 import zipfile
 from datetime import datetime
 
+from . import metrics
 from .constants import (
     APP_VERSION,
     AUTOMATION_SERVICE_NAME,
@@ -78,7 +79,7 @@ def create_diagnostics_archive(
             if journal_error:
                 errors.append(f"automation-service.log: {journal_error}")
 
-            for filename in ("state.json",):
+            for filename in ("state.json", "state.json.journal"):
                 source = os.path.join(config_dir, filename)
                 if os.path.isfile(source):
                     try:
@@ -87,6 +88,12 @@ def create_diagnostics_archive(
                     except OSError as exc:
                         errors.append(f"config/{filename}: {exc}")
 
+            archive.writestr(
+                "latency-metrics.json",
+                json.dumps(metrics.snapshot(), indent=2, sort_keys=True) + "\n",
+            )
+            included.append("latency-metrics.json")
+
             lines = list(activity_lines)
             if lines:
                 archive.writestr("activity-log.txt", "\n".join(lines) + "\n")
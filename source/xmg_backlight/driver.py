@@ -4,18 +4,49 @@ from __future__ import annotations
 
 import fcntl
 import html
+import json
 import os
+import select
 import shlex
+import socket
+import stat
+import struct
 import subprocess
+import threading
 import time
+from collections.abc import Mapping
 from contextlib import contextmanager
+from dataclasses import dataclass
 
-from .constants import CONFIG_DIR, DRIVER_WRAPPER_PATH
-from .storage import ensure_config_dir
+from . import cancellation, metrics
+from .constants import CONFIG_DIR, DRIVER_SOCKET_PATH, DRIVER_WRAPPER_PATH
+from .storage import StorageFormatError, ensure_config_dir, read_pacing_file
 
 COMMAND_TIMEOUT_SECONDS = 6.0
 HARDWARE_LOCK_TIMEOUT_SECONDS = 8.0
 HARDWARE_LOCK_PATH = os.path.join(CONFIG_DIR, "hardware.lock")
+# Length prefix of the `ite8291r3-ctl serve` wire format.
+SERVER_FRAME_HEADER = struct.Struct("!I")
+SERVER_MAX_FRAME_LEN = 1 << 20
+# The driver writes its per-phase timings to this inherited descriptor.
+DRIVER_TIMINGS_ENV = "ITE8291R3_TIMINGS_FD"
+# Pause between sequence commands when the controller was never calibrated.
+DEFAULT_INTER_COMMAND_DELAY = 0.06
+# Calibrated settle times are stretched by this factor before use.
+PACING_MARGIN = 1.5
+CONTROLLER_VENDOR_ID = "048d"
+USB_SYSFS_DIR = "/sys/bus/usb/devices"
+# Result code of a request abandoned because a newer one superseded it.
+CANCELLED_RC = 130
+
+# The controller is built in, so its sysfs identity is read once per process.
+_controller_keys: dict[str, list[str]] = {}
+
+FEATURE_BATCH = "batch"
+FEATURE_JSON_QUERY = "query --json"
+# Features the installed driver rejected, per wrapper path and modification
+# time; an upgrade rewrites the wrapper, so the new driver is asked again.
+_unsupported_features: dict[tuple[str, int | None], set[str]] = {}
 
 
 class HardwareBusyError(TimeoutError):
@@ -36,6 +67,27 @@ def tool_hint():
 
 MISSING_TOOL_MESSAGE = "Bundled CLI tool not found. Reinstall the application."
 
+
+def _tool_identity(tool: str) -> tuple[str, int | None]:
+    try:
+        return tool, os.stat(tool).st_mtime_ns
+    except OSError:
+        return tool, None
+
+
+def driver_supports(feature: str, tool: str | None = None) -> bool:
+    """False once `tool` (the installed driver by default) rejected `feature`."""
+    tool = tool or resolve_tool()
+    if not tool:
+        return True
+    return feature not in _unsupported_features.get(_tool_identity(tool), ())
+
+
+def mark_unsupported(feature: str, tool: str | None = None) -> None:
+    tool = tool or resolve_tool()
+    if tool:
+        _unsupported_features.setdefault(_tool_identity(tool), set()).add(feature)
+
 LOG_COLORS = {
     "info": "#e5e7eb",
     "cmd": "#7dd3fc",
@@ -50,37 +102,317 @@ def format_log(text, level="info"):
     return f'<span style="color:{color}">{html.escape(str(text))}</span>'
 
 
-@contextmanager
-def hardware_lock(timeout: float = HARDWARE_LOCK_TIMEOUT_SECONDS):
-    ensure_config_dir()
+# Lock classes in order of precedence. A waiter announces itself with a shared
+# lock on the intent file of its class; after taking the hardware lock, a
+# waiter yields it back while any class above its own is announced.
+LOCK_PRIORITIES = ("interactive", "automation", "diagnostics")
+PRIORITY_INTERACTIVE, PRIORITY_AUTOMATION, PRIORITY_DIAGNOSTICS = LOCK_PRIORITIES
+LOCK_WAIT_REPORT_SECONDS = 0.25
+# Pause before another attempt when no wake-up can be relied on.
+LOCK_RETRY_SECONDS = 0.05
+
+_lock_priority = PRIORITY_INTERACTIVE
+
+
+def set_lock_priority(priority: str) -> None:
+    """Set the lock class used when a caller does not name one."""
+    global _lock_priority
+    if priority not in LOCK_PRIORITIES:
+        raise ValueError(f"Unknown lock priority: {priority}")
+    _lock_priority = priority
+
+
+@dataclass
+class HardwareLease:
+    priority: str
+    waited: float = 0.0
+    yielded: int = 0
+
+
+class DriverResult(tuple):
+    """A run_cmd() or run_sequence() result that also reports the lock wait."""
+
+    def __new__(cls, values, lock_wait: float = 0.0):
+        result = super().__new__(cls, values)
+        result.lock_wait = lock_wait
+        return result
+
+
+def _open_lock_file(path: str) -> int:
     descriptor = os.open(
-        HARDWARE_LOCK_PATH,
+        path,
         os.O_RDWR | os.O_CREAT | os.O_CLOEXEC | os.O_NOFOLLOW,
         0o600,
     )
     os.fchmod(descriptor, 0o600)
-    lock_file = os.fdopen(descriptor, "a+", encoding="utf-8")
-    deadline = time.monotonic() + timeout
+    return descriptor
+
+
+def _open_wakeup(path: str, flags: int) -> int | None:
+    """Open the FIFO beside lock file `path`, or None where there is none."""
+    fifo = f"{path}.wake"
+    try:
+        os.mkfifo(fifo, 0o600)
+    except FileExistsError:
+        pass
+    except OSError:
+        return None
     try:
+        descriptor = os.open(
+            fifo, flags | os.O_NONBLOCK | os.O_CLOEXEC | os.O_NOFOLLOW
+        )
+    except OSError:
+        return None
+    if not stat.S_ISFIFO(os.fstat(descriptor).st_mode):
+        os.close(descriptor)
+        return None
+    return descriptor
+
+
+@contextmanager
+def _cancel_pipe():
+    """Yield a descriptor that turns readable once the task is cancelled."""
+    if cancellation.current() is None:
+        yield None
+        return
+    read_end, write_end = os.pipe()
+    guard = threading.Lock()
+    closed = False
+
+    def wake():
+        # cancel() may run its callbacks after this block has ended
+        with guard:
+            if not closed:
+                os.write(write_end, b"\0")
+
+    try:
+        with cancellation.on_cancel(wake):
+            yield read_end
+    finally:
+        with guard:
+            closed = True
+            os.close(read_end)
+            os.close(write_end)
+
+
+class _LockFile:
+    """An flock whose holders keep the FIFO `<path>.wake` open for writing.
+
+    flock() cannot time out, and a thread blocked in it cannot be stopped.
+    A waiter blocks in select() instead, on the read end of the FIFO and on
+    a cancellation pipe. The FIFO hangs up once its last writer is gone, so
+    the waiter wakes when the last holder unlocks or exits.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.descriptor = _open_lock_file(path)
+        self.writer = None
+
+    def try_lock(self, operation: int) -> bool:
+        try:
+            fcntl.flock(self.descriptor, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        if self.writer is None:
+            self.writer = _open_wakeup(self.path, os.O_RDWR)
+        return True
+
+    def wait(self, operation: int, timeout: float) -> bool:
+        """Take the lock within `timeout` seconds, or give up on cancellation."""
+        deadline = time.monotonic() + timeout
+        woken = False
+        with _cancel_pipe() as cancelled:
+            while True:
+                # Opened before the attempt, so a release in between still
+                # hangs it up.
+                reader = _open_wakeup(self.path, os.O_RDONLY)
+                try:
+                    if self.try_lock(operation):
+                        return True
+                    left = deadline - time.monotonic()
+                    if left <= 0 or cancellation.cancelled():
+                        return False
+                    if reader is None:
+                        # no FIFOs on this filesystem: retry after a pause
+                        if cancellation.sleep(min(LOCK_RETRY_SECONDS, left)):
+                            return False
+                        continue
+                    if woken:
+                        # A holder that exits may close the FIFO before the
+                        # kernel drops its flock, so look again shortly.
+                        left = min(left, LOCK_RETRY_SECONDS)
+                    waiting = [reader] if cancelled is None else [reader, cancelled]
+                    woken = bool(select.select(waiting, [], [], left)[0])
+                finally:
+                    if reader is not None:
+                        os.close(reader)
+
+    def unlock(self) -> None:
+        fcntl.flock(self.descriptor, fcntl.LOCK_UN)
+        if self.writer is not None:
+            os.close(self.writer)
+            self.writer = None
+
+    def close(self) -> None:
+        try:
+            self.unlock()
+        finally:
+            os.close(self.descriptor)
+
+
+def _announced_above(priority: str):
+    """Return the intent file of a higher class that has waiters."""
+    for higher in LOCK_PRIORITIES[: LOCK_PRIORITIES.index(priority)]:
+        intent = _LockFile(f"{HARDWARE_LOCK_PATH}.{higher}")
+        if not intent.try_lock(fcntl.LOCK_EX):
+            return intent
+        intent.close()
+    return None
+
+
+@contextmanager
+def hardware_lock(
+    timeout: float = HARDWARE_LOCK_TIMEOUT_SECONDS,
+    priority: str | None = None,
+):
+    lease = HardwareLease(priority or _lock_priority)
+    if lease.priority not in LOCK_PRIORITIES:
+        raise ValueError(f"Unknown lock priority: {lease.priority}")
+    ensure_config_dir()
+    started = time.monotonic()
+    deadline = started + timeout
+    lock = _LockFile(HARDWARE_LOCK_PATH)
+    intent = _LockFile(f"{HARDWARE_LOCK_PATH}.{lease.priority}")
+
+    def remaining():
+        return deadline - time.monotonic()
+
+    def busy():
+        waited = time.monotonic() - started
+        metrics.record("lock.wait", waited)
+        cancellation.raise_if_cancelled()
+        return HardwareBusyError(
+            f"Timed out waiting for keyboard controller lock after {waited:.1f}s"
+        )
+
+    try:
+        if not intent.wait(fcntl.LOCK_SH, remaining()):
+            raise busy()
         while True:
-            try:
-                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if not lock.wait(fcntl.LOCK_EX, remaining()):
+                raise busy()
+            blocker = _announced_above(lease.priority)
+            if blocker is None:
                 break
-            except BlockingIOError:
-                if time.monotonic() >= deadline:
-                    raise HardwareBusyError("Timed out waiting for keyboard controller lock")
-                time.sleep(0.05)
-        yield
+            # Hand the controller to the higher class and wait until its
+            # last waiter has taken the lock.
+            lock.unlock()
+            lease.yielded += 1
+            try:
+                if not blocker.wait(fcntl.LOCK_EX, remaining()):
+                    raise busy()
+            finally:
+                blocker.close()
+        intent.unlock()
+        lease.waited = time.monotonic() - started
+        metrics.record("lock.wait", lease.waited)
+        yield lease
     finally:
         try:
-            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock.close()
         finally:
-            lock_file.close()
+            intent.close()
+
+
+def _report_lock_wait(lease: HardwareLease, log_cb) -> None:
+    if log_cb and lease.waited >= LOCK_WAIT_REPORT_SECONDS:
+        log_cb(
+            f"Waited {lease.waited:.2f}s for the keyboard controller lock",
+            level="info",
+        )
+
+
+def _read_driver_timings(descriptor: int) -> dict:
+    chunks = []
+    try:
+        while chunk := os.read(descriptor, 65536):
+            chunks.append(chunk)
+    finally:
+        os.close(descriptor)
+    try:
+        report = json.loads(b"".join(chunks) or b"{}")
+    except ValueError:
+        return {}
+    return report if isinstance(report, dict) else {}
+
+
+def _record_driver_timings(elapsed: float, report: dict) -> None:
+    metrics.record("driver.process", elapsed)
+    in_process = 0.0
+    for phase, entry in report.items():
+        try:
+            total = float(entry["total"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        metrics.record(f"driver.{phase}", total)
+        if phase in ("import", "main"):
+            in_process += total
+    if in_process:
+        # interpreter start-up and teardown, which the driver cannot time
+        metrics.record("driver.startup", max(0.0, elapsed - in_process))
+
+
+def _run_until_cancelled(
+    token, command, *, input=None, timeout=None, capture_output=False, **kwargs
+):
+    """subprocess.run() that terminates the process when `token` is cancelled."""
+    if capture_output:
+        kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+    with subprocess.Popen(command, **kwargs) as process:
+        with token.on_cancel(process.terminate):
+            try:
+                stdout, stderr = process.communicate(input, timeout=timeout)
+            except subprocess.TimeoutExpired as exc:
+                process.kill()
+                exc.stdout, exc.stderr = process.communicate()
+                raise
+    if token.cancelled and process.returncode < 0:
+        raise cancellation.TaskCancelled(output=stdout)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def _spawn_driver(command, **kwargs):
+    """subprocess.run() for the driver CLI, recording where its time went."""
+    read_fd, write_fd = os.pipe()
+    started = time.monotonic()
+    token = cancellation.current()
+    try:
+        if token is not None:
+            return _run_until_cancelled(
+                token,
+                command,
+                env={**os.environ, DRIVER_TIMINGS_ENV: str(write_fd)},
+                pass_fds=(write_fd,),
+                **kwargs,
+            )
+        return subprocess.run(
+            command,
+            env={**os.environ, DRIVER_TIMINGS_ENV: str(write_fd)},
+            pass_fds=(write_fd,),
+            **kwargs,
+        )
+    finally:
+        elapsed = time.monotonic() - started
+        os.close(write_fd)
+        _record_driver_timings(elapsed, _read_driver_timings(read_fd))
 
 
 def _run_unlocked(tool: str, args, *, timeout: float):
     try:
-        process = subprocess.run(
+        process = _spawn_driver(
             [tool, *args],
             text=True,
             capture_output=True,
@@ -91,6 +423,8 @@ def _run_unlocked(tool: str, args, *, timeout: float):
         stderr = (exc.stderr or "").strip() if isinstance(exc.stderr, str) else ""
         message = stderr or f"Command timed out after {timeout:.1f}s"
         return 124, stdout, message
+    except cancellation.TaskCancelled:
+        return _cancelled_result()
     except FileNotFoundError:
         return 127, "", f"{MISSING_TOOL_MESSAGE} Searched: {tool_hint()}."
     return (
@@ -100,6 +434,524 @@ def _run_unlocked(tool: str, args, *, timeout: float):
     )
 
 
+def _recv_exact(connection, length: int) -> bytes:
+    data = b""
+    while len(data) < length:
+        chunk = connection.recv(length - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def _server_roundtrip(message: dict, *, timeout: float, path: str | None):
+    """Exchange one frame with a running `ite8291r3-ctl serve` process.
+
+    Returns None when no server is listening or it went away before
+    answering, in which case the caller spawns the CLI instead. Cancelling
+    the task closes the connection, which also stops a batch on the server,
+    and raises TaskCancelled.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+
+    def hang_up():
+        try:
+            connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    try:
+        with cancellation.on_cancel(hang_up):
+            response = _server_exchange(connection, message, path)
+    finally:
+        connection.close()
+    if response is None and cancellation.cancelled():
+        raise cancellation.TaskCancelled()
+    return response
+
+
+def _server_exchange(connection, message: dict, path: str | None):
+    try:
+        try:
+            connection.connect(path or DRIVER_SOCKET_PATH)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        payload = json.dumps(message).encode("utf-8")
+        connection.sendall(SERVER_FRAME_HEADER.pack(len(payload)) + payload)
+        header = _recv_exact(connection, SERVER_FRAME_HEADER.size)
+        if len(header) != SERVER_FRAME_HEADER.size:
+            return None
+        (length,) = SERVER_FRAME_HEADER.unpack(header)
+        if length > SERVER_MAX_FRAME_LEN:
+            return None
+        body = _recv_exact(connection, length)
+        if len(body) != length:
+            return None
+        response = json.loads(body.decode("utf-8"))
+    except socket.timeout:
+        raise
+    except (OSError, UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    return response if isinstance(response, dict) else None
+
+
+def _result_from_object(value):
+    if not isinstance(value, dict) or not isinstance(value.get("rc"), int):
+        return None
+    return (
+        value["rc"],
+        str(value.get("stdout") or "").strip(),
+        str(value.get("stderr") or "").strip(),
+    )
+
+
+def _timeout_result(timeout: float):
+    return 124, "", f"Command timed out after {timeout:.1f}s"
+
+
+def _cancelled_result():
+    return CANCELLED_RC, "", cancellation.CANCELLED_MESSAGE
+
+
+def _request_server(args, *, timeout: float, path: str | None = None):
+    try:
+        response = _server_roundtrip(
+            {"argv": [str(arg) for arg in args]}, timeout=timeout, path=path
+        )
+    except socket.timeout:
+        return _timeout_result(timeout)
+    except cancellation.TaskCancelled:
+        return _cancelled_result()
+    if response is None:
+        return None
+    return _result_from_object(response)
+
+
+def _request_server_batch(
+    commands, *, delay: float, timeout: float, path: str | None = None
+):
+    message = {
+        "batch": [[str(arg) for arg in args] for args in commands],
+        "delay": delay,
+    }
+    try:
+        response = _server_roundtrip(message, timeout=timeout, path=path)
+    except socket.timeout:
+        return [_timeout_result(timeout)]
+    except cancellation.TaskCancelled:
+        return [_cancelled_result()]
+    if response is None or not isinstance(response.get("results"), list):
+        return None
+    results = [_result_from_object(value) for value in response["results"]]
+    if not results or None in results:
+        return None
+    return results
+
+
+def _parse_batch_output(output) -> list:
+    if isinstance(output, bytes):
+        output = output.decode("utf-8", errors="replace")
+    results = []
+    for line in (output or "").splitlines():
+        try:
+            result = _result_from_object(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+        if result is not None:
+            results.append(result)
+    return results
+
+
+def _run_batch_unlocked(tool: str, commands, *, delay: float, timeout: float):
+    """Execute a command list in one `ite8291r3-ctl batch` process.
+
+    Returns None when the installed driver predates the batch subcommand.
+    """
+    payload = json.dumps([[str(arg) for arg in args] for args in commands])
+    try:
+        process = _spawn_driver(
+            [tool, "batch", "--delay", f"{delay:g}"],
+            input=payload,
+            text=True,
+            capture_output=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired as exc:
+        results = _parse_batch_output(exc.stdout)
+        results.append(_timeout_result(timeout))
+        return results
+    except cancellation.TaskCancelled as exc:
+        results = _parse_batch_output(exc.output)
+        results.append(_cancelled_result())
+        return results
+    except FileNotFoundError:
+        return [(127, "", f"{MISSING_TOOL_MESSAGE} Searched: {tool_hint()}.")]
+    stderr = (process.stderr or "").strip()
+    if process.returncode == 2 and "invalid choice: 'batch'" in stderr:
+        return None
+    results = _parse_batch_output(process.stdout)
+    if process.returncode != 0 and (not results or results[-1][0] == 0):
+        # The batch itself was rejected before its commands could report.
+        results.append((process.returncode, "", stderr))
+    return results
+
+
+def _execute_each(execute, commands, *, delay: float, timeout: float):
+    """Run a sequence one request at a time, stopping once the task is cancelled.
+
+    Returns None when `execute` declines a command; the next transport then
+    runs the whole sequence again, which is harmless because each command
+    sets absolute state.
+    """
+    results = []
+    for index, args in enumerate(commands):
+        if index and delay:
+            cancellation.sleep(delay)
+        if cancellation.cancelled():
+            results.append(_cancelled_result())
+            break
+        result = execute(args, timeout=timeout)
+        if result is None:
+            return None
+        results.append(result)
+        if result[0] != 0:
+            break
+    return results
+
+
+def _run_each_unlocked(tool: str, commands, *, delay: float, timeout: float):
+    return _execute_each(
+        lambda args, timeout: _run_unlocked(tool, args, timeout=timeout),
+        commands,
+        delay=delay,
+        timeout=timeout,
+    )
+
+
+def _read_sysfs_attribute(device_dir: str, name: str) -> str:
+    with open(os.path.join(device_dir, name), encoding="ascii") as handle:
+        return handle.read().strip().lower()
+
+
+def connected_controller_keys() -> list[str]:
+    """Return `vendor:product:revision` of each attached ITE USB device."""
+    keys = _controller_keys.get(USB_SYSFS_DIR)
+    if keys is None:
+        keys = _scan_controller_keys()
+        if keys:
+            # an empty scan is repeated; the device may not be enumerated yet
+            _controller_keys[USB_SYSFS_DIR] = keys
+    return list(keys)
+
+
+def _scan_controller_keys() -> list[str]:
+    try:
+        names = sorted(os.listdir(USB_SYSFS_DIR))
+    except OSError:
+        return []
+    keys = []
+    for name in names:
+        device_dir = os.path.join(USB_SYSFS_DIR, name)
+        try:
+            if _read_sysfs_attribute(device_dir, "idVendor") != CONTROLLER_VENDOR_ID:
+                continue
+            product = _read_sysfs_attribute(device_dir, "idProduct")
+            revision = _read_sysfs_attribute(device_dir, "bcdDevice")
+        except (OSError, UnicodeDecodeError):
+            continue
+        keys.append(f"{CONTROLLER_VENDOR_ID}:{product}:{revision}")
+    return keys
+
+
+def sequence_delay(commands) -> float:
+    """Pause between sequence commands for the attached controller.
+
+    Uses the settle times `ite8291r3-ctl calibrate` measured for this product
+    and revision. Without a calibration, or when a command kind was not
+    measured, the conservative default applies.
+    """
+    try:
+        calibrations = read_pacing_file()
+    except StorageFormatError:
+        calibrations = {}
+    settle = None
+    if calibrations:
+        for key in connected_controller_keys():
+            if isinstance(calibrations.get(key), Mapping):
+                settle = calibrations[key]
+                break
+    if settle is None:
+        return DEFAULT_INTER_COMMAND_DELAY
+    delay = 0.0
+    # Only a command that is followed by another one needs to settle.
+    for args in commands[:-1]:
+        seconds = settle.get(args[0]) if args else None
+        if not isinstance(seconds, (int, float)) or isinstance(seconds, bool):
+            return DEFAULT_INTER_COMMAND_DELAY
+        delay = max(delay, seconds * PACING_MARGIN)
+    return delay
+
+
+def _sequence_timeout(commands, *, delay: float, timeout: float) -> float:
+    return timeout * len(commands) + delay * (len(commands) - 1)
+
+
+class DriverTransport:
+    """Carries driver requests; None hands a request to the next transport."""
+
+    name = "none"
+
+    def execute(self, tool: str, args, *, timeout: float):
+        return None
+
+    def execute_sequence(self, tool: str, commands, *, delay: float, timeout: float):
+        return None
+
+
+class ServerTransport(DriverTransport):
+    """Requests to a running `ite8291r3-ctl serve`, which keeps the device open."""
+
+    name = "server"
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+
+    def execute(self, tool: str, args, *, timeout: float):
+        return _request_server(args, timeout=timeout, path=self.path)
+
+    def execute_sequence(self, tool: str, commands, *, delay: float, timeout: float):
+        return _request_server_batch(
+            commands,
+            delay=delay,
+            timeout=_sequence_timeout(commands, delay=delay, timeout=timeout),
+            path=self.path,
+        )
+
+
+class SubprocessTransport(DriverTransport):
+    """One CLI process per command, or per sequence when `batch` is available."""
+
+    name = "subprocess"
+
+    def execute(self, tool: str, args, *, timeout: float):
+        return _run_unlocked(tool, args, timeout=timeout)
+
+    def execute_sequence(self, tool: str, commands, *, delay: float, timeout: float):
+        results = None
+        if driver_supports(FEATURE_BATCH, tool):
+            results = _run_batch_unlocked(
+                tool,
+                commands,
+                delay=delay,
+                timeout=_sequence_timeout(commands, delay=delay, timeout=timeout),
+            )
+            if results is None:
+                mark_unsupported(FEATURE_BATCH, tool)
+        if results is None:
+            results = _run_each_unlocked(tool, commands, delay=delay, timeout=timeout)
+        return results
+
+
+class WorkerTransport(DriverTransport):
+    """A pre-spawned `ite8291r3-ctl serve --stdio` child fed over pipes.
+
+    The worker has imported the driver and pyusb before the first request
+    arrives. A worker that exits or garbles its answer is replaced and the
+    request is retried once on the new one; one that times out, or whose
+    request is cancelled, is killed and replaced by the next request.
+    """
+
+    name = "worker"
+
+    def __init__(self):
+        self.process = None
+        self.tool = None
+        # drivers without `serve --stdio` are not asked again
+        self.unsupported = False
+        self._lock = threading.Lock()
+
+    def start(self, tool: str | None = None) -> bool:
+        with self._lock:
+            return self._ensure_started(tool or resolve_tool())
+
+    def stop(self) -> None:
+        with self._lock:
+            self._discard()
+
+    def _ensure_started(self, tool: str | None) -> bool:
+        process = self.process
+        if process is not None and process.poll() is None and self.tool == tool:
+            return True
+        self._discard()
+        if not tool or self.unsupported:
+            return False
+        try:
+            self.process = subprocess.Popen(
+                [tool, "serve", "--stdio"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                bufsize=0,
+            )
+        except OSError:
+            return False
+        self.tool = tool
+        return True
+
+    def _kill_running(self) -> None:
+        # from the cancelling thread; the requesting thread discards it
+        process = self.process
+        if process is not None:
+            process.kill()
+
+    def _discard(self, *, kill: bool = False) -> None:
+        process, self.process = self.process, None
+        if process is None:
+            return
+        if kill:
+            process.kill()
+        for stream in (process.stdin, process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        try:
+            # a worker exits by itself once its stdin is closed
+            process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        if process.returncode == 2:
+            # argparse rejected `serve --stdio`
+            self.unsupported = True
+
+    def _read(self, length: int, deadline: float) -> bytes:
+        descriptor = self.process.stdout.fileno()
+        data = b""
+        while len(data) < length:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([descriptor], [], [], remaining)[0]:
+                raise TimeoutError
+            chunk = os.read(descriptor, length - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def _write(self, data: bytes, deadline: float) -> None:
+        # an unbuffered pipe write may take only part of the frame
+        descriptor = self.process.stdin.fileno()
+        view = memoryview(data)
+        while view:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([], [descriptor], [], remaining)[1]:
+                raise TimeoutError
+            written = os.write(descriptor, view)
+            view = view[written:]
+
+    def _roundtrip(self, message: dict, timeout: float):
+        deadline = time.monotonic() + timeout
+        payload = json.dumps(message).encode("utf-8")
+        self._write(SERVER_FRAME_HEADER.pack(len(payload)) + payload, deadline)
+        header = self._read(SERVER_FRAME_HEADER.size, deadline)
+        if len(header) != SERVER_FRAME_HEADER.size:
+            return None
+        (length,) = SERVER_FRAME_HEADER.unpack(header)
+        if length > SERVER_MAX_FRAME_LEN:
+            return None
+        body = self._read(length, deadline)
+        if len(body) != length:
+            return None
+        response = json.loads(body.decode("utf-8"))
+        return response if isinstance(response, dict) else None
+
+    def _request(self, tool: str, message: dict, timeout: float):
+        with self._lock, cancellation.on_cancel(self._kill_running):
+            for _attempt in range(2):
+                if not self._ensure_started(tool):
+                    return None
+                try:
+                    response = self._roundtrip(message, timeout)
+                except TimeoutError:
+                    self._discard(kill=True)
+                    raise
+                except (OSError, UnicodeDecodeError, json.JSONDecodeError):
+                    response = None
+                if response is not None:
+                    return response
+                self._discard()
+                cancellation.raise_if_cancelled()
+            return None
+
+    def execute(self, tool: str, args, *, timeout: float):
+        try:
+            response = self._request(
+                tool, {"argv": [str(arg) for arg in args]}, timeout
+            )
+        except TimeoutError:
+            return _timeout_result(timeout)
+        except cancellation.TaskCancelled:
+            return _cancelled_result()
+        return None if response is None else _result_from_object(response)
+
+    def execute_sequence(self, tool: str, commands, *, delay: float, timeout: float):
+        timeout = _sequence_timeout(commands, delay=delay, timeout=timeout)
+        message = {
+            "batch": [[str(arg) for arg in args] for args in commands],
+            "delay": delay,
+        }
+        try:
+            response = self._request(tool, message, timeout)
+        except TimeoutError:
+            return [_timeout_result(timeout)]
+        except cancellation.TaskCancelled:
+            return [_cancelled_result()]
+        if response is None or not isinstance(response.get("results"), list):
+            return None
+        results = [_result_from_object(value) for value in response["results"]]
+        if not results or None in results:
+            return None
+        return results
+
+
+# The GUI talks to the GPLv2 driver only through its executable, so every
+# transport reaches it across a process boundary.
+DEFAULT_TRANSPORTS = (ServerTransport(), SubprocessTransport())
+_transports = DEFAULT_TRANSPORTS
+NO_TRANSPORT_MESSAGE = "No driver transport accepted the request."
+
+
+def driver_transports() -> tuple:
+    return _transports
+
+
+def set_driver_transports(transports) -> None:
+    """Replace the ordered transport list; None restores the default."""
+    global _transports
+    _transports = DEFAULT_TRANSPORTS if transports is None else tuple(transports)
+
+
+def _execute_unlocked(tool: str, args, *, timeout: float):
+    for transport in _transports:
+        with metrics.timed(f"transport.{transport.name}"):
+            result = transport.execute(tool, args, timeout=timeout)
+        if result is not None:
+            return result
+    return 1, "", NO_TRANSPORT_MESSAGE
+
+
+def _execute_sequence_unlocked(tool: str, commands, *, delay: float, timeout: float):
+    for transport in _transports:
+        with metrics.timed(f"transport.{transport.name}"):
+            results = transport.execute_sequence(
+                tool, commands, delay=delay, timeout=timeout
+            )
+        if results is not None:
+            return results
+    return [(1, "", NO_TRANSPORT_MESSAGE)]
+
+
 def run_cmd(
     args,
     log_cb=None,
@@ -108,6 +960,7 @@ def run_cmd(
     log_stdout=True,
     log_stderr=True,
     timeout: float = COMMAND_TIMEOUT_SECONDS,
+    priority: str | None = None,
 ):
     cmd_display = " ".join(shlex.quote(str(arg)) for arg in args)
     if log_cb and log_cmd:
@@ -117,12 +970,20 @@ def run_cmd(
         message = f"{MISSING_TOOL_MESSAGE} Searched: {tool_hint()}."
         if log_cb:
             log_cb(message, level="error")
-        return 127, "", message
+        return DriverResult((127, "", message))
+    waited = 0.0
     try:
-        with hardware_lock():
-            result = _run_unlocked(tool, args, timeout=timeout)
+        cancellation.raise_if_cancelled()
+        with metrics.timed("run_cmd"), hardware_lock(priority=priority) as lease:
+            _report_lock_wait(lease, log_cb)
+            waited = lease.waited
+            cancellation.raise_if_cancelled()
+            result = _execute_unlocked(tool, args, timeout=timeout)
     except HardwareBusyError as exc:
         result = (125, "", str(exc))
+    except cancellation.TaskCancelled:
+        result = _cancelled_result()
+    result = DriverResult(result, waited)
     rc, stdout, stderr = result
     if stdout and log_cb and log_stdout:
         log_cb(stdout, level="stdout")
@@ -136,32 +997,56 @@ def run_sequence(
     log_cb=None,
     *,
     timeout_per_command: float = COMMAND_TIMEOUT_SECONDS,
-    inter_command_delay: float = 0.06,
+    inter_command_delay: float | None = None,
+    priority: str | None = None,
 ):
+    """Run commands in one driver request and report the first failure index."""
     tool = resolve_tool()
     if not tool:
         message = f"{MISSING_TOOL_MESSAGE} Searched: {tool_hint()}."
-        return 127, "", message, None
-    try:
-        with hardware_lock():
-            last = (0, "", "")
-            for index, args in enumerate(commands):
-                if log_cb:
-                    display = " ".join(shlex.quote(str(arg)) for arg in args)
-                    log_cb(f"$ {display}", level="cmd")
-                last = _run_unlocked(tool, args, timeout=timeout_per_command)
-                rc, stdout, stderr = last
-                if stdout and log_cb:
-                    log_cb(stdout, level="stdout")
-                if stderr and log_cb:
-                    log_cb(stderr, level="stderr")
-                if rc != 0:
-                    return rc, stdout, stderr, index
-                if index + 1 < len(commands) and inter_command_delay:
-                    time.sleep(inter_command_delay)
-            return (*last, None)
+        return DriverResult((127, "", message, None))
+    commands = [list(args) for args in commands]
+    if not commands:
+        return DriverResult((0, "", "", None))
+    if inter_command_delay is None:
+        inter_command_delay = sequence_delay(commands)
+    waited = 0.0
+    try:
+        cancellation.raise_if_cancelled()
+        with metrics.timed("run_sequence"), hardware_lock(priority=priority) as lease:
+            _report_lock_wait(lease, log_cb)
+            waited = lease.waited
+            cancellation.raise_if_cancelled()
+            results = _execute_sequence_unlocked(
+                tool,
+                commands,
+                delay=inter_command_delay,
+                timeout=timeout_per_command,
+            )
     except HardwareBusyError as exc:
-        return 125, "", str(exc), None
+        return DriverResult((125, "", str(exc), None))
+    except cancellation.TaskCancelled:
+        return DriverResult((*_cancelled_result(), None), waited)
+    if len(results) > 1:
+        # the pauses the driver (or the host) slept between commands
+        metrics.record("sequence.delay", inter_command_delay * (len(results) - 1))
+    last = (0, "", "")
+    for index, (args, result) in enumerate(zip(commands, results)):
+        if log_cb:
+            display = " ".join(shlex.quote(str(arg)) for arg in args)
+            log_cb(f"$ {display}", level="cmd")
+        last = result
+        rc, stdout, stderr = last
+        if stdout and log_cb:
+            log_cb(stdout, level="stdout")
+        if stderr and log_cb:
+            log_cb(stderr, level="stderr")
+        if rc != 0:
+            return DriverResult((rc, stdout, stderr, index), waited)
+    if len(results) < len(commands):
+        message = "Driver stopped before completing the sequence"
+        return DriverResult((1, "", message, len(results)), waited)
+    return DriverResult((*last, None), waited)
 
 
 def format_cli_error(rc, out, err):
@@ -173,6 +1058,8 @@ def format_cli_error(rc, out, err):
         return text or "Keyboard command timed out."
     if rc == 125:
         return text or "Keyboard controller is busy."
+    if rc == CANCELLED_RC:
+        return text or cancellation.CANCELLED_MESSAGE
     if "libusb_error_access" in lower or "permission denied" in lower:
         return "Insufficient permissions to access the keyboard."
     if "device handle could not be acquired" in lower or "no such device" in lower:
@@ -1,7 +1,15 @@
 from __future__ import annotations
 
+from dataclasses import replace
+
+from . import metrics
 from .capabilities import capability_for
-from .commands import build_profile_commands
+from .commands import (
+    KeyboardState,
+    build_profile_commands,
+    expected_keyboard_state,
+    plan_profile_commands,
+)
 from .driver import format_cli_error, run_cmd, run_sequence
 from .ui_helpers import set_combo_by_data
 
@@ -78,8 +86,19 @@ class EffectsMixin:
             else:
                 self.set_status(format_cli_error(rc, out, err), level="error")
 
+        def turn_off():
+            result = run_cmd(["off"])
+            known = self.known_state
+            if result[0] != 0:
+                self.known_state = None
+            elif known:
+                self.known_state = replace(known, power="off")
+            else:
+                self.known_state = KeyboardState(brightness=None, power="off")
+            return result
+
         self.run_hardware_task(
-            lambda: run_cmd(["off"]),
+            turn_off,
             completed,
             task_key="write",
             supersede=True,
@@ -109,23 +128,63 @@ class EffectsMixin:
             else:
                 self.set_status(format_cli_error(rc, out, err), level="error")
 
-        self.run_hardware_task(
-            lambda: run_cmd(
+        def set_brightness():
+            result = run_cmd(
                 ["brightness", str(v)],
                 log_cmd=False,
                 log_stdout=False,
                 log_stderr=False,
-            ),
+            )
+            known = self.known_state
+            if result[0] == 0 and known and known.power == "on":
+                self.known_state = replace(known, brightness=v)
+            else:
+                self.known_state = None
+            return result
+
+        # Slider drags: one write in flight, only the newest value waits.
+        self.run_hardware_task(
+            set_brightness,
             completed,
             task_key="write",
-            supersede=True,
+            mailbox=True,
         )
 
-    def hard_reset_then(self, args, completed):
-        self.log("$ off / " + " ".join(args), level="cmd")
+    def apply_planned_then(self, completed):
+        profile = self.capture_profile_state()
+        target = expected_keyboard_state(profile)
+
+        # Planned on the hardware thread, so the state left behind by
+        # earlier (and superseded) writes is already known. A stale state is
+        # queried first; only an unreadable one sends the full sequence.
+        def apply():
+            with metrics.collect() as phases:
+                current = self.known_state
+                if current is None:
+                    self.query_device_state()
+                    current = self.known_state
+                commands = plan_profile_commands(profile, current)
+                self.known_state = None
+                result = (0, "", "", None)
+                if commands:
+                    result = run_sequence(commands)
+            if result[0] == 0:
+                self.known_state = target
+            return commands, result, phases
+
+        def applied(outcome):
+            commands, result, phases = outcome
+            if commands:
+                self.log(
+                    "$ " + " / ".join(" ".join(args) for args in commands),
+                    level="cmd",
+                )
+                self.log_latency(phases)
+            completed(result)
+
         self.run_hardware_task(
-            lambda: run_sequence([["off"], args]),
-            completed,
+            apply,
+            applied,
             task_key="write",
             supersede=True,
         )
@@ -135,7 +194,6 @@ class EffectsMixin:
         color_value = self.static_color.currentData() or self.static_color.currentText()
         display_color = self.static_color.currentText()
         self.last_static_color = color_value
-        args = ["monocolor", "-b", str(v), "--name", color_value]
 
         def completed(result):
             rc, out, err, _failed_index = result
@@ -159,7 +217,7 @@ class EffectsMixin:
                     level="error",
                 )
 
-        self.hard_reset_then(args, completed)
+        self.apply_planned_then(completed)
 
     def build_effect_args(self):
         commands = build_profile_commands(self.capture_profile_state())
@@ -186,7 +244,7 @@ class EffectsMixin:
                     level="error",
                 )
 
-        self.hard_reset_then(args, completed)
+        self.apply_planned_then(completed)
 
     def apply_current_mode(self, *, allow_when_off=False, on_success=None):
         if self.is_off and not allow_when_off:
@@ -0,0 +1,163 @@
+"""Bounded in-memory latency histograms for hardware operations.
+
+Every phase (lock wait, driver process, USB transfers reported by the driver,
+profile applies, ...) gets a histogram with fixed buckets, so memory stays
+constant however long the process runs. Set XMG_BACKLIGHT_METRICS=1 to print
+the histograms to stderr at exit, or to a path to write them there as JSON.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+METRICS_ENV = "XMG_BACKLIGHT_METRICS"
+# Upper bucket bounds in milliseconds; slower samples land in a last bucket.
+BUCKET_BOUNDS_MS = (
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000,
+)
+# Phase names partly come from the driver, so their number is capped too.
+MAX_PHASES = 64
+
+
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "total", "maximum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, seconds: float) -> None:
+        milliseconds = seconds * 1000
+        self.counts[bisect_left(BUCKET_BOUNDS_MS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.maximum = max(self.maximum, milliseconds)
+
+    def quantile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of samples."""
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                if index < len(BUCKET_BOUNDS_MS):
+                    return min(float(BUCKET_BOUNDS_MS[index]), self.maximum)
+                return self.maximum
+        return 0.0
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "max_ms": self.maximum,
+            "buckets": {
+                **{
+                    f"<={bound}ms": count
+                    for bound, count in zip(BUCKET_BOUNDS_MS, self.counts)
+                    if count
+                },
+                **({"slower": self.counts[-1]} if self.counts[-1] else {}),
+            },
+        }
+
+
+_lock = threading.Lock()
+_histograms: dict[str, LatencyHistogram] = {}
+_collectors = threading.local()
+
+
+def record(phase: str, seconds: float) -> None:
+    with _lock:
+        histogram = _histograms.get(phase)
+        if histogram is None:
+            if len(_histograms) >= MAX_PHASES:
+                return
+            histogram = _histograms[phase] = LatencyHistogram()
+        histogram.add(seconds)
+    collected = getattr(_collectors, "phases", None)
+    if collected is not None:
+        collected[phase] = collected.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed(phase: str):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        record(phase, time.monotonic() - started)
+
+
+@contextmanager
+def collect():
+    """Also add up, per phase, what this thread records inside the block."""
+    outer = getattr(_collectors, "phases", None)
+    phases: dict[str, float] = {}
+    _collectors.phases = phases
+    try:
+        yield phases
+    finally:
+        _collectors.phases = outer
+        if outer is not None:
+            for phase, seconds in phases.items():
+                outer[phase] = outer.get(phase, 0.0) + seconds
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {phase: _histograms[phase].summary() for phase in sorted(_histograms)}
+
+
+def reset() -> None:
+    with _lock:
+        _histograms.clear()
+
+
+def format_phases(phases: dict) -> str:
+    """One line with the time per phase, slowest first."""
+    ordered = sorted(phases.items(), key=lambda item: item[1], reverse=True)
+    return ", ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in ordered)
+
+
+def format_report() -> list[str]:
+    lines = []
+    for phase, stats in snapshot().items():
+        lines.append(
+            f"{phase}: n={stats['count']} mean={stats['mean_ms']:.2f}ms "
+            f"p50<={stats['p50_ms']:.2f}ms p95<={stats['p95_ms']:.2f}ms "
+            f"max={stats['max_ms']:.2f}ms"
+        )
+    return lines
+
+
+def dump(destination: str) -> None:
+    if destination in ("1", "stderr"):
+        for line in format_report():
+            print(f"latency {line}", file=sys.stderr)
+        return
+    with open(destination, "w", encoding="utf-8") as handle:
+        json.dump(snapshot(), handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+
+def _dump_from_environment() -> None:
+    destination = os.environ.get(METRICS_ENV, "")
+    if destination and destination != "0":
+        try:
+            dump(destination)
+        except OSError as exc:
+            print(f"Cannot write latency metrics: {exc}", file=sys.stderr)
+
+
+atexit.register(_dump_from_environment)
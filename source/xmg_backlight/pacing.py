@@ -0,0 +1,49 @@
+"""Calibrate the pause between sequence commands for the attached controller."""
+
+from __future__ import annotations
+
+import json
+import sys
+
+from . import restore_profile
+from .driver import PRIORITY_DIAGNOSTICS, format_cli_error, run_cmd
+from .storage import write_pacing_calibration
+
+CALIBRATION_TIMEOUT_SECONDS = 30.0
+
+
+def calibrate(log_cb=None) -> tuple[bool, str]:
+    rc, out, err = run_cmd(
+        ["calibrate"],
+        log_cb,
+        timeout=CALIBRATION_TIMEOUT_SECONDS,
+        priority=PRIORITY_DIAGNOSTICS,
+    )
+    if rc != 0:
+        return False, f"Calibration failed: {format_cli_error(rc, out, err)}"
+    try:
+        result = json.loads(out)
+        key = f"{result['device']}:{result['revision']}".lower()
+        settle = result["settle"]
+    except (ValueError, KeyError, TypeError):
+        return False, "Calibration failed: unexpected driver output."
+    if not isinstance(settle, dict):
+        return False, "Calibration failed: unexpected driver output."
+    stored = write_pacing_calibration(key, settle)
+    details = ", ".join(
+        f"{kind} {seconds * 1000:.1f} ms" for kind, seconds in sorted(stored.items())
+    )
+    return True, f"Stored settle times for {key}: {details}."
+
+
+def main():
+    success, message = calibrate()
+    print(message, file=sys.stdout if success else sys.stderr)
+    if not success:
+        return 1
+    # Calibration leaves the backlight off.
+    return restore_profile.main()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,11 @@
-"""Pure profile-domain transformations used by the GUI."""
+"""Profile-domain operations on a profile store and settings.
 
-from __future__ import annotations
+They change the store in place, touching only the profiles concerned, and
+are applied twice for each change: by `storage` to the persisted document
+and by the GUI to its copy once the write succeeded.
+"""
 
-from copy import deepcopy
+from __future__ import annotations
 
 
 class ProfileDomainError(ValueError):
@@ -16,21 +19,50 @@ def validate_profile_name(name: str) -> str:
     return normalized
 
 
+def profile_revision(store: dict, name: str) -> int:
+    """Revision of one profile, bumped by every change to it; 0 if absent."""
+    if name not in store["profiles"]:
+        return 0
+    return store.get("revisions", {}).get(name, 1)
+
+
+def _bump(store: dict, name: str, revision: int) -> None:
+    store.setdefault("revisions", {})[name] = revision + 1
+
+
+def upsert_profile(store: dict, name: str, profile: dict, *, activate=False):
+    name = validate_profile_name(name)
+    revision = profile_revision(store, name)
+    store["profiles"][name] = profile
+    _bump(store, name, revision)
+    if activate:
+        store["active"] = name
+    return store
+
+
+def set_active(store: dict, name: str):
+    if name not in store["profiles"]:
+        raise ProfileDomainError(f"Unknown profile: {name}")
+    store["active"] = name
+    return store
+
+
 def rename_profile(store: dict, settings: dict, old_name: str, new_name: str):
     new_name = validate_profile_name(new_name)
     if old_name not in store["profiles"]:
         raise ProfileDomainError(f"Unknown profile: {old_name}")
     if new_name in store["profiles"] and new_name != old_name:
         raise ProfileDomainError(f"Profile already exists: {new_name}")
-    new_store = deepcopy(store)
-    new_settings = dict(settings)
-    new_store["profiles"][new_name] = new_store["profiles"].pop(old_name)
-    if new_store["active"] == old_name:
-        new_store["active"] = new_name
+    revision = profile_revision(store, old_name)
+    store["profiles"][new_name] = store["profiles"].pop(old_name)
+    store.get("revisions", {}).pop(old_name, None)
+    _bump(store, new_name, revision)
+    if store["active"] == old_name:
+        store["active"] = new_name
     for key in ("ac_profile", "battery_profile"):
-        if new_settings.get(key) == old_name:
-            new_settings[key] = new_name
-    return new_store, new_settings
+        if settings.get(key) == old_name:
+            settings[key] = new_name
+    return store, settings
 
 
 def delete_profile(store: dict, settings: dict, name: str):
@@ -38,12 +70,11 @@ def delete_profile(store: dict, settings: dict, name: str):
         raise ProfileDomainError(f"Unknown profile: {name}")
     if len(store["profiles"]) <= 1:
         raise ProfileDomainError("At least one profile must remain")
-    new_store = deepcopy(store)
-    new_settings = dict(settings)
-    del new_store["profiles"][name]
-    if new_store["active"] == name:
-        new_store["active"] = next(iter(new_store["profiles"]))
+    del store["profiles"][name]
+    store.get("revisions", {}).pop(name, None)
+    if store["active"] == name:
+        store["active"] = next(iter(store["profiles"]))
     for key in ("ac_profile", "battery_profile"):
-        if new_settings.get(key) == name:
-            new_settings[key] = ""
-    return new_store, new_settings
+        if settings.get(key) == name:
+            settings[key] = ""
+    return store, settings
@@ -1,20 +1,26 @@
 from __future__ import annotations
 
 import os
-from copy import deepcopy
 
 from PySide6 import QtCore, QtWidgets
 
 from .capabilities import DIRECTIONS, DYNAMIC_COLORS, EFFECTS, STATIC_COLORS
 from .constants import CONFIG_DIR, DEFAULT_PROFILE_STATE, STATE_PATH
-from .profile_logic import delete_profile, rename_profile
+from . import profile_logic
+from .profile_logic import profile_revision
 from .storage import (
     ProfileConflictError,
     StorageFormatError,
+    delete_profile,
     ensure_config_dir,
     load_profile_store,
-    write_profile_and_settings,
-    write_profile_store,
+    load_settings,
+    profile_store_snapshot,
+    rename_profile,
+    sanitize_profile_state,
+    set_active,
+    state_journal_path,
+    upsert_profile,
     write_settings_file,
 )
 from .ui_helpers import clamp_int, sanitize_choice, set_combo_by_data
@@ -265,64 +271,51 @@ class ProfileMixin:
         }
 
     def persist_profile(self):
-        state = self.capture_profile_state()
-        candidate = deepcopy(self.profile_store)
-        candidate["profiles"][self.active_profile_name] = dict(state)
-        candidate["active"] = self.active_profile_name
-        if not self._commit_profile_store(candidate):
+        if not self._save_profile(self.active_profile_name, self.capture_profile_state()):
             return False
-        self.profile_data = dict(state)
         self.set_profile_dirty(False)
         return True
 
-    def update_active_profile_state(self, state):
-        self.profile_store["profiles"][self.active_profile_name] = dict(state)
-        self.profile_store["active"] = self.active_profile_name
-        self.profile_data = dict(state)
+    def _save_profile(self, name, state, *, activate=True, expected_revision=None):
+        state = sanitize_profile_state(state)
+        if expected_revision is None:
+            expected_revision = profile_revision(self.profile_store, name)
+        return self._commit_profile_change(
+            lambda: upsert_profile(
+                name,
+                state,
+                expected_revision=expected_revision,
+                activate=activate,
+            ),
+            lambda store, _settings: profile_logic.upsert_profile(
+                store, name, dict(state), activate=activate
+            ),
+        )
 
-    def save_profile_store(self):
-        return self._commit_profile_store(deepcopy(self.profile_store))
+    def _commit_profile_change(self, write, change):
+        """Persist one profile operation and mirror it in memory.
 
-    def _commit_profile_store(self, candidate):
+        `write` applies the operation to the document and returns the new
+        store revision; when nothing else changed the document in between,
+        `change` replays the operation on our copy instead of reloading it.
+        """
         try:
             self._ignore_profile_events = True
-            persisted = write_profile_store(
-                candidate,
-                expected_revision=self.profile_store.get("revision", 0),
-            )
-            self.profile_store = persisted
-            self.active_profile_name = persisted["active"]
-            self.profile_data = dict(
-                persisted["profiles"][self.active_profile_name]
-            )
-            self.watch_profile_paths()
-            return True
-        except (OSError, ProfileConflictError, ValueError) as exc:
-            self.set_status(
-                self.tr("status.profile_save_failed", error=str(exc)),
-                level="error",
-            )
-            return False
-        finally:
-            self._ignore_profile_events = False
-
-    def _commit_profile_and_settings(self, candidate_store, candidate_settings):
-        try:
-            self._ignore_profile_events = True
-            persisted_store, persisted_settings = write_profile_and_settings(
-                candidate_store,
-                candidate_settings,
-                expected_profile_revision=self.profile_store.get("revision", 0),
-            )
-            self.profile_store = persisted_store
-            self.settings = persisted_settings
-            self.active_profile_name = persisted_store["active"]
+            base = self.profile_store.get("revision", 0)
+            revision = write()
+            if revision == base + 1:
+                change(self.profile_store, self.settings)
+                self.profile_store["revision"] = revision
+            else:
+                self.profile_store = load_profile_store()
+                self.settings = load_settings()
+            self.active_profile_name = self.profile_store["active"]
             self.profile_data = dict(
-                persisted_store["profiles"][self.active_profile_name]
+                self.profile_store["profiles"][self.active_profile_name]
             )
             self.watch_profile_paths()
             return True
-        except (OSError, ProfileConflictError, StorageFormatError) as exc:
+        except (OSError, ProfileConflictError, StorageFormatError, ValueError) as exc:
             self.set_status(
                 self.tr("status.profile_save_failed", error=str(exc)),
                 level="error",
@@ -397,10 +390,7 @@ class ProfileMixin:
                 self.tr("dialogs.profile.name_in_use_message"),
             )
             return
-        candidate = deepcopy(self.profile_store)
-        candidate["profiles"][name] = dict(DEFAULT_PROFILE_STATE)
-        candidate["active"] = name
-        if not self._commit_profile_store(candidate):
+        if not self._save_profile(name, DEFAULT_PROFILE_STATE, expected_revision=0):
             return
         self.refresh_profile_combo()
         self.load_profile_into_controls(self.profile_data)
@@ -422,11 +412,7 @@ class ProfileMixin:
             )
             if reply != QtWidgets.QMessageBox.Yes:
                 return
-        state = self.capture_profile_state()
-        candidate = deepcopy(self.profile_store)
-        candidate["active"] = name
-        candidate["profiles"][name] = dict(state)
-        if not self._commit_profile_store(candidate):
+        if not self._save_profile(name, self.capture_profile_state()):
             return
         self.refresh_profile_combo()
         self.set_profile_dirty(False)
@@ -448,10 +434,15 @@ class ProfileMixin:
             )
             return
         old_name = self.active_profile_name
-        candidate, candidate_settings = rename_profile(
-            self.profile_store, self.settings, old_name, new_name
-        )
-        if not self._commit_profile_and_settings(candidate, candidate_settings):
+        expected_revision = profile_revision(self.profile_store, old_name)
+        if not self._commit_profile_change(
+            lambda: rename_profile(
+                old_name, new_name, expected_revision=expected_revision
+            ),
+            lambda store, settings: profile_logic.rename_profile(
+                store, settings, old_name, new_name
+            ),
+        ):
             return
         self.refresh_profile_combo()
         self.set_status(self.tr("status.profile_renamed", name=new_name))
@@ -472,10 +463,13 @@ class ProfileMixin:
         if reply != QtWidgets.QMessageBox.Yes:
             return
         deleted_name = self.active_profile_name
-        candidate, candidate_settings = delete_profile(
-            self.profile_store, self.settings, deleted_name
-        )
-        if not self._commit_profile_and_settings(candidate, candidate_settings):
+        expected_revision = profile_revision(self.profile_store, deleted_name)
+        if not self._commit_profile_change(
+            lambda: delete_profile(deleted_name, expected_revision=expected_revision),
+            lambda store, settings: profile_logic.delete_profile(
+                store, settings, deleted_name
+            ),
+        ):
             return
         self.refresh_profile_combo()
         self.load_profile_into_controls(self.profile_data)
@@ -498,9 +492,10 @@ class ProfileMixin:
         if triggered_by_user and not self.confirm_profile_switch(name):
             self.refresh_profile_combo()
             return False
-        candidate = deepcopy(self.profile_store)
-        candidate["active"] = name
-        if not self._commit_profile_store(candidate):
+        if not self._commit_profile_change(
+            lambda: set_active(name),
+            lambda store, _settings: profile_logic.set_active(store, name),
+        ):
             self.refresh_profile_combo()
             return False
         self.refresh_profile_combo()
@@ -528,8 +523,10 @@ class ProfileMixin:
         targets = []
         if os.path.isdir(CONFIG_DIR):
             targets.append(CONFIG_DIR)
-        if os.path.isfile(STATE_PATH):
-            targets.append(STATE_PATH)
+        # Most writes only append to the journal.
+        for path in (STATE_PATH, state_journal_path()):
+            if os.path.isfile(path):
+                targets.append(path)
 
         for target in targets:
             self.profile_watcher.addPath(target)
@@ -544,14 +541,14 @@ class ProfileMixin:
             self.load_profile_into_controls(self.profile_data)
 
     def on_profile_file_changed(self, path):
-        if path != STATE_PATH:
+        if path not in (STATE_PATH, state_journal_path()):
             return
         if self._ignore_profile_events:
             self.watch_profile_paths()
             return
         self.watch_profile_paths()
         try:
-            disk_store = load_profile_store()
+            disk_store = profile_store_snapshot()
             if disk_store.get("revision") == self.profile_store.get("revision"):
                 return
             self.refresh_profile_dirty_state()
@@ -579,7 +576,7 @@ class ProfileMixin:
         self.watch_profile_paths()
         if os.path.isfile(STATE_PATH):
             try:
-                disk_store = load_profile_store()
+                disk_store = profile_store_snapshot()
                 if disk_store.get("revision") == self.profile_store.get("revision"):
                     return
                 self.refresh_profile_dirty_state()
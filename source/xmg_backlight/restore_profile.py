@@ -4,47 +4,72 @@ from __future__ import annotations
 
 import sys
 
+from . import metrics
 from .commands import (
+    LEGACY_STATE_QUERY,
+    STATE_QUERY,
     build_profile_commands,
+    describe_state,
+    expected_keyboard_state,
+    json_query_unsupported,
     parse_keyboard_state,
     state_matches_desired,
 )
 from .constants import STATE_PATH
-from .driver import format_cli_error, run_cmd, run_sequence
+from .driver import (
+    FEATURE_JSON_QUERY,
+    PRIORITY_AUTOMATION,
+    driver_supports,
+    format_cli_error,
+    mark_unsupported,
+    run_cmd,
+    run_sequence,
+    set_lock_priority,
+)
 from .storage import active_profile_from_raw_store, read_profile_file
 from .validation import clamp_int
 
 
 def apply_profile(profile: dict) -> tuple[bool, str]:
+    with metrics.timed("apply_profile"):
+        return _apply_profile(profile)
+
+
+def _apply_profile(profile: dict) -> tuple[bool, str]:
     commands = build_profile_commands(profile)
-    rc, out, err, failed_index = run_sequence(commands)
+    # The trailing query verifies the result within the same driver request.
+    json_query = driver_supports(FEATURE_JSON_QUERY)
+    query = STATE_QUERY if json_query else LEGACY_STATE_QUERY
+    rc, out, err, failed_index = run_sequence([*commands, query])
+    if (
+        json_query
+        and failed_index == len(commands)
+        and json_query_unsupported(rc, err)
+    ):
+        mark_unsupported(FEATURE_JSON_QUERY)
+        rc, out, err = run_cmd(LEGACY_STATE_QUERY)
+        failed_index = None if rc == 0 else len(commands)
+    if rc != 0 and failed_index == len(commands):
+        return False, f"State verification failed: {format_cli_error(rc, out, err)}"
     if rc != 0:
         command = commands[failed_index] if failed_index is not None else []
         detail = format_cli_error(rc, out, err)
         return False, f"Command {' '.join(command)} failed: {detail}"
 
-    rc, out, err = run_cmd(
-        ["query", "--brightness", "--state"],
-        log_cmd=False,
-        log_stdout=False,
-        log_stderr=False,
-    )
-    if rc != 0:
-        return False, f"State verification failed: {format_cli_error(rc, out, err)}"
-
     desired = clamp_int(profile.get("brightness"), 0, 50, 40)
+    expected = expected_keyboard_state(profile)
     actual = parse_keyboard_state(out)
-    if not state_matches_desired(actual, desired):
+    if not state_matches_desired(actual, desired, expected):
         return (
             False,
             "State verification mismatch: "
-            f"wanted brightness={desired}, got power={actual.power}, "
-            f"brightness={actual.brightness}",
+            f"wanted {describe_state(expected)}, got {describe_state(actual)}",
         )
     return True, "Profile restored and verified."
 
 
 def main():
+    set_lock_priority(PRIORITY_AUTOMATION)
     try:
         store = read_profile_file()
     except (OSError, ValueError) as exc:
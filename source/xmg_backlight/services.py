@@ -14,6 +14,7 @@ from .constants import (
     AUTOMATION_SERVICE_NAME,
     AUTOMATION_SERVICE_PATH,
     AUTOSTART_ENTRY,
+    DRIVER_SERVICE_NAME,
     POWER_MONITOR_SERVICE_NAME,
     POWER_MONITOR_SERVICE_PATH,
     PYTHON_EXECUTABLE,
@@ -205,6 +206,16 @@ def automation_service_status():
     return False, detail or f"Unable to query service status (rc={rc})"
 
 
+def start_driver_service():
+    # --no-block: callers fall back to spawning the driver until it listens.
+    rc, out, err = systemctl_user(["start", "--no-block", DRIVER_SERVICE_NAME])
+    if rc == 0:
+        return True, "Driver server started."
+    if rc == 127:
+        return False, "systemctl not available"
+    return False, err or out or f"Failed to start {DRIVER_SERVICE_NAME} (rc={rc})"
+
+
 def _remove_legacy_automation_units():
     for name, path in (
         (RESUME_SERVICE_NAME, RESUME_SERVICE_PATH),
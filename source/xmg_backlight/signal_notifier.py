@@ -0,0 +1,61 @@
+"""Unix signal delivery into the Qt event loop without periodic wakeups."""
+
+from __future__ import annotations
+
+import signal
+import socket
+
+from PySide6 import QtCore
+
+
+class SignalNotifier(QtCore.QObject):
+    """Emit `received` on the GUI thread for each of the given signals.
+
+    Python only runs its signal handlers when the interpreter regains
+    control, which never happens while Qt sleeps in its event loop. The C
+    level handler writes the signal number to a wakeup socket instead, and a
+    socket notifier wakes the loop exactly when a byte arrives.
+    """
+
+    received = QtCore.Signal(int)
+
+    def __init__(self, signals, parent=None):
+        super().__init__(parent)
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+        self._writer.setblocking(False)
+        self._previous_wakeup_fd = signal.set_wakeup_fd(
+            self._writer.fileno(), warn_on_full_buffer=False
+        )
+        self._previous_handlers = {
+            signum: signal.signal(signum, self._ignore) for signum in signals
+        }
+        self._notifier = QtCore.QSocketNotifier(
+            self._reader.fileno(), QtCore.QSocketNotifier.Read, self
+        )
+        self._notifier.activated.connect(self._drain)
+
+    @staticmethod
+    def _ignore(_signum, _frame):
+        # Only installed so the wakeup socket is written; see _drain.
+        pass
+
+    def _drain(self):
+        try:
+            data = self._reader.recv(64)
+        except (BlockingIOError, InterruptedError):
+            return
+        for signum in data:
+            if signum in self._previous_handlers:
+                self.received.emit(signum)
+
+    def close(self):
+        if self._notifier is None:
+            return
+        self._notifier.setEnabled(False)
+        self._notifier = None
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+        signal.set_wakeup_fd(self._previous_wakeup_fd)
+        self._reader.close()
+        self._writer.close()
@@ -0,0 +1,37 @@
+"""Last known controller state, shared by the window and the tray."""
+
+from __future__ import annotations
+
+import threading
+import time
+
+from .commands import KeyboardState
+
+# Brightness keys and other processes can change the controller behind our
+# back, so a state older than this is read from the hardware again and is
+# never used to plan a write.
+STATE_CACHE_TTL_SECONDS = 5.0
+
+
+class ControllerStateCache:
+    """Updated by every query and write; read from any thread."""
+
+    def __init__(self, ttl: float = STATE_CACHE_TTL_SECONDS, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state: KeyboardState | None = None
+        self._updated = 0.0
+
+    def fresh(self) -> KeyboardState | None:
+        """The last state if it is younger than the TTL, else None."""
+        with self._lock:
+            if self._state is None or self._clock() - self._updated >= self.ttl:
+                return None
+            return self._state
+
+    def update(self, state: KeyboardState | None) -> None:
+        """Record a state read or written; None marks it unknown."""
+        with self._lock:
+            self._state = state
+            self._updated = self._clock()
@@ -1,4 +1,16 @@
-"""Locked, atomic persistence for settings and profiles."""
+"""Locked, atomic persistence for settings and profiles.
+
+`state.json` is a snapshot, and `state.json.journal` holds the changes made
+since it was written: one appended, checksummed record per write. Readers
+replay the journal over the snapshot; once the journal grows past
+`JOURNAL_COMPACT_BYTES` the next write folds it into a new snapshot.
+
+Under the default `strict` durability every record is fsynced before the
+write returns. `grouped` leaves records in the page cache, where other
+processes already see them, and fsyncs the journal once per
+`GROUP_COMMIT_SECONDS` window or on `flush_pending_writes()`. Every fsync is
+recorded as the `storage.fsync` metrics phase.
+"""
 
 from __future__ import annotations
 
@@ -6,11 +18,16 @@ import atexit
 import fcntl
 import json
 import os
+import secrets
 import stat
 import tempfile
+import threading
+import zlib
 from contextlib import contextmanager
 from copy import deepcopy
+from types import MappingProxyType
 
+from . import metrics, profile_logic
 from .capabilities import DIRECTIONS, DYNAMIC_COLORS, EFFECTS, STATIC_COLORS
 from .constants import (
     CONFIG_DIR,
@@ -19,6 +36,7 @@ from .constants import (
     DEFAULT_SETTINGS,
     LANGUAGE_LABELS,
     LOCK_FILE_PATH,
+    PACING_PATH,
     PROFILE_PATH,
     SETTINGS_PATH,
     STATE_PATH,
@@ -27,6 +45,23 @@ from .validation import clamp_int, normalize_language_code, sanitize_choice
 
 
 STATE_SCHEMA = 1
+JOURNAL_COMPACT_BYTES = 16 * 1024
+DURABILITY_POLICIES = ("strict", "grouped")
+GROUP_COMMIT_SECONDS = 0.5
+
+# Validated state keyed by the identity of the snapshot and journal it was
+# read from, with the journal id and the end of its last intact record. The
+# snapshot is only replaced and the journal only appended to, so an unchanged
+# identity means unchanged content and a repeated read costs two lstat().
+_state_snapshot: tuple | None = None
+# Calibrations keyed by the identity of the pacing document, which is also
+# only ever replaced.
+_pacing_snapshot: tuple | None = None
+
+_durability = "strict"
+_group_lock = threading.Lock()
+_group_timer: threading.Timer | None = None
+_group_pending = False
 
 
 class StorageFormatError(ValueError):
@@ -48,6 +83,59 @@ def ensure_config_dir() -> None:
     os.chmod(CONFIG_DIR, 0o700)
 
 
+def set_durability(policy: str) -> None:
+    global _durability
+    if policy not in DURABILITY_POLICIES:
+        raise ValueError(f"Unknown durability policy: {policy}")
+    _durability = policy
+    if policy == "strict":
+        flush_pending_writes()
+
+
+def _fsync(descriptor: int) -> None:
+    with metrics.timed("storage.fsync"):
+        os.fsync(descriptor)
+
+
+def _defer_journal_fsync() -> None:
+    global _group_timer, _group_pending
+    with _group_lock:
+        _group_pending = True
+        if _group_timer is None:
+            _group_timer = threading.Timer(GROUP_COMMIT_SECONDS, flush_pending_writes)
+            _group_timer.daemon = True
+            _group_timer.start()
+
+
+def _forget_pending_writes() -> None:
+    # A compaction made everything appended so far durable.
+    global _group_pending
+    with _group_lock:
+        _group_pending = False
+
+
+def flush_pending_writes() -> None:
+    """Make records appended under `grouped` durability durable now."""
+    global _group_timer, _group_pending
+    with _group_lock:
+        if _group_timer is not None:
+            _group_timer.cancel()
+            _group_timer = None
+        if not _group_pending:
+            return
+        _group_pending = False
+        try:
+            descriptor = os.open(
+                state_journal_path(), os.O_RDONLY | os.O_CLOEXEC | os.O_NOFOLLOW
+            )
+        except FileNotFoundError:
+            return
+        try:
+            _fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+
 @contextmanager
 def _document_lock(path: str, *, exclusive: bool):
     ensure_config_dir()
@@ -70,11 +158,11 @@ def _document_lock(path: str, *, exclusive: bool):
         lock_file.close()
 
 
-def _read_json_unlocked(path: str) -> dict:
+def _read_json_document(path: str) -> tuple[dict, os.stat_result | None]:
     try:
         descriptor = os.open(path, os.O_RDONLY | os.O_CLOEXEC | os.O_NOFOLLOW)
     except FileNotFoundError:
-        return {}
+        return {}, None
     except OSError as exc:
         raise StorageFormatError(f"Cannot safely open {path}: {exc}") from exc
     try:
@@ -92,7 +180,18 @@ def _read_json_unlocked(path: str) -> dict:
             os.close(descriptor)
     if not isinstance(data, dict):
         raise StorageFormatError(f"Expected a JSON object in {path}")
-    return data
+    return data, info
+
+
+def _read_json_unlocked(path: str) -> dict:
+    return _read_json_document(path)[0]
+
+
+def _json_default(value):
+    # unchanged profiles of a state being updated are frozen snapshots
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
 
 def _write_json_unlocked(path: str, data: dict) -> None:
@@ -104,14 +203,14 @@ def _write_json_unlocked(path: str, data: dict) -> None:
         os.fchmod(descriptor, 0o600)
         with os.fdopen(descriptor, "w", encoding="utf-8") as handle:
             descriptor = -1
-            json.dump(data, handle, indent=2, sort_keys=True)
+            json.dump(data, handle, indent=2, sort_keys=True, default=_json_default)
             handle.write("\n")
             handle.flush()
-            os.fsync(handle.fileno())
+            _fsync(handle.fileno())
         os.replace(tmp_path, path)
         directory_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
         try:
-            os.fsync(directory_fd)
+            _fsync(directory_fd)
         finally:
             os.close(directory_fd)
     except Exception:
@@ -124,6 +223,45 @@ def _write_json_unlocked(path: str, data: dict) -> None:
         raise
 
 
+def _pacing_identity(info: os.stat_result) -> tuple:
+    return (PACING_PATH, info.st_dev, info.st_ino, info.st_mtime_ns, info.st_size)
+
+
+def read_pacing_file() -> MappingProxyType:
+    """Calibrations per controller; read-only and cached while unchanged."""
+    global _pacing_snapshot
+    # Replaced atomically, so readers on the command path skip the lock.
+    info = _lstat_or_none(PACING_PATH)
+    if info is None:
+        return MappingProxyType({})
+    cached = _pacing_snapshot
+    if cached is not None and cached[0] == _pacing_identity(info):
+        return cached[1]
+    data, opened = _read_json_document(PACING_PATH)
+    devices = data.get("devices")
+    devices = _freeze(devices if isinstance(devices, dict) else {})
+    if opened is not None:
+        _pacing_snapshot = (_pacing_identity(opened), devices)
+    return devices
+
+
+def write_pacing_calibration(device_key: str, settle: dict) -> dict:
+    cleaned = {
+        str(kind): float(seconds)
+        for kind, seconds in settle.items()
+        if isinstance(seconds, (int, float))
+        and not isinstance(seconds, bool)
+        and 0 <= seconds <= 5
+    }
+    with _document_lock(PACING_PATH, exclusive=True):
+        devices = _read_json_unlocked(PACING_PATH).get("devices")
+        if not isinstance(devices, dict):
+            devices = {}
+        devices[device_key] = cleaned
+        _write_json_unlocked(PACING_PATH, {"devices": devices})
+    return cleaned
+
+
 def acquire_single_instance_lock():
     """Acquire the stable application lock without unlinking it."""
     ensure_config_dir()
@@ -216,10 +354,17 @@ def profile_store_from_raw(raw: dict) -> dict:
             active if active in store["profiles"] else next(iter(store["profiles"]))
         )
         store["revision"] = clamp_int(raw.get("revision"), 0, 2**63 - 1, 0)
+        revisions = raw.get("revisions")
+        if isinstance(revisions, dict):
+            store["revisions"] = {
+                name: clamp_int(revisions.get(name), 1, 2**63 - 1, 1)
+                for name in store["profiles"]
+            }
     elif raw:
         store["profiles"][DEFAULT_PROFILE_NAME] = sanitize_profile_state(raw)
     else:
         store["profiles"][DEFAULT_PROFILE_NAME] = dict(DEFAULT_PROFILE_STATE)
+    store.setdefault("revisions", dict.fromkeys(store["profiles"], 1))
     return store
 
 
@@ -231,18 +376,205 @@ def _state_payload(settings: dict, profile_store: dict) -> dict:
     }
 
 
-def _read_state_unlocked() -> dict:
-    raw = _read_json_unlocked(STATE_PATH)
-    if not raw:
-        if os.path.lexists(STATE_PATH):
-            raise StorageFormatError(f"Malformed application state in {STATE_PATH}")
-        return {}
+def _freeze(value):
+    if isinstance(value, MappingProxyType):
+        return value
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+def state_journal_path() -> str:
+    return f"{STATE_PATH}.journal"
+
+
+def _file_identity(info: os.stat_result, journal_info: os.stat_result | None) -> tuple:
+    journal = None
+    if journal_info is not None:
+        journal = (journal_info.st_ino, journal_info.st_size, journal_info.st_mtime_ns)
+    return (STATE_PATH, info.st_dev, info.st_ino, info.st_mtime_ns, info.st_size, journal)
+
+
+def _remember_state(
+    identity: tuple, state: dict, journal_id: str | None, journal_end: int
+) -> MappingProxyType:
+    global _state_snapshot
+    snapshot = _freeze(state)
+    _state_snapshot = (identity, snapshot, journal_id, journal_end)
+    return snapshot
+
+
+def _lstat_or_none(path: str) -> os.stat_result | None:
+    try:
+        return os.lstat(path)
+    except FileNotFoundError:
+        return None
+
+
+def _cached_state() -> MappingProxyType | None:
+    cached = _state_snapshot
+    if cached is None:
+        return None
+    info = _lstat_or_none(STATE_PATH)
+    if info is None:
+        return None
+    identity = _file_identity(info, _lstat_or_none(state_journal_path()))
+    return cached[1] if cached[0] == identity else None
+
+
+def _check_journal_file(descriptor: int, path: str) -> os.stat_result:
+    info = os.fstat(descriptor)
+    if not stat.S_ISREG(info.st_mode) or info.st_uid != os.getuid():
+        raise StorageFormatError(f"Unsafe persisted document: {path}")
+    return info
+
+
+def _read_journal() -> tuple[bytes, os.stat_result | None]:
+    path = state_journal_path()
+    try:
+        descriptor = os.open(path, os.O_RDONLY | os.O_CLOEXEC | os.O_NOFOLLOW)
+    except FileNotFoundError:
+        return b"", None
+    except OSError as exc:
+        raise StorageFormatError(f"Cannot safely open {path}: {exc}") from exc
+    with os.fdopen(descriptor, "rb") as handle:
+        info = _check_journal_file(handle.fileno(), path)
+        return handle.read(), info
+
+
+def _journal_record(journal_id: str, patch: dict) -> bytes:
+    payload = json.dumps(
+        {"journal": journal_id, "patch": patch},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=_json_default,
+    ).encode("utf-8")
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+
+def _journal_patches(data: bytes, journal_id) -> tuple[list[dict], int]:
+    """Intact records written against `journal_id` and the offset they end at.
+
+    Replay stops at the first torn or damaged line, which is all an
+    interrupted append can leave behind. Records carrying another id predate
+    the snapshot: a crash hit between a compaction and its truncation.
+    """
+    patches = []
+    end = 0
+    if not isinstance(journal_id, str):
+        return patches, end
+    while True:
+        newline = data.find(b"\n", end)
+        if newline < 0:
+            break
+        checksum, _, payload = data[end:newline].partition(b" ")
+        try:
+            if len(checksum) != 8 or int(checksum, 16) != zlib.crc32(payload):
+                break
+            record = json.loads(payload)
+        except ValueError:
+            break
+        if (
+            not isinstance(record, dict)
+            or record.get("journal") != journal_id
+            or not isinstance(record.get("patch"), dict)
+        ):
+            break
+        patches.append(record["patch"])
+        end = newline + 1
+    return patches, end
+
+
+def _mapping_changes(old, new) -> dict:
+    changes = {
+        name: value for name, value in new.items() if name not in old or old[name] != value
+    }
+    changes.update((name, None) for name in old if name not in new)
+    return changes
+
+
+def _state_patch(old, new: dict) -> dict:
+    """Changes from `old` to `new`; None marks a removed profile."""
+    patch = {}
+    settings = {
+        key: value
+        for key, value in new["settings"].items()
+        if key not in old["settings"] or old["settings"][key] != value
+    }
+    if settings:
+        patch["settings"] = settings
+    old_store, new_store = old["profile_store"], new["profile_store"]
+    store = {
+        key: new_store[key]
+        for key in ("active", "revision")
+        if old_store[key] != new_store[key]
+    }
+    for key in ("profiles", "revisions"):
+        changes = _mapping_changes(old_store[key], new_store[key])
+        if changes:
+            store[key] = changes
+    if store:
+        patch["profile_store"] = store
+    return patch
+
+
+def _apply_patch(raw: dict, patch: dict) -> None:
+    settings = patch.get("settings", {})
+    store_patch = patch.get("profile_store", {})
+    if not isinstance(settings, dict) or not isinstance(store_patch, dict):
+        raise StorageFormatError(f"Malformed journal record in {state_journal_path()}")
+    raw["settings"].update(settings)
+    store = raw["profile_store"]
+    for key, value in store_patch.items():
+        if key not in ("profiles", "revisions"):
+            store[key] = value
+            continue
+        target = store.setdefault(key, {})
+        if not isinstance(value, dict) or not isinstance(target, dict):
+            raise StorageFormatError(f"Malformed journal record in {state_journal_path()}")
+        for name, item in value.items():
+            if item is None:
+                target.pop(name, None)
+            else:
+                target[name] = item
+
+
+def _read_state_snapshot_unlocked() -> MappingProxyType | None:
+    while True:
+        raw, info = _read_json_document(STATE_PATH)
+        if not raw:
+            if os.path.lexists(STATE_PATH):
+                raise StorageFormatError(f"Malformed application state in {STATE_PATH}")
+            return None
+        journal_id = raw.get("journal")
+        data, journal_info = _read_journal()
+        patches, journal_end = _journal_patches(data, journal_id)
+        current = _lstat_or_none(STATE_PATH)
+        if current is not None and (current.st_dev, current.st_ino) == (
+            info.st_dev,
+            info.st_ino,
+        ):
+            break
+        # Compacted between the two reads, so the journal may already
+        # belong to the next snapshot. Only lock-free readers get here.
     if raw.get("schema") != STATE_SCHEMA:
         raise StorageFormatError(f"Unsupported state schema in {STATE_PATH}")
     settings = raw.get("settings")
     profile_store = raw.get("profile_store")
     if not isinstance(settings, dict) or not isinstance(profile_store, dict):
         raise StorageFormatError(f"Malformed application state in {STATE_PATH}")
+    for patch in patches:
+        _apply_patch(raw, patch)
     profiles = profile_store.get("profiles")
     active = profile_store.get("active")
     revision = profile_store.get("revision")
@@ -256,7 +588,115 @@ def _read_state_unlocked() -> dict:
         or revision < 0
     ):
         raise StorageFormatError(f"Malformed profile store in {STATE_PATH}")
-    return _state_payload(settings, profile_store)
+    return _remember_state(
+        _file_identity(info, journal_info),
+        _state_payload(settings, profile_store),
+        journal_id if isinstance(journal_id, str) else None,
+        journal_end,
+    )
+
+
+def _read_state_unlocked() -> dict:
+    snapshot = _read_state_snapshot_unlocked()
+    return _thaw(snapshot) if snapshot is not None else {}
+
+
+def _state_for_update_unlocked() -> dict:
+    """Current state with fresh containers down to the profile map.
+
+    The profiles themselves stay shared, frozen snapshots, so an operation
+    that replaces one profile copies references instead of the whole store.
+    Callers hold the exclusive document lock.
+    """
+    snapshot = _cached_state() or _read_state_snapshot_unlocked()
+    if snapshot is None:
+        return _migrated_or_default_state_unlocked()
+    store = snapshot["profile_store"]
+    return {
+        "schema": STATE_SCHEMA,
+        "settings": dict(snapshot["settings"]),
+        "profile_store": {
+            "revision": store["revision"],
+            "active": store["active"],
+            "profiles": dict(store["profiles"]),
+            "revisions": dict(store["revisions"]),
+        },
+    }
+
+
+def _compact_state_unlocked(state: dict) -> None:
+    journal_id = secrets.token_hex(8)
+    path = state_journal_path()
+    # Created before the snapshot is replaced, so that one directory fsync
+    # makes both entries durable.
+    descriptor = os.open(
+        path, os.O_WRONLY | os.O_CREAT | os.O_CLOEXEC | os.O_NOFOLLOW, 0o600
+    )
+    try:
+        _check_journal_file(descriptor, path)
+        os.fchmod(descriptor, 0o600)
+        _write_json_unlocked(STATE_PATH, {**state, "journal": journal_id})
+        # Left-over records carry the old id and are ignored from now on, so
+        # the truncation needs no fsync of its own.
+        os.ftruncate(descriptor, 0)
+        journal_info = os.fstat(descriptor)
+    finally:
+        os.close(descriptor)
+    _forget_pending_writes()
+    _remember_state(
+        _file_identity(os.lstat(STATE_PATH), journal_info), state, journal_id, 0
+    )
+
+
+def _append_state_unlocked(entry: tuple, patch: dict) -> os.stat_result | None:
+    """Append one record; None when the journal is missing or full."""
+    identity, _snapshot, journal_id, journal_end = entry
+    if journal_id is None or identity[-1] is None:
+        return None
+    record = _journal_record(journal_id, patch)
+    if journal_end + len(record) > JOURNAL_COMPACT_BYTES:
+        return None
+    path = state_journal_path()
+    descriptor = os.open(path, os.O_WRONLY | os.O_CLOEXEC | os.O_NOFOLLOW)
+    try:
+        if _check_journal_file(descriptor, path).st_size != journal_end:
+            os.ftruncate(descriptor, journal_end)  # a torn append
+        written = 0
+        while written < len(record):
+            written += os.pwrite(descriptor, record[written:], journal_end + written)
+        if _durability == "grouped":
+            _defer_journal_fsync()
+        else:
+            _fsync(descriptor)
+        journal_info = os.fstat(descriptor)
+    finally:
+        os.close(descriptor)
+    return journal_info
+
+
+def _write_state_unlocked(state: dict) -> None:
+    """Append the changes to the journal, or compact when it is full.
+
+    Callers hold the exclusive document lock, so the cached entry describes
+    the files as they are.
+    """
+    if _cached_state() is None and _read_state_snapshot_unlocked() is None:
+        _compact_state_unlocked(state)
+        return
+    entry = _state_snapshot
+    patch = _state_patch(entry[1], state)
+    if not patch:
+        return
+    journal_info = _append_state_unlocked(entry, patch)
+    if journal_info is None:
+        _compact_state_unlocked(state)
+        return
+    _remember_state(
+        _file_identity(os.lstat(STATE_PATH), journal_info),
+        state,
+        entry[2],
+        journal_info.st_size,
+    )
 
 
 def _migrated_or_default_state_unlocked() -> dict:
@@ -272,7 +712,7 @@ def ensure_app_state() -> dict:
         if state:
             return state
         state = _migrated_or_default_state_unlocked()
-        _write_json_unlocked(STATE_PATH, state)
+        _write_state_unlocked(state)
         for legacy_path in (SETTINGS_PATH, PROFILE_PATH):
             try:
                 os.unlink(legacy_path)
@@ -281,14 +721,31 @@ def ensure_app_state() -> dict:
         return state
 
 
-def _load_state() -> dict:
-    ensure_app_state()
-    with _document_lock(STATE_PATH, exclusive=False):
-        return _read_state_unlocked()
+def _load_state() -> MappingProxyType:
+    snapshot = _cached_state()
+    if snapshot is None:
+        # Writers replace the snapshot atomically and readers ignore a torn
+        # journal append, so reads need no lock. Only a missing document
+        # sends them through creation or migration.
+        snapshot = _read_state_snapshot_unlocked()
+    if snapshot is None:
+        ensure_app_state()
+        snapshot = _read_state_snapshot_unlocked()
+    return snapshot
+
+
+def settings_snapshot() -> MappingProxyType:
+    """Read-only settings; cheap to call when nothing changed on disk."""
+    return _load_state()["settings"]
+
+
+def profile_store_snapshot() -> MappingProxyType:
+    """Read-only profile store; cheap to call when nothing changed on disk."""
+    return _load_state()["profile_store"]
 
 
 def read_settings_file() -> dict:
-    return dict(_load_state()["settings"])
+    return dict(settings_snapshot())
 
 
 def write_settings_file(data) -> dict:
@@ -296,7 +753,7 @@ def write_settings_file(data) -> dict:
     with _document_lock(STATE_PATH, exclusive=True):
         state = _read_state_unlocked() or _migrated_or_default_state_unlocked()
         state["settings"] = payload
-        _write_json_unlocked(STATE_PATH, state)
+        _write_state_unlocked(state)
     return payload
 
 
@@ -305,7 +762,17 @@ def load_settings() -> dict:
 
 
 def read_profile_file() -> dict:
-    return deepcopy(_load_state()["profile_store"])
+    return _thaw(profile_store_snapshot())
+
+
+def _carried_revisions(current: dict, payload: dict) -> dict:
+    """Per-profile revisions for a whole-store write; changed profiles move on."""
+    revisions = {}
+    for name, profile in payload["profiles"].items():
+        revision = profile_logic.profile_revision(current, name)
+        unchanged = revision and current["profiles"][name] == profile
+        revisions[name] = revision if unchanged else revision + 1
+    return revisions
 
 
 def write_profile_file(data, *, expected_revision: int | None = None):
@@ -319,8 +786,9 @@ def write_profile_file(data, *, expected_revision: int | None = None):
             )
         payload = profile_store_from_raw(deepcopy(data))
         payload["revision"] = current_revision + 1
+        payload["revisions"] = _carried_revisions(current, payload)
         state["profile_store"] = payload
-        _write_json_unlocked(STATE_PATH, state)
+        _write_state_unlocked(state)
         return payload
 
 
@@ -357,10 +825,13 @@ def write_profile_and_settings(
             )
         persisted_store = profile_store_from_raw(deepcopy(profile_store))
         persisted_store["revision"] = current_revision + 1
+        persisted_store["revisions"] = _carried_revisions(
+            state["profile_store"], persisted_store
+        )
         persisted_settings = sanitize_settings(settings)
         state["profile_store"] = persisted_store
         state["settings"] = persisted_settings
-        _write_json_unlocked(STATE_PATH, state)
+        _write_state_unlocked(state)
         return persisted_store, persisted_settings
 
 
@@ -371,17 +842,84 @@ def active_profile_from_raw_store(store):
     return normalized["profiles"][normalized["active"]]
 
 
-def switch_active_profile(profile_name: str) -> bool:
+def _update_profile_store(change, expected: dict | None = None) -> int:
+    """Apply `change(store, settings)` under the lock; return the new revision.
+
+    `expected` maps profile names to the revision the caller last saw. Only
+    those profiles are checked, so concurrent edits of other profiles do not
+    conflict; None skips the check and 0 requires the profile to be absent.
+    """
     with _document_lock(STATE_PATH, exclusive=True):
-        state = _read_state_unlocked() or _migrated_or_default_state_unlocked()
+        state = _state_for_update_unlocked()
         store = state["profile_store"]
-        if profile_name not in store["profiles"]:
-            return False
-        if store["active"] == profile_name:
-            return True
-        store["active"] = profile_name
-        store["revision"] = clamp_int(
-            store.get("revision"), 0, 2**63 - 1, 0
-        ) + 1
-        _write_json_unlocked(STATE_PATH, state)
+        for name, revision in (expected or {}).items():
+            current = profile_logic.profile_revision(store, name)
+            if revision is not None and revision != current:
+                raise ProfileConflictError(
+                    f"Profile '{name}' changed from revision {revision} to {current}"
+                )
+        change(store, state["settings"])
+        store["revision"] += 1
+        _write_state_unlocked(state)
+        return store["revision"]
+
+
+def upsert_profile(
+    name: str,
+    profile: dict,
+    *,
+    expected_revision: int | None = None,
+    activate: bool = False,
+) -> int:
+    profile = sanitize_profile_state(profile)
+    return _update_profile_store(
+        lambda store, _settings: profile_logic.upsert_profile(
+            store, name, profile, activate=activate
+        ),
+        {name: expected_revision},
+    )
+
+
+def rename_profile(
+    old_name: str, new_name: str, *, expected_revision: int | None = None
+) -> int:
+    return _update_profile_store(
+        lambda store, settings: profile_logic.rename_profile(
+            store, settings, old_name, new_name
+        ),
+        {old_name: expected_revision},
+    )
+
+
+def delete_profile(name: str, *, expected_revision: int | None = None) -> int:
+    return _update_profile_store(
+        lambda store, settings: profile_logic.delete_profile(store, settings, name),
+        {name: expected_revision},
+    )
+
+
+def set_active(name: str) -> int:
+    return _update_profile_store(
+        lambda store, _settings: profile_logic.set_active(store, name)
+    )
+
+
+def update_settings(changes: dict) -> dict:
+    """Merge `changes` into the persisted settings and return the result."""
+    with _document_lock(STATE_PATH, exclusive=True):
+        state = _state_for_update_unlocked()
+        payload = sanitize_settings({**state["settings"], **changes})
+        state["settings"] = payload
+        _write_state_unlocked(state)
+    return payload
+
+
+def switch_active_profile(profile_name: str) -> bool:
+    store = profile_store_snapshot()
+    if store["active"] == profile_name:
         return True
+    try:
+        set_active(profile_name)
+    except profile_logic.ProfileDomainError:
+        return False
+    return True
@@ -100,7 +100,7 @@ class TrayMixin:
         QtWidgets.QApplication.instance().quit()
 
     def on_tray_menu_about_to_show(self):
-        self.sync_state_from_device()
+        self.request_state_sync()
 
     def on_tray_activated(self, reason):
         if reason in (
@@ -108,7 +108,7 @@ class TrayMixin:
             QtWidgets.QSystemTrayIcon.Context,
             QtWidgets.QSystemTrayIcon.DoubleClick,
         ):
-            self.sync_state_from_device()
+            self.request_state_sync()
         if reason in (
             QtWidgets.QSystemTrayIcon.Trigger,
             QtWidgets.QSystemTrayIcon.DoubleClick,
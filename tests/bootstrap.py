@@ -3,7 +3,13 @@ from pathlib import Path
 
 ROOT = Path(__file__).resolve().parents[1]
 SOURCE = ROOT / "source"
+DRIVER_SOURCE = ROOT / "driver" / "src"
+# pyusb is pure Python, so the vendored wheel imports without libusb installed.
+PYUSB_WHEEL = next((ROOT / "vendor").glob("pyusb-*.whl"))
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 if str(SOURCE) not in sys.path:
     sys.path.insert(0, str(SOURCE))
+for path in (DRIVER_SOURCE, PYUSB_WHEEL):
+    if str(path) not in sys.path:
+        sys.path.append(str(path))
@@ -0,0 +1,114 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+import bootstrap
+
+sys.path.append(str(bootstrap.ROOT / "benchmarks"))
+
+import idle_budget  # noqa: E402
+import storage_concurrency  # noqa: E402
+import storage_fsyncs  # noqa: E402
+import suite  # noqa: E402
+
+
+class BenchmarkSuiteTests(unittest.TestCase):
+    def test_suite_writes_results_and_passes_against_itself(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = str(Path(tmp) / "bench.json")
+            with redirect_stdout(StringIO()):
+                rc = suite.main(
+                    ["--iterations", "3", "--only", "driver.", "--output", output]
+                )
+            self.assertEqual(rc, 0)
+            results = json.loads(Path(output).read_text(encoding="utf-8"))["results"]
+            self.assertEqual(
+                set(results),
+                {
+                    "driver.set_color",
+                    "driver.set_key_colors",
+                    "driver.test_pattern",
+                    "driver.anim_30_frames",
+                },
+            )
+            self.assertGreaterEqual(results["driver.set_color"]["transfers_per_op"], 12)
+
+    def test_compare_flags_only_slowdowns_beyond_the_threshold(self):
+        baseline = {"a": {"mean_ms": 10.0}, "b": {"mean_ms": 10.0}, "c": {"mean_ms": 10.0}}
+        current = {"a": {"mean_ms": 11.9}, "b": {"mean_ms": 12.5}, "d": {"mean_ms": 99.0}}
+        regressions = suite.compare(current, baseline, 0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("b: "))
+
+
+class IdleBudgetTests(unittest.TestCase):
+    def test_proc_sampling_sees_cpu_time_and_wakeups(self):
+        before = idle_budget.sample(os.getpid())
+        deadline = time.process_time() + 0.05
+        while time.process_time() < deadline:
+            pass
+        time.sleep(0.01)
+        cost = idle_budget.idle_cost(before, idle_budget.sample(os.getpid()))
+        self.assertGreater(cost["cpu_ms_per_s"], 0)
+        self.assertGreater(cost["wakeups_per_s"], 0)
+        self.assertGreater(cost["rss_mb"], 1)
+
+    def test_child_processes_are_charged_to_their_parent(self):
+        before = idle_budget.sample(os.getpid())
+        child = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "import time\n"
+                "end = time.process_time() + 0.2\n"
+                "while time.process_time() < end: pass\n"
+                "time.sleep(30)",
+            ]
+        )
+        self.addCleanup(child.wait)
+        self.addCleanup(child.kill)
+        self.assertIn(child.pid, idle_budget.descendants(os.getpid()))
+        deadline = time.monotonic() + 10
+        after = idle_budget.sample(os.getpid())
+        while after.cpu_seconds - before.cpu_seconds < 0.2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+            after = idle_budget.sample(os.getpid())
+        self.assertEqual(after.processes, before.processes + 1)
+        self.assertGreaterEqual(after.cpu_seconds - before.cpu_seconds, 0.2)
+        self.assertGreater(idle_budget.idle_cost(before, after)["wakeups_per_s"], 0)
+
+    def test_each_exceeded_budget_is_reported(self):
+        before = idle_budget.ProcessSample(0.0, 1.0, 100, 0)
+        after = idle_budget.ProcessSample(10.0, 1.1, 150, 200 << 20)
+        cost = idle_budget.idle_cost(before, after)
+        self.assertEqual((cost["wakeups_per_s"], cost["rss_mb"]), (5.0, 200.0))
+        self.assertAlmostEqual(cost["cpu_ms_per_s"], 10.0)
+        failures = idle_budget.over_budget(
+            "automation_daemon", cost, idle_budget.BUDGETS["automation_daemon"]
+        )
+        self.assertEqual(len(failures), 3)
+        self.assertTrue(failures[0].startswith("automation_daemon: wakeups_per_s"))
+
+
+class StorageConcurrencyTests(unittest.TestCase):
+    def test_gui_and_daemon_readers_are_reported(self):
+        report = storage_concurrency.run_benchmark(
+            2, 20, write_interval=0.005, uncached=True
+        )
+        self.assertEqual(set(report), {"gui", "daemon", "total"})
+        self.assertGreater(report["total"]["reads_per_s"], 0)
+
+
+class StorageFsyncTests(unittest.TestCase):
+    def test_grouped_session_needs_fewer_fsyncs_than_strict(self):
+        strict = storage_fsyncs.run_session("strict")
+        grouped = storage_fsyncs.run_session("grouped")
+        self.assertEqual(strict["fsyncs"], strict["saves"])
+        self.assertEqual(grouped["fsyncs"], len(storage_fsyncs.SESSION))
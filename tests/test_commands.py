@@ -1,12 +1,24 @@
 import unittest
+from dataclasses import replace
 
 import bootstrap  # noqa: F401
 
-from xmg_backlight.capabilities import EFFECT_CAPABILITIES
+from ite8291r3_ctl import ite8291r3
+from xmg_backlight.capabilities import (
+    COLOR_IDS,
+    DEFAULT_COLOR,
+    DEFAULT_DIRECTION,
+    DEFAULT_SPEED,
+    DIRECTION_IDS,
+    EFFECT_CAPABILITIES,
+    EFFECT_IDS,
+)
 from xmg_backlight.commands import (
     KeyboardState,
     build_profile_commands,
+    expected_keyboard_state,
     parse_keyboard_state,
+    plan_profile_commands,
     state_matches_desired,
 )
 
@@ -77,3 +89,123 @@ class StateVerificationTests(unittest.TestCase):
         self.assertTrue(state_matches_desired(KeyboardState(40, "on"), 40))
         self.assertFalse(state_matches_desired(KeyboardState(20, "on"), 40))
         self.assertFalse(state_matches_desired(KeyboardState(40, "off"), 40))
+
+    def test_parses_json_state(self):
+        self.assertEqual(
+            parse_keyboard_state(
+                '{"brightness": 40, "color": 8, "direction_or_reactive": 0,'
+                ' "effect": 4, "power": "on", "speed": 5}\n'
+            ),
+            KeyboardState(40, "on", effect=4, speed=5, color=8, direction_or_reactive=0),
+        )
+        self.assertEqual(parse_keyboard_state("{broken"), KeyboardState(None, None))
+
+    def test_effect_fields_are_compared_only_when_reported(self):
+        expected = KeyboardState(40, "on", effect=3, speed=7)
+        self.assertTrue(state_matches_desired(KeyboardState(40, "on"), 40, expected))
+        self.assertTrue(
+            state_matches_desired(KeyboardState(40, "on", effect=3, speed=7), 40, expected)
+        )
+        self.assertFalse(
+            state_matches_desired(KeyboardState(40, "on", effect=3, speed=5), 40, expected)
+        )
+
+
+class ExpectedStateTests(unittest.TestCase):
+    def test_ids_mirror_the_driver_tables(self):
+        self.assertEqual(
+            EFFECT_IDS,
+            {"static": ite8291r3.USER_MODE}
+            | {name: effect()[0] for name, effect in ite8291r3.effects.items()},
+        )
+        self.assertEqual(COLOR_IDS, ite8291r3.colors)
+        self.assertEqual(DIRECTION_IDS, ite8291r3.directions)
+        defaults = ite8291r3.effects["random"]()
+        self.assertEqual(defaults[ite8291r3.effect_attrs.SPEED], DEFAULT_SPEED)
+        self.assertEqual(defaults[ite8291r3.effect_attrs.COLOR], COLOR_IDS[DEFAULT_COLOR])
+        self.assertEqual(
+            ite8291r3.effects["wave"]()[ite8291r3.effect_attrs.DIRECTION],
+            DIRECTION_IDS[DEFAULT_DIRECTION],
+        )
+
+    def test_expected_state_matches_what_the_driver_would_set(self):
+        profiles = (
+            {"speed": 8, "color": "red", "direction": "left", "reactive": True},
+            {"speed": 5, "color": "none", "direction": "none", "reactive": False},
+        )
+        for mode in EFFECT_CAPABILITIES:
+            for options in profiles:
+                with self.subTest(mode=mode, options=options):
+                    profile = {"brightness": 20, "mode": mode, **options}
+                    command = build_profile_commands(profile)[1]
+                    # Mirror the driver: parse the command and build its tuple.
+                    args = command[3:-1]
+                    values = {"brightness": 20}
+                    while args:
+                        flag = args.pop(0)
+                        if flag == "-r":
+                            values["reactive"] = 1
+                        elif flag == "-s":
+                            values["speed"] = int(args.pop(0))
+                        elif flag == "-c":
+                            values["color"] = ite8291r3.colors[args.pop(0)]
+                        elif flag == "-d":
+                            values["direction"] = ite8291r3.directions[args.pop(0)]
+                    sent = ite8291r3.effects[mode](**values)
+                    expected = expected_keyboard_state(profile)
+                    attrs = ite8291r3.effect_attrs
+                    self.assertEqual(expected.effect, sent[attrs.EFFECT])
+                    for name, index in (
+                        ("speed", attrs.SPEED),
+                        ("color", attrs.COLOR),
+                        ("direction_or_reactive", attrs.DIRECTION),
+                    ):
+                        if getattr(expected, name) is not None:
+                            self.assertEqual(getattr(expected, name), sent[index])
+
+    def test_static_and_off_expectations(self):
+        self.assertEqual(
+            expected_keyboard_state({"brightness": 0}), KeyboardState(None, "off")
+        )
+        self.assertEqual(
+            expected_keyboard_state({"brightness": 30, "mode": "static"}).effect,
+            ite8291r3.USER_MODE,
+        )
+
+
+class CommandPlanTests(unittest.TestCase):
+    def profiles(self):
+        base = {"brightness": 30, "speed": 8, "color": "red", "direction": "left"}
+        yield {**base, "mode": "static", "static_color": "blue"}
+        for mode in EFFECT_CAPABILITIES:
+            yield {**base, "mode": mode}
+
+    def test_plan_for_every_effect(self):
+        for profile in self.profiles():
+            with self.subTest(mode=profile["mode"]):
+                full = build_profile_commands(profile)
+                target = expected_keyboard_state(profile)
+                static = profile["mode"] == "static"
+                dimmer = replace(target, brightness=10)
+                off = replace(target, power="off")
+                cases = [
+                    (None, full),
+                    (KeyboardState(brightness=30, power="on"), full),
+                    (off, full[1:]),
+                    (target, full[1:] if static else []),
+                    (dimmer, full[1:] if static else [["brightness", "30"]]),
+                ]
+                other = "wave" if profile["mode"] != "wave" else "rainbow"
+                cases.append((replace(target, effect=EFFECT_IDS[other]), full))
+                if target.speed is not None:
+                    cases.append((replace(target, speed=target.speed + 1), full[1:]))
+                for current, expected in cases:
+                    self.assertEqual(plan_profile_commands(profile, current), expected)
+
+    def test_plan_for_off_profile(self):
+        profile = {"brightness": 0}
+        on = KeyboardState(brightness=30, power="on")
+        off = KeyboardState(brightness=None, power="off")
+        self.assertEqual(plan_profile_commands(profile, on), [["off"]])
+        self.assertEqual(plan_profile_commands(profile, off), [])
+        self.assertEqual(plan_profile_commands(profile, None), [["off"]])
@@ -33,5 +33,6 @@ class DiagnosticsTests(unittest.TestCase):
                 names = set(archive.namelist())
                 self.assertIn("collection-report.json", names)
                 self.assertIn("config/state.json", names)
+                self.assertIn("latency-metrics.json", names)
                 collection = json.loads(archive.read("collection-report.json"))
                 self.assertTrue(collection["errors"])
@@ -0,0 +1,119 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import bootstrap
+
+from ite8291r3_ctl import __main__ as cli
+from ite8291r3_ctl import emulator, ite8291r3
+
+
+class EmulatedDeviceTests(unittest.TestCase):
+    def setUp(self):
+        self.device = emulator.EmulatedDevice()
+        self.handle = ite8291r3.get(emulated_device=self.device)
+
+    def test_rows_and_effects_are_decoded(self):
+        self.handle.set_color((1, 2, 3), brightness=20)
+        self.assertEqual(self.device.effect[:3], [ite8291r3.USER_MODE, 0, 20])
+        self.assertEqual(self.device.key_color(5, 20), (1, 2, 3))
+        self.handle.set_key_colors({(2, 4): (9, 8, 7)}, enable_user_mode=False)
+        self.assertEqual(self.device.key_color(2, 4), (9, 8, 7))
+        self.assertEqual(self.device.key_color(5, 20), (0, 0, 0))
+        self.handle.set_effect(ite8291r3.effects["wave"](speed=3))
+        self.handle.set_palette_color(2, (4, 5, 6))
+        self.handle.turn_off()
+        self.handle.refresh()
+        self.assertTrue(self.handle.is_off())
+        self.assertEqual(self.handle.get_effect()[:2], [0x03, 3])
+        self.assertEqual(self.device.palette[2], (4, 5, 6))
+
+    def test_row_data_without_row_index_is_a_usb_error(self):
+        with self.assertRaises(OSError):
+            self.device.write(emulator.OUT_ENDPOINT, bytes(ite8291r3.ROW_BUFFER_LEN))
+
+    def test_latency_applies_to_every_transfer(self):
+        self.device.latency = 0.01
+        started = time.monotonic()
+        self.handle.refresh()
+        self.assertGreaterEqual(time.monotonic() - started, 0.02)
+        self.assertEqual(self.device.transfers, 2)
+
+    def test_state_file_carries_the_state_to_the_next_device(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "state.json")
+            with mock.patch.object(emulator.atexit, "register"):
+                first = emulator.EmulatedDevice(state_path=path)
+                ite8291r3.get(emulated_device=first).set_color((7, 7, 7), brightness=9)
+                first.save()
+                second = emulator.EmulatedDevice(state_path=path)
+            self.assertEqual(second.effect[ite8291r3.effect_attrs.BRIGHTNESS], 9)
+            self.assertEqual(second.framebuffer, first.framebuffer)
+
+
+class CalibrationTests(unittest.TestCase):
+    def test_settle_times_reflect_a_slow_controller(self):
+        device = emulator.EmulatedDevice(settle=0.02)
+        handle = ite8291r3.get(emulated_device=device)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            cli.handle_calibrate_args(handle, SimpleNamespace(rounds=2))
+        result = json.loads(output.getvalue())
+        self.assertEqual((result["device"], result["revision"]), ("048d:600b", "0003"))
+        self.assertEqual(
+            sorted(result["settle"]), ["brightness", "effect", "monocolor", "off"]
+        )
+        for kind, seconds in result["settle"].items():
+            with self.subTest(kind=kind):
+                self.assertGreaterEqual(seconds, 0.015)
+        self.assertTrue(handle.is_off())
+
+    def test_immediate_controller_needs_no_pause(self):
+        handle = ite8291r3.get(emulated_device=emulator.EmulatedDevice())
+        output = io.StringIO()
+        with redirect_stdout(output):
+            cli.handle_calibrate_args(handle, SimpleNamespace(rounds=1))
+        self.assertEqual(set(json.loads(output.getvalue())["settle"].values()), {0.0})
+
+
+class EmulatorSelectionTests(unittest.TestCase):
+    def test_environment_selects_the_emulator_for_requests(self):
+        executor = cli.RequestExecutor(cli.build_parser())
+        with mock.patch.dict(os.environ, {emulator.ENV_ENABLE: "1"}):
+            self.assertEqual(executor(["brightness", "12"]), (0, "", ""))
+            rc, out, _ = executor(["query", "--json", "--devices"])
+        self.assertEqual(rc, 0)
+        state = json.loads(out)
+        self.assertEqual(state["brightness"], 12)
+        self.assertEqual(state["devices"], ["048d:600b bus 0 addr 0"])
+
+    def test_cli_processes_share_state_through_the_state_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                PYTHONPATH=os.pathsep.join(
+                    (str(bootstrap.DRIVER_SOURCE), str(bootstrap.PYUSB_WHEEL))
+                ),
+            )
+            env[emulator.ENV_ENABLE] = "1"
+            env[emulator.ENV_STATE] = str(Path(tmp) / "state.json")
+            for args in (["effect", "-b", "17", "wave"], ["query", "--json"]):
+                process = subprocess.run(
+                    [sys.executable, "-m", "ite8291r3_ctl", *args],
+                    env=env,
+                    capture_output=True,
+                    text=True,
+                    timeout=30,
+                )
+                self.assertEqual(process.returncode, 0, process.stderr)
+        state = json.loads(process.stdout)
+        self.assertEqual((state["effect"], state["brightness"]), (0x03, 17))
@@ -1,13 +1,25 @@
+import fcntl
+import json
+import os
 import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
 from unittest import mock
 
-import bootstrap  # noqa: F401
+import bootstrap
 
-from xmg_backlight import driver
+from xmg_backlight import cancellation, driver, metrics, storage
 
 
 class DriverExecutionTests(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(driver._unsupported_features, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @mock.patch("xmg_backlight.driver.subprocess.run")
     def test_timeout_is_structured(self, run):
         run.side_effect = subprocess.TimeoutExpired(["tool"], 2)
@@ -18,9 +30,36 @@ class DriverExecutionTests(unittest.TestCase):
 
     @mock.patch("xmg_backlight.driver.resolve_tool", return_value="/tool")
     @mock.patch("xmg_backlight.driver.hardware_lock")
+    @mock.patch("xmg_backlight.driver._request_server_batch", return_value=None)
+    @mock.patch("xmg_backlight.driver.subprocess.run")
+    def test_sequence_stops_at_first_failure(self, run, _server, lock, _resolve):
+        lock.return_value.__enter__.return_value = driver.HardwareLease("interactive")
+        lines = [
+            {"rc": 0, "stdout": "", "stderr": ""},
+            {"rc": 7, "stdout": "", "stderr": "bad"},
+        ]
+        run.return_value = subprocess.CompletedProcess(
+            ["/tool", "batch"],
+            7,
+            "".join(json.dumps(line) + "\n" for line in lines),
+            "",
+        )
+        commands = [["off"], ["effect", "rainbow"], ["brightness", "40"]]
+        result = driver.run_sequence(commands, inter_command_delay=0)
+        self.assertEqual(result, (7, "", "bad", 1))
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(run.call_args.args[0], ["/tool", "batch", "--delay", "0"])
+        self.assertEqual(json.loads(run.call_args.kwargs["input"]), commands)
+
+    @mock.patch("xmg_backlight.driver.resolve_tool", return_value="/tool")
+    @mock.patch("xmg_backlight.driver.hardware_lock")
+    @mock.patch("xmg_backlight.driver._request_server_batch", return_value=None)
+    @mock.patch("xmg_backlight.driver._run_batch_unlocked", return_value=None)
     @mock.patch("xmg_backlight.driver._run_unlocked")
-    def test_sequence_stops_at_first_failure(self, run, lock, _resolve):
-        lock.return_value.__enter__.return_value = None
+    def test_driver_without_batch_runs_each_command(
+        self, run, _batch, _server, lock, _resolve
+    ):
+        lock.return_value.__enter__.return_value = driver.HardwareLease("interactive")
         run.side_effect = [(0, "", ""), (7, "", "bad"), (0, "", "")]
         result = driver.run_sequence(
             [["off"], ["effect", "rainbow"], ["brightness", "40"]],
@@ -29,8 +68,409 @@ class DriverExecutionTests(unittest.TestCase):
         self.assertEqual(result, (7, "", "bad", 1))
         self.assertEqual(run.call_count, 2)
 
+    @mock.patch("xmg_backlight.driver.resolve_tool", return_value="/tool")
+    @mock.patch("xmg_backlight.driver.hardware_lock")
+    @mock.patch("xmg_backlight.driver._request_server_batch", return_value=None)
+    @mock.patch("xmg_backlight.driver._run_unlocked", return_value=(0, "", ""))
+    @mock.patch("xmg_backlight.driver.subprocess.run")
+    def test_driver_without_batch_is_not_asked_again(
+        self, run, each, _server, lock, _resolve
+    ):
+        lock.return_value.__enter__.return_value = driver.HardwareLease("interactive")
+        run.return_value = subprocess.CompletedProcess(
+            ["/tool", "batch"],
+            2,
+            "",
+            "ite8291r3-ctl: error: argument command: invalid choice: 'batch'",
+        )
+        for _ in range(3):
+            result = driver.run_sequence([["off"], ["brightness", "40"]], inter_command_delay=0)
+            self.assertEqual(result, (0, "", "", None))
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(each.call_count, 6)
+        self.assertTrue(driver.driver_supports(driver.FEATURE_BATCH, "/other-tool"))
+
+    @mock.patch("xmg_backlight.driver.subprocess.run")
+    def test_unknown_batch_subcommand_requests_fallback(self, run):
+        run.return_value = subprocess.CompletedProcess(
+            ["/tool", "batch"],
+            2,
+            "",
+            "ite8291r3-ctl: error: argument command: invalid choice: 'batch'",
+        )
+        self.assertIsNone(
+            driver._run_batch_unlocked("/tool", [["off"]], delay=0, timeout=1)
+        )
+
+    @mock.patch("xmg_backlight.driver.subprocess.run")
+    def test_rejected_batch_fails_at_first_command(self, run):
+        run.return_value = subprocess.CompletedProcess(
+            ["/tool", "batch"], 2, "", "invalid batch: malformed"
+        )
+        self.assertEqual(
+            driver._run_batch_unlocked("/tool", [["off"]], delay=0, timeout=1),
+            [(2, "", "invalid batch: malformed")],
+        )
+
     @mock.patch("xmg_backlight.driver.resolve_tool", return_value=None)
     def test_missing_bundled_driver_is_not_hidden(self, _resolve):
         rc, _, error = driver.run_cmd(["query"])
         self.assertEqual(rc, 127)
         self.assertIn("bundled", error.lower())
+
+
+class RecordingTransport(driver.DriverTransport):
+    name = "recording"
+
+    def __init__(self, result):
+        self.result = result
+        self.requests = []
+
+    def execute(self, tool, args, *, timeout):
+        self.requests.append(list(args))
+        return self.result
+
+    def execute_sequence(self, tool, commands, *, delay, timeout):
+        self.requests.append([list(args) for args in commands])
+        return None if self.result is None else [self.result] * len(commands)
+
+
+@mock.patch("xmg_backlight.driver.resolve_tool", return_value="/tool")
+@mock.patch("xmg_backlight.driver.hardware_lock")
+class DriverTransportTests(unittest.TestCase):
+    def tearDown(self):
+        driver.set_driver_transports(None)
+
+    def test_first_transport_with_an_answer_is_used(self, lock, _resolve):
+        lock.return_value.__enter__.return_value = driver.HardwareLease("interactive")
+        declining = RecordingTransport(None)
+        answering = RecordingTransport((0, "40\non", ""))
+        driver.set_driver_transports([declining, answering])
+        self.assertEqual(driver.run_cmd(["query"]), (0, "40\non", ""))
+        self.assertEqual(
+            driver.run_sequence([["off"], ["query"]]), (0, "40\non", "", None)
+        )
+        self.assertEqual(declining.requests, answering.requests)
+        self.assertEqual(len(answering.requests), 2)
+
+    def test_results_report_the_lock_wait(self, lock, _resolve):
+        lock.return_value.__enter__.return_value = driver.HardwareLease(
+            "automation", waited=0.3
+        )
+        driver.set_driver_transports([RecordingTransport((0, "40\non", ""))])
+        result = driver.run_cmd(["query"])
+        self.assertEqual((result, result.lock_wait), ((0, "40\non", ""), 0.3))
+        result = driver.run_sequence([["off"], ["query"]])
+        self.assertEqual((result, result.lock_wait), ((0, "40\non", "", None), 0.3))
+
+    def test_no_accepting_transport_is_an_error(self, lock, _resolve):
+        lock.return_value.__enter__.return_value = driver.HardwareLease("interactive")
+        driver.set_driver_transports([RecordingTransport(None)])
+        rc, _, error = driver.run_cmd(["query"])
+        self.assertEqual(rc, 1)
+        self.assertEqual(error, driver.NO_TRANSPORT_MESSAGE)
+
+    def test_default_order_prefers_the_server(self, _lock, _resolve):
+        driver.set_driver_transports(None)
+        self.assertEqual(
+            [transport.name for transport in driver.driver_transports()],
+            ["server", "subprocess"],
+        )
+
+
+class HardwareLockTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "hardware.lock")
+        for patcher in (
+            mock.patch.object(driver, "HARDWARE_LOCK_PATH", self.path),
+            mock.patch.object(driver, "ensure_config_dir"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def hold(self):
+        holder = driver._LockFile(self.path)
+        self.assertTrue(holder.try_lock(fcntl.LOCK_EX))
+        return holder
+
+    def test_waiter_reports_time_spent_blocked(self):
+        with driver.hardware_lock() as lease:
+            self.assertEqual((lease.priority, lease.yielded), ("interactive", 0))
+        holder = self.hold()
+        threading.Timer(0.2, holder.close).start()
+        with driver.hardware_lock(timeout=5, priority="automation") as lease:
+            self.assertGreaterEqual(lease.waited, 0.15)
+
+    def test_waiter_blocks_until_the_holder_releases(self):
+        holder = self.hold()
+        threading.Timer(0.5, holder.close).start()
+        with mock.patch.object(
+            driver.fcntl, "flock", wraps=fcntl.flock
+        ) as flock, driver.hardware_lock(timeout=5):
+            attempts = [
+                call
+                for call in flock.call_args_list
+                if call.args[1] == fcntl.LOCK_EX | fcntl.LOCK_NB
+            ]
+        # one attempt before the release and one after it
+        self.assertLessEqual(len(attempts), 3)
+
+    def test_a_holder_that_exits_wakes_the_waiter(self):
+        script = (
+            "import fcntl, os, sys, time\n"
+            "sys.path.insert(0, sys.argv[2])\n"
+            "from xmg_backlight import driver\n"
+            "holder = driver._LockFile(sys.argv[1])\n"
+            "holder.try_lock(fcntl.LOCK_EX)\n"
+            "print(flush=True)\n"
+            "time.sleep(30)\n"
+        )
+        source = os.path.dirname(os.path.dirname(driver.__file__))
+        process = subprocess.Popen(
+            [sys.executable, "-c", script, self.path, source],
+            stdout=subprocess.PIPE,
+        )
+        self.addCleanup(process.wait)
+        process.stdout.readline()
+        process.stdout.close()
+        threading.Timer(0.2, process.kill).start()
+        started = time.monotonic()
+        with driver.hardware_lock(timeout=5):
+            self.assertLess(time.monotonic() - started, 2)
+
+    def test_timeout_leaves_the_lock_usable(self):
+        holder = self.hold()
+        with self.assertRaises(driver.HardwareBusyError):
+            with driver.hardware_lock(timeout=0.1):
+                pass
+        holder.close()
+        with driver.hardware_lock(timeout=2) as lease:
+            self.assertLess(lease.waited, 2)
+
+    def test_timed_out_waits_leave_no_threads_or_descriptors_behind(self):
+        def open_descriptors():
+            return len(os.listdir("/proc/self/fd"))
+
+        holder = self.hold()
+        self.addCleanup(holder.close)
+        threads, descriptors = threading.active_count(), open_descriptors()
+        for _ in range(5):
+            with self.assertRaises(driver.HardwareBusyError):
+                with driver.hardware_lock(timeout=0.05):
+                    pass
+        self.assertEqual(threading.active_count(), threads)
+        self.assertEqual(open_descriptors(), descriptors)
+
+    def test_interactive_waiter_goes_before_queued_background_work(self):
+        holder = self.hold()
+        order = []
+
+        def acquire(priority):
+            with driver.hardware_lock(timeout=5, priority=priority):
+                order.append(priority)
+                time.sleep(0.05)
+
+        threads = []
+        for priority in ("diagnostics", "automation", "interactive"):
+            thread = threading.Thread(target=acquire, args=(priority,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.1)
+        holder.close()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(order, ["interactive", "automation", "diagnostics"])
+
+    def test_unknown_priority_is_rejected(self):
+        with self.assertRaises(ValueError):
+            driver.set_lock_priority("urgent")
+        with self.assertRaises(ValueError):
+            with driver.hardware_lock(priority="urgent"):
+                pass
+
+
+class CancellationTests(unittest.TestCase):
+    def setUp(self):
+        self.token = cancellation.CancelToken()
+        activated = cancellation.activate(self.token)
+        activated.__enter__()
+        self.addCleanup(activated.__exit__, None, None, None)
+
+    def test_cancelling_terminates_the_running_driver_process(self):
+        threading.Timer(0.2, self.token.cancel).start()
+        started = time.monotonic()
+        result = driver._run_unlocked(
+            sys.executable, ["-c", "import time; time.sleep(30)"], timeout=30
+        )
+        self.assertEqual(result[0], driver.CANCELLED_RC)
+        self.assertLess(time.monotonic() - started, 10)
+
+    @mock.patch("xmg_backlight.driver.resolve_tool", return_value="/tool")
+    @mock.patch("xmg_backlight.driver.hardware_lock")
+    @mock.patch("xmg_backlight.driver._server_roundtrip")
+    def test_apply_with_a_token_is_still_one_batch_request(self, roundtrip, lock, _resolve):
+        lock.return_value.__enter__.return_value = driver.HardwareLease("interactive")
+        driver.set_driver_transports([driver.ServerTransport()])
+        self.addCleanup(driver.set_driver_transports, None)
+        roundtrip.return_value = {
+            "results": [{"rc": 0, "stdout": "", "stderr": ""}] * 3
+        }
+        commands = [["off"], ["effect", "rainbow"], ["brightness", "40"]]
+        result = driver.run_sequence(commands, inter_command_delay=0.01)
+        self.assertEqual(result, (0, "", "", None))
+        roundtrip.assert_called_once()
+        self.assertEqual(roundtrip.call_args.args[0]["batch"], commands)
+
+    @mock.patch("xmg_backlight.driver.resolve_tool", return_value="/tool")
+    @mock.patch("xmg_backlight.driver.hardware_lock")
+    def test_cancelled_task_does_not_take_the_lock(self, lock, _resolve):
+        self.token.cancel()
+        rc, _, error = driver.run_cmd(["brightness", "20"])
+        self.assertEqual(rc, driver.CANCELLED_RC)
+        self.assertEqual(driver.format_cli_error(rc, "", error), error)
+        lock.assert_not_called()
+
+    def test_lock_wait_ends_on_cancellation(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "hardware.lock")
+        with mock.patch.object(driver, "HARDWARE_LOCK_PATH", path), mock.patch.object(
+            driver, "ensure_config_dir"
+        ):
+            with open(path, "a") as holder:
+                fcntl.flock(holder.fileno(), fcntl.LOCK_EX)
+                threading.Timer(0.1, self.token.cancel).start()
+                started = time.monotonic()
+                with self.assertRaises(cancellation.TaskCancelled):
+                    with driver.hardware_lock(timeout=5):
+                        pass
+                self.assertLess(time.monotonic() - started, 2)
+
+
+class PacingTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.sysfs = os.path.join(tmp.name, "usb")
+        config = os.path.join(tmp.name, "config")
+        for patcher in (
+            mock.patch.object(driver, "USB_SYSFS_DIR", self.sysfs),
+            mock.patch.multiple(
+                storage,
+                CONFIG_DIR=config,
+                PACING_PATH=os.path.join(config, "pacing.json"),
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.attach("1-1", "8087", "0026", "0002")
+        self.attach("1-3", "048d", "600B", "0003")
+        self.commands = [["off"], ["effect", "wave"], ["brightness", "30"]]
+
+    def attach(self, name, vendor, product, revision):
+        device = os.path.join(self.sysfs, name)
+        os.makedirs(device)
+        for attribute, value in (
+            ("idVendor", vendor),
+            ("idProduct", product),
+            ("bcdDevice", revision),
+        ):
+            with open(os.path.join(device, attribute), "w") as handle:
+                handle.write(value + "\n")
+
+    def test_controllers_are_identified_from_sysfs(self):
+        self.assertEqual(driver.connected_controller_keys(), ["048d:600b:0003"])
+
+    def test_uncalibrated_controller_keeps_the_default(self):
+        storage.write_pacing_calibration("048d:600b:0004", {"off": 0.001})
+        self.assertEqual(
+            driver.sequence_delay(self.commands), driver.DEFAULT_INTER_COMMAND_DELAY
+        )
+
+    def test_calibrated_settle_times_pace_the_sequence(self):
+        storage.write_pacing_calibration(
+            "048d:600b:0003",
+            {"off": 0.002, "effect": 0.004, "brightness": 0.03, "bogus": "x"},
+        )
+        # the last command needs no pause after it
+        self.assertAlmostEqual(
+            driver.sequence_delay(self.commands), 0.004 * driver.PACING_MARGIN
+        )
+        self.assertEqual(
+            driver.sequence_delay([["palette", "--restore"], ["off"]]),
+            driver.DEFAULT_INTER_COMMAND_DELAY,
+        )
+
+    def test_calibration_and_controller_are_read_once_while_unchanged(self):
+        storage.write_pacing_calibration(
+            "048d:600b:0003", {"off": 0.01, "effect": 0.01, "brightness": 0.01}
+        )
+        with mock.patch.object(
+            storage, "_read_json_document", wraps=storage._read_json_document
+        ) as read, mock.patch.object(
+            driver.os, "listdir", wraps=os.listdir
+        ) as listdir:
+            for _ in range(3):
+                driver.sequence_delay(self.commands)
+            self.assertEqual((read.call_count, listdir.call_count), (1, 1))
+            # a new calibration replaces the file and is picked up
+            storage.write_pacing_calibration(
+                "048d:600b:0003", {"off": 0.02, "effect": 0.02, "brightness": 0.02}
+            )
+            self.assertAlmostEqual(
+                driver.sequence_delay(self.commands), 0.02 * driver.PACING_MARGIN
+            )
+            self.assertEqual(listdir.call_count, 1)
+
+    @mock.patch("xmg_backlight.driver.resolve_tool", return_value="/tool")
+    @mock.patch("xmg_backlight.driver.hardware_lock")
+    @mock.patch("xmg_backlight.driver._execute_sequence_unlocked")
+    def test_run_sequence_uses_the_calibrated_delay(self, execute, lock, _resolve):
+        lock.return_value.__enter__.return_value = driver.HardwareLease("interactive")
+        execute.return_value = [(0, "", "")] * 3
+        storage.write_pacing_calibration(
+            "048d:600b:0003", {"off": 0.0, "effect": 0.0, "brightness": 0.0}
+        )
+        driver.run_sequence(self.commands)
+        self.assertEqual(execute.call_args.kwargs["delay"], 0.0)
+
+
+class DriverTimingTests(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_spawned_driver_reports_its_phases(self):
+        env = {
+            "PYTHONPATH": os.pathsep.join(
+                (str(bootstrap.DRIVER_SOURCE), str(bootstrap.PYUSB_WHEEL))
+            ),
+            "ITE8291R3_EMULATOR": "1",
+        }
+        with mock.patch.dict(os.environ, env):
+            process = driver._spawn_driver(
+                [sys.executable, "-m", "ite8291r3_ctl", "query", "--json"],
+                capture_output=True,
+                text=True,
+                timeout=30,
+            )
+        self.assertEqual(process.returncode, 0, process.stderr)
+        phases = metrics.snapshot()
+        for phase in (
+            "driver.process",
+            "driver.import",
+            "driver.main",
+            "driver.startup",
+            "driver.usb.ctrl_in",
+        ):
+            with self.subTest(phase=phase):
+                self.assertEqual(phases[phase]["count"], 1)
+
+    @mock.patch("xmg_backlight.driver.subprocess.run")
+    def test_driver_without_timings_only_records_the_process(self, run):
+        run.return_value = subprocess.CompletedProcess(["/tool"], 0, "", "")
+        driver._run_unlocked("/tool", ["query"], timeout=1)
+        self.assertEqual(list(metrics.snapshot()), ["driver.process"])
+        self.assertIn(driver.DRIVER_TIMINGS_ENV, run.call_args.kwargs["env"])
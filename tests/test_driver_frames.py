@@ -0,0 +1,273 @@
+import array
+import json
+import time
+import unittest
+from unittest import mock
+
+import bootstrap  # noqa: F401
+
+from ite8291r3_ctl import __main__ as cli
+from ite8291r3_ctl import ite8291r3
+
+
+class FakeUsbDevice:
+    def __init__(self, effect=(ite8291r3.USER_MODE, 0, 30, 0, 0, 0)):
+        self.effect = list(effect)
+        self.transfers = []
+
+    def write(self, endpoint, data):
+        self.transfers.append(("data", bytes(data)))
+        return len(data)
+
+    def ctrl_transfer(self, request_type, request, value, index, data_or_length):
+        if request_type & 0x80:
+            self.transfers.append(("in",))
+            return [ite8291r3.commands.GET_EFFECT, 0x02, *self.effect]
+        self.transfers.append(("ctrl", tuple(data_or_length)))
+        return len(data_or_length)
+
+
+class DirtyRowTests(unittest.TestCase):
+    def setUp(self):
+        self.device = FakeUsbDevice()
+        self.handle = ite8291r3.ite8291r3(self.device, object())
+
+    def row_transfers(self):
+        transfers = [
+            transfer
+            for transfer in self.device.transfers
+            if transfer[0] == "data"
+            or transfer[0] == "ctrl" and transfer[1][0] == ite8291r3.commands.SET_ROW_INDEX
+        ]
+        self.device.transfers.clear()
+        return transfers
+
+    def test_unchanged_frame_is_not_sent_again(self):
+        frame = {(row, 0): (255, 0, 0) for row in range(ite8291r3.NUM_ROWS)}
+        self.assertEqual(self.handle.set_key_colors(frame), 0)
+        self.assertEqual(len(self.row_transfers()), 12)
+        self.assertEqual(self.handle.set_key_colors(frame), 12)
+        self.assertEqual(self.row_transfers(), [])
+        # the device already reports user mode, so neither switch to it is sent
+        self.assertEqual(self.handle.skipped_transfers, 14)
+
+    def test_only_changed_rows_are_sent(self):
+        self.handle.set_key_colors({(0, 0): (1, 2, 3)}, enable_user_mode=False)
+        self.row_transfers()
+        skipped = self.handle.set_key_colors(
+            {(0, 0): (1, 2, 3), (4, 7): (9, 9, 9)}, enable_user_mode=False
+        )
+        transfers = self.row_transfers()
+        self.assertEqual(skipped, 10)
+        self.assertEqual(transfers[0], ("ctrl", (22, 0, 4, 0, 0, 0, 0, 0)))
+        row = transfers[1][1]
+        self.assertEqual(len(row), ite8291r3.ROW_BUFFER_LEN)
+        self.assertEqual(
+            (
+                row[ite8291r3.ROW_RED_OFFSET + 7],
+                row[ite8291r3.ROW_GREEN_OFFSET + 7],
+                row[ite8291r3.ROW_BLUE_OFFSET + 7],
+            ),
+            (9, 9, 9),
+        )
+
+    def test_force_resends_every_row(self):
+        self.handle.set_key_colors({}, enable_user_mode=False)
+        self.row_transfers()
+        self.assertEqual(self.handle.set_key_colors({}, enable_user_mode=False, force=True), 0)
+        self.assertEqual(len(self.row_transfers()), 12)
+
+    def test_firmware_effect_and_off_invalidate_the_frame(self):
+        for change in (
+            self.handle.turn_off,
+            lambda: self.handle.set_effect(ite8291r3.effects["wave"]()),
+            self.handle.forget_frame,
+        ):
+            with self.subTest(change=change):
+                self.handle.set_key_colors({}, enable_user_mode=False)
+                change()
+                self.row_transfers()
+                self.assertEqual(self.handle.set_key_colors({}, enable_user_mode=False), 0)
+
+    def test_solid_color_is_remembered_as_the_frame(self):
+        self.handle.set_color((10, 20, 30), brightness=20)
+        self.row_transfers()
+        frame = {
+            (row, col): (10, 20, 30)
+            for row in range(ite8291r3.NUM_ROWS)
+            for col in range(ite8291r3.NUM_COLS)
+        }
+        self.assertEqual(self.handle.set_key_colors(frame, enable_user_mode=False), 12)
+
+    def test_solid_color_row_is_encoded_once(self):
+        ite8291r3.solid_row.cache_clear()
+        self.handle.set_color((10, 20, 30), brightness=20)
+        self.handle.set_color([10, 20, 30], brightness=20)
+        rows = [data for kind, *data in self.device.transfers if kind == "data"]
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(len(set(map(tuple, rows))), 1)
+        self.assertEqual(ite8291r3.solid_row.cache_info().misses, 1)
+
+    def test_failed_row_write_is_not_remembered(self):
+        def fail(*_args):
+            raise OSError("pipe error")
+
+        self.device.write = fail
+        with self.assertRaises(OSError):
+            self.handle.set_key_colors({}, enable_user_mode=False)
+        del self.device.write
+        self.device.transfers.clear()
+        self.assertEqual(self.handle.set_key_colors({}, enable_user_mode=False), 0)
+
+
+class ShadowStateTests(unittest.TestCase):
+    def setUp(self):
+        self.device = FakeUsbDevice(effect=(3, 5, 25, 0, 1, 0))
+        self.handle = ite8291r3.ite8291r3(self.device, object())
+
+    def reads(self):
+        count = self.device.transfers.count(("in",))
+        self.device.transfers.clear()
+        return count
+
+    def test_state_is_read_once_and_then_served_from_the_shadow(self):
+        self.assertEqual(self.handle.get_brightness(), 25)
+        self.assertFalse(self.handle.is_off())
+        self.handle.freeze()
+        self.assertEqual(self.reads(), 1)
+        self.assertEqual(self.handle.get_effect(), [3, 11, 25, 0, 1, 0])
+
+    def test_streaming_key_colors_does_not_read_back_or_rewrite_the_mode(self):
+        self.handle.set_key_colors({(0, 0): (1, 2, 3)})
+        self.assertEqual(self.reads(), 1)
+        self.handle.set_key_colors({(0, 0): (4, 5, 6)})
+        self.assertEqual(
+            [t for t in self.device.transfers if t[0] == "ctrl" and t[1][0] == ite8291r3.commands.SET_EFFECT],
+            [],
+        )
+        self.assertEqual(self.reads(), 0)
+
+    def test_redundant_writes_are_suppressed(self):
+        self.handle.set_effect(ite8291r3.effects["wave"](brightness=10))
+        self.handle.set_brightness(20)
+        self.handle.set_palette_color(1, (1, 2, 3))
+        self.device.transfers.clear()
+        self.handle.set_effect(ite8291r3.effects["wave"](brightness=20))
+        self.handle.set_brightness(20)
+        self.handle.set_palette_color(1, [1, 2, 3])
+        self.assertEqual(self.device.transfers, [])
+        self.handle.set_effect(ite8291r3.effects["wave"](brightness=20, save=1))
+        self.assertEqual(len(self.device.transfers), 1)
+
+    def test_shadow_expires(self):
+        self.handle.get_brightness()
+        self.reads()
+        later = time.monotonic() + ite8291r3.SHADOW_TTL
+        self.device.effect[2] = 40
+        with mock.patch.object(ite8291r3.time, "monotonic", return_value=later):
+            self.handle.set_brightness(25)
+            self.assertEqual(
+                self.device.transfers, [("ctrl", (9, 2, 25, 0, 0, 0, 0, 0))]
+            )
+            self.device.transfers.clear()
+            self.assertEqual(self.handle.get_brightness(), 40)
+        self.assertEqual(self.reads(), 1)
+
+    def test_refresh_usb_error_and_release_drop_the_shadow(self):
+        self.handle.set_palette_color(2, (9, 9, 9))
+        self.handle.get_brightness()
+        self.device.effect[2] = 44
+        self.handle.refresh()
+        self.assertEqual(self.handle.get_brightness(), 44)
+        self.handle.set_palette_color(2, (9, 9, 9))
+        self.reads()
+
+        def fail(*_args):
+            raise OSError("pipe error")
+
+        with mock.patch.object(self.device, "ctrl_transfer", side_effect=fail):
+            with self.assertRaises(OSError):
+                self.handle.set_brightness(10)
+        self.handle.get_brightness()
+        self.assertEqual(self.reads(), 1)
+
+        with mock.patch.object(ite8291r3.usb.util, "release_interface"):
+            self.handle.release()
+        self.handle.get_brightness()
+        self.assertEqual(self.reads(), 1)
+
+
+class FrameTests(unittest.TestCase):
+    def setUp(self):
+        self.device = FakeUsbDevice()
+        self.handle = ite8291r3.ite8291r3(self.device, object())
+
+    def sent_rows(self, send):
+        send(ite8291r3.ite8291r3(self.device, object()))
+        rows = [data for kind, *data in self.device.transfers if kind == "data"]
+        self.device.transfers.clear()
+        return rows
+
+    def test_buffer_frame_matches_key_color_map(self):
+        color_map = {
+            (row, col): (row * 40, col * 12, 255 - col)
+            for row in range(ite8291r3.NUM_ROWS)
+            for col in range(ite8291r3.NUM_COLS)
+        }
+        frame = bytes(
+            channel
+            for row in range(ite8291r3.NUM_ROWS)
+            for col in range(ite8291r3.NUM_COLS)
+            for channel in color_map[(row, col)]
+        )
+        expected = self.sent_rows(lambda handle: handle.set_key_colors(color_map))
+        self.assertEqual(len(expected), ite8291r3.NUM_ROWS)
+        # a (6, 21, 3) view like a numpy array, and a non-contiguous one
+        shaped = memoryview(frame).cast(
+            "B", (ite8291r3.NUM_ROWS, ite8291r3.NUM_COLS, 3)
+        )
+        strided = memoryview(bytes(value for value in frame for _ in range(2)))[::2]
+        for buffer in (frame, bytearray(frame), array.array("B", frame), shaped, strided):
+            with self.subTest(buffer=buffer):
+                self.assertEqual(
+                    self.sent_rows(lambda handle: handle.set_frame(buffer)), expected
+                )
+
+    def test_frame_rows_are_skipped_like_key_colors(self):
+        frame = bytes(ite8291r3.FRAME_LEN)
+        self.handle.set_key_colors({}, enable_user_mode=False)
+        self.assertEqual(self.handle.set_frame(frame, enable_user_mode=False), 12)
+
+    def test_frame_of_wrong_shape_is_rejected(self):
+        for frame in (
+            bytes(ite8291r3.FRAME_LEN - 3),
+            array.array("H", bytes(ite8291r3.FRAME_LEN)),
+        ):
+            with self.subTest(frame=frame):
+                with self.assertRaises(ValueError):
+                    self.handle.set_frame(frame)
+        self.assertEqual(self.device.transfers, [])
+
+
+class JsonQueryTests(unittest.TestCase):
+    def test_json_query_reads_the_state_once(self):
+        device = FakeUsbDevice(effect=(0x04, 6, 40, 8, 1, 0))
+        handle = ite8291r3.ite8291r3(device, object())
+        executor = cli.RequestExecutor(cli.build_parser())
+        with mock.patch.object(ite8291r3, "get", return_value=handle), mock.patch.object(
+            ite8291r3.usb.util, "release_interface"
+        ):
+            rc, out, _ = executor(["query", "--json"])
+        self.assertEqual(rc, 0)
+        self.assertEqual(
+            json.loads(out),
+            {
+                "power": "on",
+                "effect": 4,
+                "speed": 6,
+                "brightness": 40,
+                "color": 8,
+                "direction_or_reactive": 1,
+            },
+        )
+        self.assertEqual(device.transfers.count(("in",)), 1)
@@ -24,6 +24,28 @@ class BundledDriverTests(unittest.TestCase):
         self.assertFalse(any(name.startswith("xmg_backlight/") for name in names))
         self.assertFalse(any("__pycache__" in name or name.endswith(".pyc") for name in names))
 
+    def test_wheel_is_built_from_driver_source(self):
+        manifest = json.loads(Path("vendor/manifest.json").read_text())
+        driver_name = next(
+            row["filename"]
+            for row in manifest["artifacts"]
+            if row["filename"].startswith("ite8291r3_ctl-")
+        )
+        source = Path("driver/src/ite8291r3_ctl")
+        with zipfile.ZipFile(Path("vendor") / driver_name) as archive:
+            bundled = {
+                name: archive.read(name)
+                for name in archive.namelist()
+                if name.startswith("ite8291r3_ctl/")
+            }
+        self.assertEqual(
+            sorted(bundled),
+            sorted(f"ite8291r3_ctl/{path.name}" for path in source.glob("*.py")),
+        )
+        for name, content in bundled.items():
+            with self.subTest(name=name):
+                self.assertEqual(content, (source.parent / name).read_bytes())
+
     def test_source_declares_600b_revision_0003(self):
         script = r'''
 import sys, types
@@ -96,7 +118,7 @@ assert not any(name.startswith("PySide6") for name in sys.modules)
                 capture_output=True,
                 text=True,
             ).stdout
-            self.assertIn("0.4.post1", output)
+            self.assertIn("0.4.post2", output)
             subprocess.run(
                 [
                     python,
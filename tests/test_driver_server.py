@@ -0,0 +1,292 @@
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import bootstrap
+
+from ite8291r3_ctl import __main__ as cli
+from ite8291r3_ctl import emulator, server
+from xmg_backlight import cancellation, driver
+
+
+class RecordingHandle:
+    def __init__(self):
+        self.calls = []
+
+    def turn_off(self):
+        self.calls.append(("off",))
+
+    def set_brightness(self, brightness):
+        self.calls.append(("brightness", brightness))
+
+    def refresh(self):
+        pass
+
+    def get_brightness(self):
+        return 33
+
+    def is_off(self):
+        return False
+
+    def release(self):
+        self.calls.append(("release",))
+
+
+class DriverServerTests(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.temp.name) / "driver.sock")
+        self.handle = RecordingHandle()
+        self.opened = 0
+
+        def get(*_args):
+            self.opened += 1
+            return self.handle
+
+        patcher = mock.patch.object(cli.ite8291r3, "get", side_effect=get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.executor = cli.RequestExecutor(cli.build_parser())
+        self.thread = threading.Thread(
+            target=server.serve_socket,
+            args=(self.executor, self.path, 0.5),
+            daemon=True,
+        )
+        self.thread.start()
+        deadline = time.monotonic() + 5
+        while not os.path.exists(self.path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.thread.join(5)
+        self.temp.cleanup()
+
+    def test_commands_share_one_handle_and_release_the_interface(self):
+        self.assertEqual(
+            driver._request_server(["brightness", "20"], timeout=2, path=self.path),
+            (0, "", ""),
+        )
+        self.assertEqual(
+            driver._request_server(
+                ["query", "--brightness", "--state"], timeout=2, path=self.path
+            ),
+            (0, "33\non", ""),
+        )
+        self.assertEqual(self.opened, 1)
+        self.assertEqual(
+            self.handle.calls,
+            [("brightness", 20), ("release",), ("release",)],
+        )
+
+    def test_validation_errors_match_the_cli(self):
+        rc, _, error = driver._request_server(
+            ["brightness", "51"], timeout=2, path=self.path
+        )
+        self.assertEqual(rc, 2)
+        self.assertIn("between 0 and 50", error)
+
+    def test_blocking_subcommands_are_refused(self):
+        rc, _, error = driver._request_server(["anim"], timeout=2, path=self.path)
+        self.assertEqual(rc, 2)
+        self.assertIn("cannot be requested", error)
+
+    def test_usb_error_reopens_the_device_on_next_request(self):
+        with mock.patch.object(
+            self.handle, "turn_off", side_effect=OSError("No such device")
+        ):
+            rc, _, error = driver._request_server(["off"], timeout=2, path=self.path)
+        self.assertEqual(rc, 1)
+        self.assertIn("No such device", error)
+        driver._request_server(["off"], timeout=2, path=self.path)
+        self.assertEqual(self.opened, 2)
+
+    def test_batch_holds_the_claim_and_stops_at_first_failure(self):
+        results = driver._request_server_batch(
+            [["off"], ["brightness", "99"], ["brightness", "10"]],
+            delay=0,
+            timeout=2,
+            path=self.path,
+        )
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0], (0, "", ""))
+        self.assertEqual(results[1][0], 2)
+        self.assertEqual(self.handle.calls, [("off",), ("release",)])
+
+    def test_cancelled_batch_closes_the_connection_and_stops_the_server(self):
+        token = cancellation.CancelToken()
+        threading.Timer(0.2, token.cancel).start()
+        started = time.monotonic()
+        with cancellation.activate(token):
+            results = driver._request_server_batch(
+                [["off"], ["brightness", "10"], ["brightness", "20"]],
+                delay=2,
+                timeout=10,
+                path=self.path,
+            )
+        self.assertEqual(results, [driver._cancelled_result()])
+        self.assertLess(time.monotonic() - started, 1)
+        self.thread.join(5)
+        self.assertEqual(self.handle.calls, [("off",), ("release",)])
+
+    def test_socket_is_private_and_removed_on_exit(self):
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        self.thread.join(5)
+        self.assertFalse(os.path.exists(self.path))
+
+
+class BatchCommandTests(unittest.TestCase):
+    def test_newline_and_json_command_lists_are_equivalent(self):
+        text = "# profile\noff\nbrightness 30\n\n"
+        self.assertEqual(
+            cli.read_batch(io.StringIO(text)),
+            cli.read_batch(io.StringIO('[["off"], ["brightness", "30"]]')),
+        )
+
+    def test_malformed_command_list_is_rejected(self):
+        with self.assertRaises(ValueError):
+            cli.read_batch(io.StringIO('[["off"], []]'))
+
+    def test_batch_reports_one_result_per_executed_command(self):
+        handle = RecordingHandle()
+        args = cli.build_parser().parse_args(["batch", "--delay", "0"])
+        args.file = io.StringIO("off\nquery --brightness\nbrightness 70\noff\n")
+        stdout = io.StringIO()
+        with mock.patch.object(
+            cli.ite8291r3, "get", return_value=handle
+        ) as get, mock.patch("sys.stdout", stdout):
+            rc = cli.handle_batch_args(args, None)
+        results = driver._parse_batch_output(stdout.getvalue())
+        self.assertEqual(rc, 2)
+        self.assertEqual(results[:2], [(0, "", ""), (0, "33", "")])
+        self.assertEqual(results[2][0], 2)
+        self.assertEqual(len(results), 3)
+        get.assert_called_once()
+        self.assertEqual(handle.calls, [("off",), ("release",)])
+
+
+class DriverFallbackTests(unittest.TestCase):
+    def test_missing_server_falls_back_to_cli(self):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(
+            driver, "DRIVER_SOCKET_PATH", str(Path(tmp) / "driver.sock")
+        ), mock.patch.object(
+            driver, "_run_unlocked", return_value=(0, "40\non", "")
+        ) as run:
+            result = driver._execute_unlocked("/tool", ["query"], timeout=1)
+        self.assertEqual(result, (0, "40\non", ""))
+        run.assert_called_once_with("/tool", ["query"], timeout=1)
+
+
+WORKER_CLI = """#!{python}
+import sys
+sys.path[:0] = {paths!r}
+{body}
+"""
+
+
+class WorkerTransportTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        patcher = mock.patch.dict(
+            os.environ,
+            {
+                emulator.ENV_ENABLE: "1",
+                emulator.ENV_STATE: str(self.tmp / "controller.json"),
+            },
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.worker = driver.WorkerTransport()
+        self.addCleanup(self.worker.stop)
+
+    def tool(self, body="from ite8291r3_ctl.__main__ import main\nsys.exit(main())"):
+        path = self.tmp / "ite8291r3-ctl"
+        path.write_text(
+            WORKER_CLI.format(
+                python=sys.executable,
+                paths=[str(bootstrap.DRIVER_SOURCE), str(bootstrap.PYUSB_WHEEL)],
+                body=body,
+            ),
+            encoding="utf-8",
+        )
+        path.chmod(0o700)
+        return str(path)
+
+    def test_warm_worker_serves_commands_and_sequences(self):
+        tool = self.tool()
+        self.assertTrue(self.worker.start(tool))
+        pid = self.worker.process.pid
+        self.assertEqual(
+            self.worker.execute(tool, ["brightness", "12"], timeout=30), (0, "", "")
+        )
+        results = self.worker.execute_sequence(
+            tool, [["off"], ["query", "--state"]], delay=0, timeout=30
+        )
+        self.assertEqual(results, [(0, "", ""), (0, "off", "")])
+        self.assertEqual(self.worker.process.pid, pid)
+
+    def test_short_pipe_writes_still_send_the_whole_frame(self):
+        tool = self.tool()
+        self.worker.start(tool)
+        write = os.write
+
+        def short_write(descriptor, data):
+            return write(descriptor, bytes(data[:3]))
+
+        with mock.patch.object(driver.os, "write", side_effect=short_write) as patched:
+            results = self.worker.execute_sequence(
+                tool, [["brightness", "7"], ["query", "--brightness"]], delay=0, timeout=30
+            )
+        self.assertEqual(results, [(0, "", ""), (0, "7", "")])
+        self.assertGreater(patched.call_count, 10)
+
+    def test_cancelled_batch_kills_the_worker_and_the_next_request_respawns_it(self):
+        tool = self.tool()
+        self.worker.start(tool)
+        cancelled = self.worker.process
+        token = cancellation.CancelToken()
+        threading.Timer(0.3, token.cancel).start()
+        with cancellation.activate(token):
+            results = self.worker.execute_sequence(
+                tool, [["off"], ["brightness", "10"]], delay=5, timeout=30
+            )
+        self.assertEqual(results, [driver._cancelled_result()])
+        self.assertIsNotNone(cancelled.poll())
+        self.assertEqual(
+            self.worker.execute(tool, ["brightness", "9"], timeout=30), (0, "", "")
+        )
+        self.assertNotEqual(self.worker.process.pid, cancelled.pid)
+
+    def test_crashed_worker_is_replaced_transparently(self):
+        tool = self.tool()
+        self.worker.start(tool)
+        crashed = self.worker.process
+        crashed.kill()
+        crashed.wait()
+        self.assertEqual(
+            self.worker.execute(tool, ["brightness", "9"], timeout=30), (0, "", "")
+        )
+        self.assertNotEqual(self.worker.process.pid, crashed.pid)
+
+    def test_driver_without_stdio_mode_is_not_asked_again(self):
+        tool = self.tool("sys.exit(2)")
+        self.assertIsNone(self.worker.execute(tool, ["off"], timeout=5))
+        self.assertTrue(self.worker.unsupported)
+        self.assertFalse(self.worker.start(tool))
+
+    def test_stuck_worker_times_out_and_is_killed(self):
+        tool = self.tool("import time\ntime.sleep(60)")
+        self.worker.start(tool)
+        stuck = self.worker.process
+        rc, _, error = self.worker.execute(tool, ["off"], timeout=0.2)
+        self.assertEqual(rc, 124)
+        self.assertIn("timed out", error)
+        self.assertIsNotNone(stuck.poll())
+        self.assertIsNone(self.worker.process)
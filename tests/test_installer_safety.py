@@ -30,12 +30,13 @@ from installer_lib.udev import (
     rule_grants_world_write,
 )
 import install as installer
+from xmg_backlight import constants
 
 
 class ArtifactManifestTests(unittest.TestCase):
     def test_repository_manifest_and_wheels_validate(self):
         manifest = load_and_validate_manifest(Path("vendor/manifest.json"))
-        self.assertEqual(manifest.driver_version, "0.4.post1")
+        self.assertEqual(manifest.driver_version, "0.4.post2")
         self.assertEqual(len(manifest.artifacts), 2)
 
     def test_tampered_artifact_is_rejected(self):
@@ -221,6 +222,20 @@ class UninstallPreflightTests(unittest.TestCase):
             self.assertTrue(manifest_path.exists())
 
 
+class DriverServiceTests(unittest.TestCase):
+    def test_unit_serves_the_socket_the_clients_connect_to(self):
+        unit = installer._driver_service_contents()
+        socket_path = os.path.relpath(
+            constants.DRIVER_SOCKET_PATH, os.path.expanduser("~")
+        )
+        self.assertEqual(installer.DRIVER_SERVICE_NAME, constants.DRIVER_SERVICE_NAME)
+        self.assertIn(
+            f"ExecStart={installer.DRIVER_WRAPPER_PATH} serve --socket %h/{socket_path}\n",
+            unit,
+        )
+        self.assertNotIn("[Install]", unit)
+
+
 class LegacyAdoptionTests(unittest.TestCase):
     def test_legacy_wrapper_must_match_exact_managed_contents(self):
         content = "# unrelated\n# xmg-backlight-venv -m xmg_backlight.app\n"
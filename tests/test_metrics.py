@@ -0,0 +1,62 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import bootstrap  # noqa: F401
+
+from xmg_backlight import metrics
+
+
+class LatencyHistogramTests(unittest.TestCase):
+    def test_samples_fall_into_fixed_buckets(self):
+        histogram = metrics.LatencyHistogram()
+        for milliseconds in (0.05, 0.3, 0.3, 4, 40, 20000):
+            histogram.add(milliseconds / 1000)
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 6)
+        self.assertEqual(
+            summary["buckets"],
+            {"<=0.1ms": 1, "<=0.5ms": 2, "<=5ms": 1, "<=50ms": 1, "slower": 1},
+        )
+        self.assertEqual(summary["p50_ms"], 0.5)
+        self.assertAlmostEqual(summary["p95_ms"], 20000)
+        self.assertEqual(len(histogram.counts), len(metrics.BUCKET_BOUNDS_MS) + 1)
+
+
+class MetricsRegistryTests(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_collect_adds_up_the_phases_of_this_thread(self):
+        with metrics.collect() as outer:
+            metrics.record("lock.wait", 0.002)
+            with metrics.collect() as inner:
+                metrics.record("driver.process", 0.1)
+                metrics.record("driver.process", 0.05)
+        self.assertEqual(list(inner), ["driver.process"])
+        self.assertAlmostEqual(inner["driver.process"], 0.15)
+        self.assertEqual(set(outer), {"lock.wait", "driver.process"})
+        self.assertEqual(
+            metrics.format_phases(inner | {"lock.wait": 0.002}),
+            "driver.process 150.0 ms, lock.wait 2.0 ms",
+        )
+        self.assertEqual(metrics.snapshot()["driver.process"]["count"], 2)
+
+    def test_number_of_phases_is_bounded(self):
+        for index in range(metrics.MAX_PHASES + 10):
+            metrics.record(f"phase.{index}", 0.001)
+        self.assertEqual(len(metrics.snapshot()), metrics.MAX_PHASES)
+
+    def test_environment_variable_dumps_the_histograms(self):
+        metrics.record("apply_profile", 0.25)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.json")
+            with mock.patch.dict(os.environ, {metrics.METRICS_ENV: path}):
+                metrics._dump_from_environment()
+            with open(path, encoding="utf-8") as handle:
+                dumped = json.load(handle)
+        self.assertEqual(dumped["apply_profile"]["count"], 1)
+        self.assertEqual(dumped["apply_profile"]["max_ms"], 250.0)
@@ -3,26 +3,77 @@ from unittest import mock
 
 import bootstrap  # noqa: F401
 
-from xmg_backlight import restore_profile
+from xmg_backlight import driver, restore_profile
 
 
 class RestoreTests(unittest.TestCase):
-    @mock.patch("xmg_backlight.restore_profile.run_cmd")
+    def setUp(self):
+        patcher = mock.patch.dict(driver._unsupported_features, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @mock.patch("xmg_backlight.restore_profile.run_sequence")
-    def test_zero_brightness_off_is_verified_as_success(self, sequence, command):
-        sequence.return_value = (0, "", "", None)
-        command.return_value = (0, "0\noff", "")
+    def test_zero_brightness_off_is_verified_as_success(self, sequence):
+        sequence.return_value = (0, "0\noff", "", None)
         success, message = restore_profile.apply_profile({"brightness": 0})
         self.assertTrue(success)
         self.assertIn("verified", message)
-        sequence.assert_called_once_with([["off"]])
+        sequence.assert_called_once_with([["off"], ["query", "--json"]])
 
-    @mock.patch("xmg_backlight.restore_profile.run_cmd")
     @mock.patch("xmg_backlight.restore_profile.run_sequence")
-    def test_verification_mismatch_fails_without_retry(self, sequence, command):
-        sequence.return_value = (0, "", "", None)
-        command.return_value = (0, "20\non", "")
+    def test_verification_mismatch_fails_without_retry(self, sequence):
+        sequence.return_value = (0, "20\non", "", None)
         success, message = restore_profile.apply_profile({"brightness": 40})
         self.assertFalse(success)
         self.assertIn("mismatch", message)
         self.assertEqual(sequence.call_count, 1)
+
+    @mock.patch("xmg_backlight.restore_profile.run_sequence")
+    def test_failed_trailing_query_is_a_verification_failure(self, sequence):
+        sequence.return_value = (1, "", "failed to carry out operation", 3)
+        success, message = restore_profile.apply_profile({"brightness": 40})
+        self.assertFalse(success)
+        self.assertIn("State verification failed", message)
+
+    @mock.patch("xmg_backlight.restore_profile.run_sequence")
+    def test_failed_write_names_the_command(self, sequence):
+        sequence.return_value = (1, "", "failed to carry out operation", 1)
+        success, message = restore_profile.apply_profile({"brightness": 40})
+        self.assertFalse(success)
+        self.assertIn("Command monocolor", message)
+
+    @mock.patch("xmg_backlight.restore_profile.run_sequence")
+    def test_effect_tuple_is_verified_from_json_state(self, sequence):
+        profile = {"brightness": 30, "mode": "wave", "speed": 7, "direction": "left"}
+        state = '{"brightness": 30, "color": 0, "direction_or_reactive": %d, "effect": 3, "power": "on", "speed": 7}'
+        sequence.return_value = (0, state % 2, "", None)
+        self.assertTrue(restore_profile.apply_profile(profile)[0])
+        sequence.return_value = (0, state % 1, "", None)
+        success, message = restore_profile.apply_profile(profile)
+        self.assertFalse(success)
+        self.assertIn("direction_or_reactive=2", message)
+
+    @mock.patch("xmg_backlight.driver.resolve_tool", return_value="/tool")
+    @mock.patch("xmg_backlight.restore_profile.run_cmd")
+    @mock.patch("xmg_backlight.restore_profile.run_sequence")
+    def test_driver_without_json_query_is_verified_with_text_query(
+        self, sequence, run, _resolve
+    ):
+        sequence.return_value = (
+            2,
+            "",
+            "ite8291r3-ctl: error: unrecognized arguments: --json",
+            3,
+        )
+        run.return_value = (0, "40\non", "")
+        success, _ = restore_profile.apply_profile({"brightness": 40})
+        self.assertTrue(success)
+        run.assert_called_once_with(["query", "--brightness", "--state"])
+
+        # the rejection is remembered; the next apply verifies in one request
+        sequence.reset_mock()
+        run.reset_mock()
+        sequence.return_value = (0, "40\non", "", None)
+        self.assertTrue(restore_profile.apply_profile({"brightness": 40})[0])
+        self.assertEqual(sequence.call_args.args[0][-1], ["query", "--brightness", "--state"])
+        run.assert_not_called()
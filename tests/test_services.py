@@ -66,3 +66,23 @@ class ServiceTests(unittest.TestCase):
             enabled, detail = services.automation_service_status()
         self.assertFalse(enabled)
         self.assertEqual(detail, "Failed to connect to bus")
+
+    def test_driver_service_start_does_not_wait_for_the_server(self):
+        with mock.patch.object(
+            services, "systemctl_user", return_value=(0, "", "")
+        ) as systemctl:
+            started, _ = services.start_driver_service()
+        self.assertTrue(started)
+        systemctl.assert_called_once_with(
+            ["start", "--no-block", services.DRIVER_SERVICE_NAME]
+        )
+
+    def test_missing_driver_unit_is_reported(self):
+        with mock.patch.object(
+            services,
+            "systemctl_user",
+            return_value=(5, "", "Unit xmg-backlight-driver.service not found."),
+        ):
+            started, detail = services.start_driver_service()
+        self.assertFalse(started)
+        self.assertIn("not found", detail)
@@ -0,0 +1,104 @@
+import importlib.util
+import os
+import signal
+import time
+import unittest
+
+import bootstrap  # noqa: F401
+
+HAS_QT = importlib.util.find_spec("PySide6") is not None
+
+
+@unittest.skipUnless(HAS_QT, "PySide6 is not installed")
+class SignalNotifierTests(unittest.TestCase):
+    def setUp(self):
+        from PySide6 import QtCore
+
+        from xmg_backlight.signal_notifier import SignalNotifier
+
+        self.QtCore = QtCore
+        self.app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+        self.notifier = SignalNotifier((signal.SIGTERM,))
+        self.addCleanup(self.notifier.close)
+
+    def run_loop(self, milliseconds):
+        loop = self.QtCore.QEventLoop()
+        self.QtCore.QTimer.singleShot(milliseconds, loop.quit)
+        loop.exec()
+
+    def test_sigterm_is_delivered_to_the_event_loop(self):
+        received = []
+        self.notifier.received.connect(received.append)
+        os.kill(os.getpid(), signal.SIGTERM)
+        self.run_loop(200)
+        self.assertEqual(received, [signal.SIGTERM])
+
+
+@unittest.skipUnless(HAS_QT, "PySide6 is not installed")
+class AppSignalHandlerTests(unittest.TestCase):
+    IDLE_MS = 1000
+
+    def setUp(self):
+        from PySide6 import QtCore
+
+        from xmg_backlight import app as gui
+
+        self.QtCore = QtCore
+        self.app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+        self.terminated = []
+
+        def on_terminate():
+            self.terminated.append(time.monotonic())
+            self.app.quit()
+
+        self.termination = gui.install_signal_handlers(self.app, on_terminate)
+        self.addCleanup(self.termination.close)
+
+    def run_loop(self, milliseconds):
+        loop = self.QtCore.QEventLoop()
+        self.QtCore.QTimer.singleShot(milliseconds, loop.quit)
+        loop.exec()
+
+    def test_idle_loop_has_no_periodic_timer_wakeups(self):
+        QtCore = self.QtCore
+        timer_events = []
+
+        class TimerCounter(QtCore.QObject):
+            def eventFilter(self, watched, event):
+                if event.type() == QtCore.QEvent.Timer:
+                    timer_events.append(watched)
+                return False
+
+        counter = TimerCounter()
+        self.app.installEventFilter(counter)
+        self.addCleanup(self.app.removeEventFilter, counter)
+        self.run_loop(self.IDLE_MS)
+        # Only the single shot that ends the idle interval fires.
+        self.assertLessEqual(len(timer_events), 1)
+
+    def test_no_repeating_timer_is_installed(self):
+        repeating = [
+            timer
+            for timer in self.app.findChildren(self.QtCore.QTimer)
+            if timer.isActive() and not timer.isSingleShot()
+        ]
+        self.assertEqual(repeating, [])
+        self.assertNotIn(
+            signal.getsignal(signal.SIGTERM), (signal.SIG_DFL, signal.SIG_IGN)
+        )
+
+    def test_sigterm_quits_the_application_through_the_notifier(self):
+        received = []
+        self.termination.received.connect(received.append)
+        # a safety net; the signal must end the loop long before it fires
+        guard = self.QtCore.QTimer()
+        guard.setSingleShot(True)
+        guard.timeout.connect(self.app.quit)
+        guard.start(5000)
+        self.QtCore.QTimer.singleShot(100, lambda: os.kill(os.getpid(), signal.SIGTERM))
+        started = time.monotonic()
+        self.app.exec()
+        guard.stop()
+        self.assertEqual(received, [signal.SIGTERM])
+        self.assertEqual(len(self.terminated), 1)
+        self.assertLess(self.terminated[0] - started, 2)
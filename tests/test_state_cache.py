@@ -0,0 +1,149 @@
+import importlib.util
+import unittest
+from unittest import mock
+
+import bootstrap  # noqa: F401
+
+from xmg_backlight.commands import (
+    KeyboardState,
+    build_profile_commands,
+    expected_keyboard_state,
+    plan_profile_commands,
+)
+from xmg_backlight.state_cache import ControllerStateCache
+
+
+HAS_QT = importlib.util.find_spec("PySide6") is not None
+
+PROFILE = {
+    "brightness": 20,
+    "mode": "breathing",
+    "static_color": "white",
+    "speed": 5,
+    "color": "red",
+    "direction": "none",
+    "reactive": False,
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class ControllerStateCacheTests(unittest.TestCase):
+    def test_state_is_fresh_until_the_ttl_expires(self):
+        clock = FakeClock()
+        cache = ControllerStateCache(ttl=5, clock=clock)
+        self.assertIsNone(cache.fresh())
+        state = KeyboardState(brightness=30, power="on")
+        cache.update(state)
+        clock.now += 4.9
+        self.assertEqual(cache.fresh(), state)
+        clock.now += 0.1
+        self.assertIsNone(cache.fresh())
+
+    def test_a_stale_state_plans_the_full_sequence(self):
+        clock = FakeClock()
+        cache = ControllerStateCache(ttl=5, clock=clock)
+        profile = {
+            "brightness": 20,
+            "mode": "breathing",
+            "static_color": "white",
+            "speed": 5,
+            "color": "red",
+            "direction": "none",
+            "reactive": False,
+        }
+        cache.update(expected_keyboard_state({**profile, "brightness": 40}))
+        self.assertEqual(
+            plan_profile_commands(profile, cache.fresh()), [["brightness", "20"]]
+        )
+        # Another process may have changed the controller in the meantime.
+        clock.now += 5
+        self.assertEqual(
+            plan_profile_commands(profile, cache.fresh()),
+            build_profile_commands(profile),
+        )
+
+    def test_a_write_refreshes_and_an_unknown_result_invalidates(self):
+        clock = FakeClock()
+        cache = ControllerStateCache(ttl=5, clock=clock)
+        cache.update(KeyboardState(brightness=30, power="on"))
+        clock.now += 10
+        cache.update(KeyboardState(brightness=None, power="off"))
+        self.assertEqual(cache.fresh().power, "off")
+        cache.update(None)
+        self.assertIsNone(cache.fresh())
+
+
+
+@unittest.skipUnless(HAS_QT, "PySide6 is not installed")
+class PlannedApplyTests(unittest.TestCase):
+    def make_window(self, cache, device_state):
+        from xmg_backlight.effects_mixin import EffectsMixin
+
+        class Window(EffectsMixin):
+            profile = dict(PROFILE)
+            queries = 0
+
+            @property
+            def known_state(self):
+                return cache.fresh()
+
+            @known_state.setter
+            def known_state(self, state):
+                cache.update(state)
+
+            def query_device_state(self):
+                Window.queries += 1
+                self.known_state = device_state
+                return 0, "", ""
+
+            def capture_profile_state(self):
+                return self.profile
+
+            def run_hardware_task(self, task, done, **_options):
+                done(task())
+
+            def log(self, *_args, **_kwargs):
+                pass
+
+            def log_latency(self, _phases):
+                pass
+
+        return Window()
+
+    def apply(self, window):
+        completed = []
+        with mock.patch(
+            "xmg_backlight.effects_mixin.run_sequence",
+            return_value=(0, "", "", None),
+        ) as sequence:
+            window.apply_planned_then(completed.append)
+        self.assertEqual(completed, [(0, "", "", None)])
+        return sequence
+
+    def test_a_stale_state_is_queried_before_planning(self):
+        clock = FakeClock()
+        cache = ControllerStateCache(ttl=5, clock=clock)
+        window = self.make_window(
+            cache, expected_keyboard_state({**PROFILE, "brightness": 40})
+        )
+        sequence = self.apply(window)
+        sequence.assert_called_once_with([["brightness", "20"]])
+        self.assertEqual(window.queries, 1)
+        # the write refreshed the cache, so the next apply is not preceded by a query
+        window.profile = {**PROFILE, "brightness": 25}
+        sequence = self.apply(window)
+        sequence.assert_called_once_with([["brightness", "25"]])
+        self.assertEqual(window.queries, 1)
+
+    def test_an_unreadable_state_sends_the_full_sequence(self):
+        cache = ControllerStateCache(ttl=5, clock=FakeClock())
+        window = self.make_window(cache, None)
+        sequence = self.apply(window)
+        sequence.assert_called_once_with(build_profile_commands(PROFILE))
@@ -1,14 +1,16 @@
+import bisect
 import json
 import os
 import stat
 import tempfile
+import threading
 import unittest
 from pathlib import Path
 from unittest import mock
 
 import bootstrap  # noqa: F401
 
-from xmg_backlight import storage
+from xmg_backlight import metrics, storage
 
 
 class StorageTests(unittest.TestCase):
@@ -118,9 +120,181 @@ class StorageTests(unittest.TestCase):
         )
         self.assertIn("Travel", persisted_store["profiles"])
         self.assertEqual(persisted_settings["ac_profile"], "Travel")
+        journal = Path(storage.state_journal_path()).read_bytes().splitlines()
+        patch = json.loads(journal[-1].split(b" ", 1)[1])["patch"]
+        self.assertIn("Travel", patch["profile_store"]["profiles"])
+        self.assertEqual(patch["settings"]["ac_profile"], "Travel")
+
+    def test_profile_operations_conflict_only_on_the_profile_they_touch(self):
+        storage.upsert_profile("Travel", storage.DEFAULT_PROFILE_STATE, expected_revision=0)
+        storage.upsert_profile("Desk", storage.DEFAULT_PROFILE_STATE, expected_revision=0)
+        seen = storage.load_profile_store()
+        storage.upsert_profile(
+            "Desk",
+            {**storage.DEFAULT_PROFILE_STATE, "brightness": 5},
+            expected_revision=seen["revisions"]["Desk"],
+        )
+        revision = storage.upsert_profile(
+            "Travel",
+            {**storage.DEFAULT_PROFILE_STATE, "brightness": 20},
+            expected_revision=seen["revisions"]["Travel"],
+        )
+        with self.assertRaises(storage.ProfileConflictError):
+            storage.upsert_profile(
+                "Desk", storage.DEFAULT_PROFILE_STATE, expected_revision=seen["revisions"]["Desk"]
+            )
+        loaded = storage.load_profile_store()
+        self.assertEqual(loaded["revision"], revision)
+        self.assertEqual(loaded["profiles"]["Desk"]["brightness"], 5)
+        self.assertEqual(loaded["profiles"]["Travel"]["brightness"], 20)
+
+    def test_rename_and_delete_carry_revisions_and_power_references(self):
+        storage.upsert_profile("Travel", storage.DEFAULT_PROFILE_STATE, activate=True)
+        storage.update_settings({"battery_profile": "Travel"})
+        storage.rename_profile("Travel", "Trip", expected_revision=1)
+        store = storage.load_profile_store()
+        self.assertEqual(store["active"], "Trip")
+        self.assertEqual(store["revisions"]["Trip"], 2)
+        self.assertNotIn("Travel", store["revisions"])
+        self.assertEqual(storage.load_settings()["battery_profile"], "Trip")
+        with self.assertRaises(storage.ProfileConflictError):
+            storage.delete_profile("Trip", expected_revision=1)
+        storage.delete_profile("Trip", expected_revision=2)
+        self.assertNotIn("Trip", storage.load_profile_store()["profiles"])
+        self.assertEqual(storage.load_settings()["battery_profile"], "")
+
+    def test_unchanged_state_is_served_from_a_frozen_snapshot(self):
+        storage.write_settings_file({"start_in_tray": True})
+        with mock.patch.object(
+            storage, "_read_json_document", wraps=storage._read_json_document
+        ) as read:
+            first = storage.settings_snapshot()
+            second = storage.settings_snapshot()
+            self.assertTrue(storage.load_settings()["start_in_tray"])
+        self.assertIs(first, second)
+        read.assert_not_called()
+        with self.assertRaises(TypeError):
+            first["start_in_tray"] = False
+        store = storage.read_profile_file()
+        store["profiles"]["Scratch"] = dict(storage.DEFAULT_PROFILE_STATE)
+        self.assertNotIn("Scratch", storage.profile_store_snapshot()["profiles"])
+
+    def test_snapshot_follows_a_replace_by_another_process(self):
+        storage.load_settings()
+        path = Path(self.paths["STATE_PATH"])
+        raw = json.loads(path.read_text(encoding="utf-8"))
+        raw["settings"]["ac_profile"] = "Elsewhere"
+        replacement = path.with_name("replacement.json")
+        replacement.write_text(json.dumps(raw), encoding="utf-8")
+        os.replace(replacement, path)
+        self.assertEqual(storage.settings_snapshot()["ac_profile"], "Elsewhere")
+
+    def test_steady_state_reads_take_no_lock(self):
+        storage.write_settings_file({"dark_mode": False})
+        with mock.patch.object(storage, "_cached_state", return_value=None):
+            with mock.patch.object(storage, "_document_lock") as lock:
+                with mock.patch.object(storage, "ensure_app_state") as ensure:
+                    self.assertFalse(storage.load_settings()["dark_mode"])
+        lock.assert_not_called()
+        ensure.assert_not_called()
+
+    def _journaled_history(self):
+        storage.ensure_app_state()
+        history = [(storage.load_settings(), storage.load_profile_store())]
+        for change in (
+            lambda: storage.upsert_profile("Travel", storage.DEFAULT_PROFILE_STATE),
+            lambda: storage.update_settings({"ac_profile": "Travel", "dark_mode": False}),
+            lambda: storage.set_active("Travel"),
+            lambda: storage.rename_profile("Travel", "Trip"),
+            lambda: storage.delete_profile("Default"),
+        ):
+            change()
+            history.append((storage.load_settings(), storage.load_profile_store()))
+        return history
+
+    def test_writes_append_one_fsynced_record_to_the_journal(self):
+        storage.ensure_app_state()
+        snapshot = Path(self.paths["STATE_PATH"]).read_bytes()
+        with mock.patch.object(storage.os, "fsync", wraps=os.fsync) as fsync:
+            storage.upsert_profile("Travel", storage.DEFAULT_PROFILE_STATE)
+        self.assertEqual(fsync.call_count, 1)
+        self.assertEqual(Path(self.paths["STATE_PATH"]).read_bytes(), snapshot)
+        self.assertEqual(len(Path(storage.state_journal_path()).read_bytes().splitlines()), 1)
+
+    def test_replay_survives_a_journal_cut_at_every_byte(self):
+        history = self._journaled_history()
+        path = Path(storage.state_journal_path())
+        journal = path.read_bytes()
+        ends = [index + 1 for index, byte in enumerate(journal) if byte == ord("\n")]
+        self.assertEqual(len(ends), len(history) - 1)
+        for offset in range(len(journal) + 1):
+            with self.subTest(offset=offset):
+                path.write_bytes(journal[:offset])
+                settings, store = history[bisect.bisect_right(ends, offset)]
+                with mock.patch.object(storage, "_state_snapshot", None):
+                    self.assertEqual(storage.load_settings(), settings)
+                    self.assertEqual(storage.load_profile_store(), store)
+                    storage.update_settings({"show_notifications": False})
+                with mock.patch.object(storage, "_state_snapshot", None):
+                    self.assertEqual(
+                        storage.load_settings(), {**settings, "show_notifications": False}
+                    )
+                    self.assertEqual(storage.load_profile_store(), store)
+
+    def test_full_journal_is_folded_into_a_new_snapshot(self):
+        with mock.patch.object(storage, "JOURNAL_COMPACT_BYTES", 600):
+            history = self._journaled_history()
+        journal = Path(storage.state_journal_path()).stat().st_size
+        self.assertLess(journal, 600)
         raw = json.loads(Path(self.paths["STATE_PATH"]).read_text(encoding="utf-8"))
-        self.assertIn("Travel", raw["profile_store"]["profiles"])
-        self.assertEqual(raw["settings"]["ac_profile"], "Travel")
+        self.assertIn("Trip", raw["profile_store"]["profiles"])
+        with mock.patch.object(storage, "_state_snapshot", None):
+            self.assertEqual(storage.load_settings(), history[-1][0])
+            self.assertEqual(storage.load_profile_store(), history[-1][1])
+
+    def test_records_of_a_folded_journal_are_not_replayed_again(self):
+        history = self._journaled_history()
+        path = Path(storage.state_journal_path())
+        folded = path.read_bytes()
+        with mock.patch.object(storage, "JOURNAL_COMPACT_BYTES", 0):
+            storage.update_settings({"language": "de"})
+        self.assertEqual(path.read_bytes(), b"")
+        # a crash between replacing state.json and truncating the journal
+        path.write_bytes(folded)
+        with mock.patch.object(storage, "_state_snapshot", None):
+            self.assertEqual(storage.load_settings(), {**history[-1][0], "language": "de"})
+            storage.upsert_profile("Desk", storage.DEFAULT_PROFILE_STATE)
+        self.assertEqual(len(path.read_bytes().splitlines()), 1)
+
+    def test_grouped_durability_fsyncs_a_burst_of_writes_once(self):
+        self.addCleanup(storage.set_durability, "strict")
+        storage.ensure_app_state()
+        before = metrics.snapshot().get("storage.fsync", {}).get("count", 0)
+        with mock.patch.object(storage, "GROUP_COMMIT_SECONDS", 60):
+            storage.set_durability("grouped")
+            storage.upsert_profile("Travel", storage.DEFAULT_PROFILE_STATE)
+            storage.update_settings({"language": "it"})
+            storage.update_settings({"start_in_tray": True})
+        with mock.patch.object(storage, "_state_snapshot", None):
+            self.assertTrue(storage.load_settings()["start_in_tray"])
+        self.assertEqual(metrics.snapshot().get("storage.fsync", {}).get("count", 0), before)
+        storage.flush_pending_writes()
+        storage.flush_pending_writes()
+        self.assertEqual(metrics.snapshot()["storage.fsync"]["count"], before + 1)
+
+    def test_grouped_writes_are_flushed_when_the_window_ends(self):
+        self.addCleanup(storage.set_durability, "strict")
+        storage.ensure_app_state()
+        flushed = threading.Event()
+        with mock.patch.object(storage, "GROUP_COMMIT_SECONDS", 0.01):
+            with mock.patch.object(
+                storage.os, "fsync", side_effect=lambda _descriptor: flushed.set()
+            ):
+                storage.set_durability("grouped")
+                storage.update_settings({"dark_mode": False})
+                self.assertTrue(flushed.wait(5))
+        with self.assertRaises(ValueError):
+            storage.set_durability("never")
 
     def test_string_booleans_are_not_treated_as_true(self):
         settings = storage.sanitize_settings(